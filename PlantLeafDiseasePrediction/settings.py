@@ -44,6 +44,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Serve static files in production
+    'core.middleware.ServerTimingMiddleware',  # Server-Timing header + /metrics histograms
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -79,6 +80,14 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # The web process and the batch job worker (`run_job_worker`) write
+        # concurrently: WAL lets readers proceed during a write, and writers
+        # wait for the lock instead of failing with "database is locked"
+        'OPTIONS': {
+            'timeout': 20,
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': 'PRAGMA journal_mode=WAL;',
+        },
     }
 }
 
@@ -125,6 +134,164 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# ML inference settings
+# Model preload in CoreConfig.ready: 'auto' loads it when serving (WSGI/ASGI,
+# runserver) and skips it for other management commands (migrate,
+# collectstatic, ...), which then load it on first use. 'True'/'False' force it.
+PRELOAD_MODEL = os.environ.get('PRELOAD_MODEL', 'auto')
+
+# Model registry: every model in models/ can be picked per request (`model`
+# field: cnn_simple, efficientnetb0, default) and loads on first use. Once
+# resident models exceed MODEL_MEMORY_BUDGET_MB (0 = no limit), idle ones
+# other than the default are evicted least recently used first.
+MODEL_MEMORY_BUDGET_MB = int(os.environ.get('MODEL_MEMORY_BUDGET_MB', '0'))
+
+# Cascade ('cascade' model, or the default with PREDICT_CASCADE=True): every
+# image goes through PREDICT_CASCADE_PRIMARY; predictions with top-1
+# confidence < PREDICT_CASCADE_CONFIDENCE or top-1 minus top-2 <
+# PREDICT_CASCADE_MARGIN are escalated to PREDICT_CASCADE_SECONDARY. Unset
+# thresholds come from PREDICT_CASCADE_CONFIG (`python manage.py tune_cascade`),
+# else 0.8 / 0.0. Needs both models' files and the in-process backend; without
+# them a warning is logged at startup and the default model serves.
+PREDICT_CASCADE = os.environ.get('PREDICT_CASCADE', 'False') == 'True'
+PREDICT_CASCADE_PRIMARY = os.environ.get('PREDICT_CASCADE_PRIMARY', 'cnn_simple')
+PREDICT_CASCADE_SECONDARY = os.environ.get('PREDICT_CASCADE_SECONDARY', 'efficientnetb0')
+PREDICT_CASCADE_CONFIDENCE = float(os.environ['PREDICT_CASCADE_CONFIDENCE']) if os.environ.get('PREDICT_CASCADE_CONFIDENCE') else None
+PREDICT_CASCADE_MARGIN = float(os.environ['PREDICT_CASCADE_MARGIN']) if os.environ.get('PREDICT_CASCADE_MARGIN') else None
+PREDICT_CASCADE_CONFIG = os.environ.get('PREDICT_CASCADE_CONFIG') or str(BASE_DIR / 'models' / 'cascade_config.json')
+
+# Resolution speed tiers (`tier` field: fast, balanced, accurate): tier:size
+# pairs; a tier serves the model's variant at that input size (or the nearest
+# larger one) from `python manage.py export_resolution_variants`, 0 = native.
+PREDICT_RESOLUTION_TIERS = os.environ.get('PREDICT_RESOLUTION_TIERS', 'fast:128,balanced:160,accurate:0')
+
+# Per-stage latency timers (upload, decode, resize, normalize, inference,
+# serialize, ...): a Server-Timing header on every response and Prometheus
+# histograms at /metrics. About a microsecond per stage; False turns both off.
+PREDICT_STAGE_TIMING = os.environ.get('PREDICT_STAGE_TIMING', 'True') == 'True'
+
+# On-demand profiling: POST /api/profile/ (staff session, or
+# "Authorization: Bearer $PROFILING_TOKEN") or `python manage.py
+# profile_predictions` profiles the next N prediction requests of the process
+# that receives it into PROFILING_DIR. No token = staff only.
+PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN', '')
+PROFILING_DIR = os.environ.get('PROFILING_DIR') or str(BASE_DIR / 'profiles')
+PROFILING_MAX_REQUESTS = int(os.environ.get('PROFILING_MAX_REQUESTS', '100'))
+
+# Opt-in dynamic micro-batching: concurrent predictions are merged into one
+# forward pass of up to PREDICT_MAX_BATCH_SIZE images, waiting at most
+# PREDICT_MAX_WAIT_MS for the batch to fill. Only useful with --threads > 1.
+PREDICT_BATCHING = os.environ.get('PREDICT_BATCHING', 'False') == 'True'
+PREDICT_MAX_BATCH_SIZE = int(os.environ.get('PREDICT_MAX_BATCH_SIZE', '8'))
+PREDICT_MAX_WAIT_MS = float(os.environ.get('PREDICT_MAX_WAIT_MS', '5'))
+
+# Multi-image requests: images are decoded by PREDICT_DECODE_WORKERS threads
+# and run through the model PREDICT_BATCH_CHUNK_SIZE images at a time.
+PREDICT_BATCH_CHUNK_SIZE = int(os.environ.get('PREDICT_BATCH_CHUNK_SIZE', '32'))
+PREDICT_DECODE_WORKERS = int(os.environ['PREDICT_DECODE_WORKERS']) if os.environ.get('PREDICT_DECODE_WORKERS') else None
+
+# CPU thread topology: TensorFlow intra-op threads (also the TFLite / NumPy
+# BLAS thread count), inter-op threads and oneDNN kernels. Unset values come
+# from PREDICT_THREAD_CONFIG, written by `python manage.py tune_threads` for
+# this machine, and otherwise stay at the runtime defaults (PREDICT_DECODE_WORKERS
+# defaults to min(4, CPUs)).
+PREDICT_INTRA_OP_THREADS = int(os.environ['PREDICT_INTRA_OP_THREADS']) if os.environ.get('PREDICT_INTRA_OP_THREADS') else None
+PREDICT_INTER_OP_THREADS = int(os.environ['PREDICT_INTER_OP_THREADS']) if os.environ.get('PREDICT_INTER_OP_THREADS') else None
+PREDICT_ONEDNN = {'True': True, 'False': False}.get(os.environ.get('PREDICT_ONEDNN', ''))
+PREDICT_THREAD_CONFIG = os.environ.get('PREDICT_THREAD_CONFIG') or str(BASE_DIR / 'models' / 'thread_config.json')
+
+# Async endpoint (/api/predict/, for the ASGI app under uvicorn): decode and
+# inference run on PREDICT_ASYNC_WORKERS threads; once
+# PREDICT_ASYNC_MAX_PENDING predictions are queued, new ones get HTTP 503.
+PREDICT_ASYNC_WORKERS = int(os.environ.get('PREDICT_ASYNC_WORKERS', '2'))
+PREDICT_ASYNC_MAX_PENDING = int(os.environ.get('PREDICT_ASYNC_MAX_PENDING', '32'))
+
+# Inference backend: 'keras' serves the .keras/.h5 model directly; 'tflite'
+# serves models/<model>_<TFLITE_QUANTIZATION>.tflite (create it with
+# `python manage.py export_tflite`); 'numpy' serves models/<model>.npz through
+# the TensorFlow-free NumPy engine (`python manage.py export_numpy_model`);
+# 'serving' serves models/<model>_serving.keras, which takes raw uint8 images
+# and resizes/rescales in-graph (`python manage.py export_serving_model`).
+# Each falls back to Keras if its exported file is missing.
+INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND', 'keras')
+TFLITE_QUANTIZATION = os.environ.get('TFLITE_QUANTIZATION', 'float16')
+TFLITE_NUM_THREADS = int(os.environ['TFLITE_NUM_THREADS']) if os.environ.get('TFLITE_NUM_THREADS') else None
+# 'float16' keeps NumPy-engine weights at half precision in memory, upcasting
+# each layer on every prediction; by default (float32) a float16 .npz is
+# upcast once at load.
+NUMPY_WEIGHTS_DTYPE = os.environ.get('NUMPY_WEIGHTS_DTYPE') or None
+# Memory-map NumPy-engine weights read-only so Gunicorn workers (and any other
+# process serving the same .npz) share one copy through the page cache.
+NUMPY_MMAP_WEIGHTS = os.environ.get('NUMPY_MMAP_WEIGHTS', 'True') == 'True'
+
+# Inference daemon: with INFERENCE_SOCKET set, web workers do not load the
+# model; they send decoded images to `python manage.py run_inference_server`
+# over this Unix socket (image tensors go through a shared-memory ring of
+# INFERENCE_RING_SLOTS images per segment). Scale web workers independently
+# of model memory; enable PREDICT_BATCHING in the daemon to merge requests.
+INFERENCE_SOCKET = os.environ.get('INFERENCE_SOCKET') or None
+INFERENCE_RING_SLOTS = int(os.environ.get('INFERENCE_RING_SLOTS', '16'))
+
+# Decode large JPEGs at a reduced DCT scale (still >= the model input size)
+# before the final resize; much cheaper for multi-megapixel phone photos.
+PREDICT_JPEG_DRAFT = os.environ.get('PREDICT_JPEG_DRAFT', 'True') == 'True'
+
+# Fast inference: trace one fixed-shape graph per batch-size bucket at model
+# load time instead of going through keras.Model.predict on every request.
+PREDICT_FAST_INFERENCE = os.environ.get('PREDICT_FAST_INFERENCE', 'False') == 'True'
+PREDICT_BATCH_BUCKETS = [int(b) for b in os.environ.get('PREDICT_BATCH_BUCKETS', '1,4,8,16').split(',') if b.strip()]
+
+# Prediction cache keyed by image-content hash + model identity. The memory
+# tier is an LRU of PREDICT_CACHE_MAX_ENTRIES results living for
+# PREDICT_CACHE_TTL_SECONDS; PREDICT_CACHE_PERSISTENT=True also stores results
+# in the database so hits survive restarts (run `migrate` first). Off by
+# default like the other opt-in accelerations: it only pays off when the same
+# images are resubmitted.
+PREDICT_CACHE = os.environ.get('PREDICT_CACHE', 'False') == 'True'
+PREDICT_CACHE_MAX_ENTRIES = int(os.environ.get('PREDICT_CACHE_MAX_ENTRIES', '1024'))
+PREDICT_CACHE_TTL_SECONDS = int(os.environ.get('PREDICT_CACHE_TTL_SECONDS', '3600'))
+PREDICT_CACHE_PERSISTENT = os.environ.get('PREDICT_CACHE_PERSISTENT', 'False') == 'True'
+PREDICT_CACHE_PERSISTENT_TTL_SECONDS = int(os.environ.get('PREDICT_CACHE_PERSISTENT_TTL_SECONDS', '0'))
+
+# Near-duplicate layer: a 64-bit dHash of each image is matched against recent
+# predictions; a Hamming distance <= PREDICT_NEAR_DUPLICATE_MAX_DISTANCE reuses
+# the earlier result. Catches burst shots that exact hashing misses; used by
+# single-image and batch predictions alike.
+PREDICT_NEAR_DUPLICATE = os.environ.get('PREDICT_NEAR_DUPLICATE', 'False') == 'True'
+PREDICT_NEAR_DUPLICATE_MAX_DISTANCE = int(os.environ.get('PREDICT_NEAR_DUPLICATE_MAX_DISTANCE', '6'))
+PREDICT_NEAR_DUPLICATE_MAX_ENTRIES = int(os.environ.get('PREDICT_NEAR_DUPLICATE_MAX_ENTRIES', '4096'))
+
+# Uploads are decoded in memory and never written to disk. Set
+# PREDICT_RETAIN_UPLOADS=True to keep a copy under MEDIA_ROOT/uploads/ for
+# debugging (each saved with a unique name).
+PREDICT_RETAIN_UPLOADS = os.environ.get('PREDICT_RETAIN_UPLOADS', 'False') == 'True'
+
+# Uploaded images are checked while they stream in (core.upload_handlers):
+# the first bytes must be a PREDICT_UPLOAD_FORMATS image whose header declares
+# at most PREDICT_UPLOAD_MAX_PIXELS pixels within its first
+# PREDICT_UPLOAD_MAX_HEADER_MB (JPEG metadata before the frame header is held
+# in memory until then), and the file must stay under PREDICT_UPLOAD_MAX_MB.
+# Other files are dropped before the rest of their body is buffered or decoded.
+PREDICT_UPLOAD_FORMATS = [f.strip().upper() for f in os.environ.get('PREDICT_UPLOAD_FORMATS', 'JPEG,PNG,WEBP,BMP').split(',') if f.strip()]
+PREDICT_UPLOAD_MAX_PIXELS = int(os.environ.get('PREDICT_UPLOAD_MAX_PIXELS', '50000000'))
+PREDICT_UPLOAD_MAX_MB = float(os.environ.get('PREDICT_UPLOAD_MAX_MB', '20'))
+PREDICT_UPLOAD_MAX_HEADER_MB = float(os.environ.get('PREDICT_UPLOAD_MAX_HEADER_MB', '2'))
+FILE_UPLOAD_HANDLERS = [
+    'core.upload_handlers.ImageUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+# Asynchronous batch jobs (/api/jobs/): an uploaded ZIP (or set of images) is
+# stored in PREDICT_JOBS_DIR and scored by a separate `python manage.py
+# run_job_worker` process, PREDICT_JOB_BATCH_SIZE images per forward pass and
+# at OS priority PREDICT_JOB_WORKER_NICE so interactive requests come first.
+PREDICT_JOBS_DIR = os.environ.get('PREDICT_JOBS_DIR') or str(BASE_DIR / 'jobs')
+PREDICT_JOB_MAX_IMAGES = int(os.environ.get('PREDICT_JOB_MAX_IMAGES', '10000'))
+PREDICT_JOB_MAX_UPLOAD_MB = int(os.environ.get('PREDICT_JOB_MAX_UPLOAD_MB', '500'))
+PREDICT_JOB_BATCH_SIZE = int(os.environ.get('PREDICT_JOB_BATCH_SIZE', '32'))
+PREDICT_JOB_WORKER_NICE = int(os.environ.get('PREDICT_JOB_WORKER_NICE', '10'))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -1,3 +1,18 @@
 from django.contrib import admin
 
+from .models import CachedPrediction, PredictionJob
+
 # Register your models here.
+
+
+@admin.register(CachedPrediction)
+class CachedPredictionAdmin(admin.ModelAdmin):
+    list_display = ('key', 'created_at')
+    search_fields = ('key',)
+
+
+@admin.register(PredictionJob)
+class PredictionJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'status', 'model', 'processed', 'total', 'errors', 'created_at', 'finished_at')
+    list_filter = ('status',)
+    readonly_fields = ('created_at', 'started_at', 'heartbeat_at', 'finished_at')
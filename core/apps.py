@@ -1,66 +1,255 @@
 from django.apps import AppConfig
 import os
+import sys
 import logging
 from django.conf import settings
 
-from .ml_model import initialize_model
+from .ml_model import configure_remote, get_detector, initialize_model, set_model_loader
+from .prediction_cache import PredictionCache, DatabasePredictionStore, NearDuplicateIndex
+from .cascade import CascadeDetector, load_cascade_config
+from .model_registry import get_registry
+from .resolution_tiers import find_variants
+from . import stage_timing
+from .startup import startup_report
+from .thread_tuning import resolve_thread_config
+
+# Commands that serve requests and so want the model in memory up front
+SERVING_COMMANDS = ('runserver', 'runserver_plus')
 
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
 
+    @staticmethod
+    def _backend_path(model_path):
+        """
+        Swap a Keras model path for its exported variant when INFERENCE_BACKEND
+        is 'tflite' (models/<model>_<quantization>.tflite), 'numpy'
+        (models/<model>.npz) or 'serving' (models/<model>_serving.keras)
+        and that variant exists.
+        """
+        backend = getattr(settings, 'INFERENCE_BACKEND', 'keras')
+        if backend == 'serving':
+            from .serving_graph import serving_path
+            candidate = serving_path(model_path)
+        elif backend == 'tflite':
+            from .tflite_backend import tflite_path
+            candidate = tflite_path(model_path, settings.TFLITE_QUANTIZATION)
+        elif backend == 'numpy':
+            candidate = os.path.splitext(model_path)[0] + '.npz'
+        else:
+            return model_path
+        if os.path.exists(candidate):
+            return candidate
+        if os.path.exists(model_path):
+            logging.getLogger(__name__).warning(f"{backend} model {candidate} not found, using {model_path}")
+        return model_path
+
+    @staticmethod
+    def _should_preload():
+        """
+        Whether ready() should load the model (PRELOAD_MODEL setting).
+
+        'True' and 'False' force it; 'auto' preloads when serving (WSGI/ASGI
+        import, runserver's reloaded child) and skips it for management
+        commands such as migrate or collectstatic, which would otherwise pay
+        for the TensorFlow import and model load without using them.
+        Skipped loads happen on first use via ensure_model_loaded().
+        """
+        mode = str(getattr(settings, 'PRELOAD_MODEL', 'auto'))
+        if mode in ('True', 'False'):
+            return mode == 'True'
+        program = os.path.basename(sys.argv[0]) if sys.argv else ''
+        if program == '__main__.py':
+            # `python -m django` (but not `python -m uvicorn` and friends)
+            program = os.path.basename(os.path.dirname(sys.argv[0]))
+        if program not in ('manage.py', 'django-admin', 'django') or len(sys.argv) < 2:
+            return True
+        if sys.argv[1] not in SERVING_COMMANDS:
+            return False
+        # The autoreloader's parent process never serves requests
+        return os.environ.get('RUN_MAIN') == 'true' or '--noreload' in sys.argv
+
     def ready(self):
         """
-        Preload the ML model once when the Django app registry is ready.
+        Configure the detector once when the Django app registry is ready,
+        and preload the model unless _should_preload() says otherwise.
+
+        With INFERENCE_SOCKET set the detector is a client of the inference
+        daemon (`run_inference_server`) and "preloading" only connects to it.
+
+        Any errors are logged and do not prevent Django from starting.
+        """
+        startup_report.mark('django_setup')
+        stage_timing.enabled = getattr(settings, 'PREDICT_STAGE_TIMING', True)
+        configure_remote(getattr(settings, 'INFERENCE_SOCKET', None))
+        self.configure_detector(get_detector())
+
+        set_model_loader(self.preload_model)
+        if self._should_preload():
+            self.preload_model()
+            logging.getLogger(__name__).info("Startup phases:\n%s", startup_report.format())
+
+    @staticmethod
+    def configure_detector(detector):
+        """
+        Apply the PREDICT_* / backend settings to a detector
+
+        Args:
+            detector: PlantDiseaseDetector (or InferenceClient)
+        """
+        detector.batch_chunk_size = getattr(settings, 'PREDICT_BATCH_CHUNK_SIZE', detector.batch_chunk_size)
+        detector.thread_config = resolve_thread_config(getattr(settings, 'PREDICT_THREAD_CONFIG', None), {
+            'intra_op_threads': getattr(settings, 'PREDICT_INTRA_OP_THREADS', None),
+            'inter_op_threads': getattr(settings, 'PREDICT_INTER_OP_THREADS', None),
+            'onednn': getattr(settings, 'PREDICT_ONEDNN', None),
+            'decode_workers': getattr(settings, 'PREDICT_DECODE_WORKERS', None),
+        })
+        detector.decode_workers = detector.thread_config.get('decode_workers') or detector.decode_workers
+        detector.tflite_threads = getattr(settings, 'TFLITE_NUM_THREADS', None)
+        detector.numpy_weights_dtype = getattr(settings, 'NUMPY_WEIGHTS_DTYPE', None)
+        detector.numpy_mmap = getattr(settings, 'NUMPY_MMAP_WEIGHTS', True)
+        detector.jpeg_draft = getattr(settings, 'PREDICT_JPEG_DRAFT', True)
+        if detector.is_remote:
+            detector.ring_slots = getattr(settings, 'INFERENCE_RING_SLOTS', detector.ring_slots)
+
+        if getattr(settings, 'PREDICT_FAST_INFERENCE', False):
+            detector.enable_fast_inference(buckets=settings.PREDICT_BATCH_BUCKETS)
+
+        if getattr(settings, 'PREDICT_BATCHING', False):
+            detector.enable_batching(
+                max_batch_size=settings.PREDICT_MAX_BATCH_SIZE,
+                max_wait_ms=settings.PREDICT_MAX_WAIT_MS,
+            )
 
-        This attempts to initialize the model from the project's `models/`
-        directory if the files are present. Any errors are logged and
-        do not prevent Django from starting.
+        if getattr(settings, 'PREDICT_CACHE', False):
+            store = None
+            if getattr(settings, 'PREDICT_CACHE_PERSISTENT', False):
+                store = DatabasePredictionStore(ttl_seconds=settings.PREDICT_CACHE_PERSISTENT_TTL_SECONDS)
+            detector.enable_cache(PredictionCache(
+                max_entries=settings.PREDICT_CACHE_MAX_ENTRIES,
+                ttl_seconds=settings.PREDICT_CACHE_TTL_SECONDS,
+                store=store,
+            ))
+
+        if getattr(settings, 'PREDICT_NEAR_DUPLICATE', False):
+            detector.enable_near_duplicates(NearDuplicateIndex(
+                max_distance=settings.PREDICT_NEAR_DUPLICATE_MAX_DISTANCE,
+                max_entries=settings.PREDICT_NEAR_DUPLICATE_MAX_ENTRIES,
+                ttl_seconds=settings.PREDICT_CACHE_TTL_SECONDS,
+            ))
+
+    def find_models(self):
+        """
+        Locate every servable model in the project's `models/` directory.
+        
+        Returns:
+            list: (name, label, model_path, class_indices_path) per model
+            present, with INFERENCE_BACKEND applied, in preference order and
+            followed by resolution variants ('<name>@<size>', see
+            core.resolution_tiers); `name` is the model's key in core.model_registry
+        """
+        models_dir = os.path.join(settings.BASE_DIR, 'models')
+        candidates = (
+            # CNN simple first (smaller, ~32MB vs 49MB for EfficientNet)
+            ('cnn_simple', 'CNN simple', 'plant_disease_model_cnn_simple.keras', 'class_indices_cnn_simple.json', True),
+            ('efficientnetb0', 'EfficientNet', 'plant_disease_model_efficientnetb0.keras', 'class_indices_efficientnetb0.json', True),
+            ('default', 'default', 'plant_disease_model.keras', 'class_indices.json', False),
+            ('default', 'H5', 'plant_disease_model.h5', 'class_indices.json', False),
+        )
+        found, variants, names = [], [], set()
+        for name, label, model_name, indices_name, indices_required in candidates:
+            if name in names:
+                continue
+            model_path = self._backend_path(os.path.join(models_dir, model_name))
+            class_indices_path = os.path.join(models_dir, indices_name)
+            if os.path.exists(model_path) and (os.path.exists(class_indices_path) or not indices_required):
+                found.append((name, label, model_path, class_indices_path))
+                names.add(name)
+                # Lower-resolution variants, served as '<name>@<size>'
+                for size, path in sorted(find_variants(os.path.join(models_dir, model_name)).items()):
+                    variants.append((f"{name}@{size}", f"{label} {size}px", self._backend_path(path),
+                                     class_indices_path))
+        return found + variants
+
+    def register_models(self, registry):
+        """
+        Register every model find_models() sees with the model registry, plus
+        the 'cascade' pseudo-model when both of its stages are present (and
+        the models are served in-process, not by the inference daemon)
+        
+        Args:
+            registry: core.model_registry.ModelRegistry
+        """
+        for name, _label, model_path, class_indices_path in self.find_models():
+            registry.register(name, model_path, class_indices_path)
+        primary = getattr(settings, 'PREDICT_CASCADE_PRIMARY', 'cnn_simple')
+        secondary = getattr(settings, 'PREDICT_CASCADE_SECONDARY', 'efficientnetb0')
+        remote = get_detector().is_remote
+        missing = [name for name in (primary, secondary) if not registry.spec(name)]
+        if remote or missing:
+            if getattr(settings, 'PREDICT_CASCADE', False):
+                reason = ('the inference daemon serves a single model' if remote
+                          else f"no model files for {', '.join(missing)}")
+                logging.getLogger(__name__).warning(
+                    f"PREDICT_CASCADE is set but the cascade is unavailable ({reason}); serving the default model")
+        else:
+            # Explicit settings win over the thresholds `tune_cascade` wrote
+            thresholds = load_cascade_config(getattr(settings, 'PREDICT_CASCADE_CONFIG', None))
+            overrides = {
+                'confidence_threshold': getattr(settings, 'PREDICT_CASCADE_CONFIDENCE', None),
+                'margin_threshold': getattr(settings, 'PREDICT_CASCADE_MARGIN', None),
+            }
+            thresholds.update({key: value for key, value in overrides.items() if value is not None})
+            registry.register_detector('cascade', CascadeDetector(registry, primary, secondary, **thresholds))
+
+    def find_model(self):
+        """
+        Locate the model to serve in the project's `models/` directory.
         
         Uses the CNN simple model by default to minimize memory usage,
         falls back to EfficientNet or H5 format if not available.
+        
+        Returns:
+            tuple or None: (label, model_path, class_indices_path) of the
+            first candidate present, with INFERENCE_BACKEND applied
+        """
+        found = self.find_models()
+        return found[0][1:] if found else None
+
+    def preload_model(self, formats=None):
+        """
+        Load the model chosen by find_model(). Any errors are logged.
+        
+        Args:
+            formats: Optional file extensions to restrict loading to; the
+                Gunicorn master passes the fork-safe formats and leaves
+                anything else for the workers to load
         """
         try:
-            models_dir = os.path.join(settings.BASE_DIR, 'models')
-            
-            # Try CNN simple first (smaller, ~32MB vs 49MB for EfficientNet)
-            model_path = os.path.join(models_dir, 'plant_disease_model_cnn_simple.keras')
-            class_indices_path = os.path.join(models_dir, 'class_indices_cnn_simple.json')
-            
-            if os.path.exists(model_path) and os.path.exists(class_indices_path):
-                logging.getLogger(__name__).info(f"Loading CNN simple model from {model_path}")
-                initialize_model(model_path=model_path, class_indices_path=class_indices_path)
-                return
-            
-            # Fallback to EfficientNet keras
-            model_path = os.path.join(models_dir, 'plant_disease_model_efficientnetb0.keras')
-            class_indices_path = os.path.join(models_dir, 'class_indices_efficientnetb0.json')
-            
-            if os.path.exists(model_path) and os.path.exists(class_indices_path):
-                logging.getLogger(__name__).info(f"Loading EfficientNet model from {model_path}")
-                initialize_model(model_path=model_path, class_indices_path=class_indices_path)
+            detector = get_detector()
+            if detector.is_remote:
+                # The daemon owns the model; just make sure we can reach it
+                detector.connect()
                 return
-            
-            # Fallback to default keras
-            model_path = os.path.join(models_dir, 'plant_disease_model.keras')
-            class_indices_path = os.path.join(models_dir, 'class_indices.json')
-            
-            if os.path.exists(model_path):
-                logging.getLogger(__name__).info(f"Loading default model from {model_path}")
-                initialize_model(model_path=model_path, class_indices_path=class_indices_path)
+            found = self.find_models()
+            if not found:
+                logging.getLogger(__name__).warning("No model files found in models/ directory")
                 return
-            
-            # Fallback to H5 format
-            model_path = os.path.join(models_dir, 'plant_disease_model.h5')
-            class_indices_path = os.path.join(models_dir, 'class_indices.json')
-            
-            if os.path.exists(model_path):
-                logging.getLogger(__name__).info(f"Loading H5 model from {model_path}")
-                initialize_model(model_path=model_path, class_indices_path=class_indices_path)
+            name, label, model_path, class_indices_path = found[0]
+            if formats is not None and os.path.splitext(model_path)[1] not in formats:
+                logging.getLogger(__name__).info(f"Not preloading {model_path} here; workers load it after fork")
                 return
-            
-            logging.getLogger(__name__).warning("No model files found in models/ directory")
-            
+            logging.getLogger(__name__).info(f"Loading {label} model from {model_path}")
+            if initialize_model(model_path=model_path, class_indices_path=class_indices_path):
+                # Other models stay registered and load on first request
+                registry = get_registry()
+                registry.adopt(name, detector, class_indices_path)
+                secondary = getattr(settings, 'PREDICT_CASCADE_SECONDARY', 'efficientnetb0')
+                if formats is None and getattr(settings, 'PREDICT_CASCADE', False) and registry.spec(secondary):
+                    # Warm the escalation model in the background (not in the
+                    # Gunicorn master: no loader thread may be running at fork)
+                    registry.load(secondary)
         except Exception as e:
             logging.getLogger(__name__).exception('Failed to preload ML model: %s', e)
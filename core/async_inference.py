@@ -0,0 +1,118 @@
+# async_inference.py
+"""
+Bounded executor for the async prediction view
+Decode and inference are CPU-bound and release the GIL only in parts, so
+they run on a small fixed thread pool; the event loop only awaits them and
+stays free to accept (slow) uploads. At most `max_pending` jobs may be
+queued or running; beyond that callers are turned away instead of piling up.
+Each job is wrapped like a request in database terms: connections the pool
+thread opened (e.g. the persistent prediction cache) are closed or recycled
+per CONN_MAX_AGE before and after it.
+"""
+
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections
+
+
+class ExecutorBusy(Exception):
+    """Raised when the executor already holds `max_pending` jobs"""
+
+
+class BoundedExecutor:
+    """
+    Thread pool with a hard cap on queued + running jobs
+    """
+
+    def __init__(self, max_workers=2, max_pending=32):
+        """
+        Args:
+            max_workers: Threads running decode + inference
+            max_pending: Most jobs admitted at once (running + waiting)
+        """
+        self.max_workers = max(1, int(max_workers))
+        self.max_pending = max(self.max_workers, int(max_pending))
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='predict')
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+
+    async def run(self, fn, *args):
+        """
+        Run `fn(*args)` on the pool and await its result
+
+        Raises:
+            ExecutorBusy: If `max_pending` jobs are already admitted
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise ExecutorBusy(f"{self.max_pending} predictions already pending")
+        with self._lock:
+            self.pending += 1
+        # Run in a copy of the caller's context, so per-request state such
+        # as core.stage_timing's timings follows the job onto the pool
+        future = self._pool.submit(contextvars.copy_context().run, _run_job, fn, *args)
+        # Free the slot when the job really finishes, even if the awaiting
+        # request was cancelled (client disconnected) before that
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def _release(self, _future):
+        with self._lock:
+            self.pending -= 1
+            self.completed += 1
+        self._slots.release()
+
+    def stats(self):
+        """
+        Returns:
+            dict: Pool size, admission cap and job counters
+        """
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'max_pending': self.max_pending,
+                'pending': self.pending,
+                'completed': self.completed,
+                'rejected': self.rejected,
+            }
+
+
+def _run_job(fn, *args):
+    # Pool threads never see request_started / request_finished, which is
+    # where Django normally closes a thread's expired connections
+    close_old_connections()
+    try:
+        return fn(*args)
+    finally:
+        close_old_connections()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Process-wide executor sized from PREDICT_ASYNC_WORKERS and
+    PREDICT_ASYNC_MAX_PENDING
+
+    Returns:
+        BoundedExecutor: The shared executor
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                from django.conf import settings
+                _executor = BoundedExecutor(
+                    max_workers=getattr(settings, 'PREDICT_ASYNC_WORKERS', 2),
+                    max_pending=getattr(settings, 'PREDICT_ASYNC_MAX_PENDING', 32),
+                )
+    return _executor
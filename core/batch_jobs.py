@@ -0,0 +1,369 @@
+# batch_jobs.py
+"""
+Asynchronous batch prediction jobs
+POST /api/jobs/ stores the upload (a ZIP, or loose images packed into one)
+under PREDICT_JOBS_DIR, queues a PredictionJob and returns its id at once.
+The `run_job_worker` process claims queued jobs, reads the archive entry by
+entry, decodes a few batches ahead on a thread pool and commits the results
+of every scored batch together with the progress counters, so clients can
+page through results while the job runs. Memory is bounded by the decode
+window, not by the archive size; a job interrupted by a restart resumes
+after its last committed batch.
+"""
+
+import os
+import socket
+import uuid
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .model_registry import get_registry
+from .models import PredictionJob, PredictionJobResult
+from .upload_handlers import SNIFF_BYTES, HeaderSniffer, RejectedUpload
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+# Entries that would inflate beyond this are reported as errors, not decompressed
+MAX_ENTRY_BYTES = 50 * 1024 * 1024
+
+
+class JobRejected(ValueError):
+    """The upload cannot become a job (no images, not a ZIP, over a limit)"""
+
+
+class JobInterrupted(Exception):
+    """The job was cancelled, or the worker is stopping, between two batches"""
+
+
+def archive_entries(archive):
+    """
+    Image entries of a ZIP in archive order; directories, hidden files and
+    macOS resource forks are skipped
+
+    Args:
+        archive: zipfile.ZipFile
+
+    Returns:
+        list: zipfile.ZipInfo per image
+    """
+    entries = []
+    for info in archive.infolist():
+        base = os.path.basename(info.filename)
+        if info.is_dir() or info.filename.startswith('__MACOSX/') or base.startswith('.'):
+            continue
+        if base.lower().endswith(IMAGE_EXTENSIONS):
+            entries.append(info)
+    return entries
+
+
+def create_job(files, model=''):
+    """
+    Store an upload and queue a job for it
+
+    Args:
+        files: Uploaded files; a single ZIP is stored as is, anything else is
+            packed into a new uncompressed ZIP (the images already are)
+        model: Registry name to score with ('' for the default model)
+
+    Returns:
+        PredictionJob: The queued job
+
+    Raises:
+        JobRejected: If the upload holds no images or exceeds a limit
+    """
+    if not files:
+        raise JobRejected('No file provided')
+    max_mb = settings.PREDICT_JOB_MAX_UPLOAD_MB
+    if sum(f.size for f in files) > max_mb * 1024 * 1024:
+        raise JobRejected(f'Upload larger than {max_mb} MB')
+
+    os.makedirs(settings.PREDICT_JOBS_DIR, exist_ok=True)
+    job_id = uuid.uuid4()
+    path = os.path.join(settings.PREDICT_JOBS_DIR, f'{job_id}.zip')
+    try:
+        if len(files) == 1 and zipfile.is_zipfile(files[0]):
+            with open(path, 'wb') as out:
+                for chunk in files[0].chunks():
+                    out.write(chunk)
+        else:
+            _pack(files, path)
+        try:
+            with zipfile.ZipFile(path) as archive:
+                total = len(archive_entries(archive))
+        except zipfile.BadZipFile:
+            raise JobRejected('Not a valid ZIP archive')
+        if total == 0:
+            raise JobRejected(f"No images ({', '.join(IMAGE_EXTENSIONS)}) in the upload")
+        if total > settings.PREDICT_JOB_MAX_IMAGES:
+            raise JobRejected(f'{total} images; at most {settings.PREDICT_JOB_MAX_IMAGES} per job')
+        return PredictionJob.objects.create(id=job_id, model=model or '', archive=path, total=total)
+    except BaseException:
+        _remove(path)
+        raise
+
+
+def _pack(files, path):
+    names = set()
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_STORED) as archive:
+        for index, uploaded_file in enumerate(files):
+            name = os.path.basename(uploaded_file.name) or f'image-{index}'
+            if name in names:
+                name = f'{index}-{name}'
+            names.add(name)
+            with archive.open(name, 'w') as out:
+                for chunk in uploaded_file.chunks():
+                    out.write(chunk)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def cancel_job(job_id):
+    """
+    Cancel a queued or running job; a running one stops after its current
+    batch, keeping the results written so far
+
+    Returns:
+        PredictionJob or None: The job (None if it does not exist)
+    """
+    job = PredictionJob.objects.filter(pk=job_id).first()
+    if job is None or job.status in PredictionJob.FINISHED:
+        return job
+    was_queued = PredictionJob.objects.filter(pk=job_id, status=PredictionJob.QUEUED).update(
+        status=PredictionJob.CANCELLED, finished_at=timezone.now())
+    if was_queued:
+        # No worker will open the archive again
+        _remove(job.archive)
+    else:
+        PredictionJob.objects.filter(pk=job_id, status=PredictionJob.RUNNING).update(
+            status=PredictionJob.CANCELLED, finished_at=timezone.now())
+    job.refresh_from_db()
+    return job
+
+
+def describe_job(job):
+    """
+    Returns:
+        dict: JSON-ready status and progress of `job`
+    """
+    return {
+        'id': str(job.id),
+        'status': job.status,
+        'model': job.model or None,
+        'total': job.total,
+        'processed': job.processed,
+        'errors': job.errors,
+        'error': job.error or None,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def job_results(job, after=0, limit=500):
+    """
+    Results of `job` from index `after` on, in archive order
+
+    Returns:
+        list: Dicts shaped like the /api/predict-batch/ results, plus index
+    """
+    results = []
+    for row in PredictionJobResult.objects.filter(job=job, index__gte=after).order_by('index')[:limit]:
+        if row.error:
+            results.append({'index': row.index, 'filename': row.filename, 'success': False, 'error': row.error})
+        else:
+            results.append({
+                'index': row.index,
+                'filename': row.filename,
+                'success': True,
+                'predicted_class': row.predicted_class,
+                'confidence': row.confidence * 100,  # Convert to percentage
+            })
+    return results
+
+
+def worker_name():
+    """Identity recorded on the jobs a worker claims"""
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def requeue_stale(stale_after):
+    """
+    Put back in the queue the running jobs whose worker died: on this host
+    the process is gone, elsewhere no heartbeat for `stale_after` seconds
+
+    Returns:
+        int: Jobs requeued
+    """
+    cutoff = timezone.now() - timedelta(seconds=stale_after)
+    requeued = 0
+    for job in PredictionJob.objects.filter(status=PredictionJob.RUNNING):
+        if job.heartbeat_at is not None and job.heartbeat_at >= cutoff and _worker_alive(job.worker):
+            continue
+        requeued += PredictionJob.objects.filter(pk=job.pk, status=PredictionJob.RUNNING, worker=job.worker).update(
+            status=PredictionJob.QUEUED, worker='')
+    return requeued
+
+
+def _worker_alive(worker):
+    host, _, pid = worker.rpartition(':')
+    if host != socket.gethostname():
+        return True  # Cannot tell; left to the heartbeat
+    try:
+        os.kill(int(pid), 0)
+    except (ValueError, ProcessLookupError):
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def claim_next_job(worker):
+    """
+    Move the oldest queued job to running for `worker`; safe with several
+    workers, only one wins each job
+
+    Returns:
+        PredictionJob or None: The claimed job, None if the queue is empty
+    """
+    queued = PredictionJob.objects.filter(status=PredictionJob.QUEUED).order_by('created_at')
+    for job_id in queued.values_list('id', flat=True)[:10]:
+        now = timezone.now()
+        claimed = PredictionJob.objects.filter(pk=job_id, status=PredictionJob.QUEUED).update(
+            status=PredictionJob.RUNNING, worker=worker, started_at=now, heartbeat_at=now)
+        if claimed:
+            return PredictionJob.objects.get(pk=job_id)
+    return None
+
+
+def run_job(job, batch_size=32, prefetch_batches=2, should_stop=None):
+    """
+    Score a claimed job to the end and record how it finished: done,
+    failed, cancelled, or back in the queue if `should_stop` interrupted it
+
+    Args:
+        job: PredictionJob claimed by this worker
+        batch_size: Images per forward pass
+        prefetch_batches: Batches decoded ahead of inference
+        should_stop: Callable checked between batches (worker shutdown)
+
+    Returns:
+        str: The job's status afterwards
+    """
+    status, error = PredictionJob.DONE, ''
+    try:
+        with get_registry().use(job.model or None) as entry:
+            if entry.detector.model is None:
+                raise RuntimeError('ML model not loaded')
+            _score_archive(job, entry.detector, batch_size, prefetch_batches, should_stop)
+    except JobInterrupted:
+        if should_stop is not None and should_stop():
+            # Shutting down: the next worker resumes after the last batch
+            PredictionJob.objects.filter(pk=job.pk, status=PredictionJob.RUNNING, worker=job.worker).update(
+                status=PredictionJob.QUEUED, worker='')
+            job.refresh_from_db()
+            return job.status
+        job.refresh_from_db()
+        if job.status == PredictionJob.CANCELLED:
+            _remove(job.archive)
+        # Otherwise requeued as stale and claimed by another worker: its archive now
+        return job.status
+    except Exception as e:
+        status, error = PredictionJob.FAILED, f'{type(e).__name__}: {e}'
+
+    finished = PredictionJob.objects.filter(pk=job.pk, status=PredictionJob.RUNNING, worker=job.worker).update(
+        status=status, error=error, finished_at=timezone.now())
+    job.refresh_from_db()
+    if finished or job.status == PredictionJob.CANCELLED:
+        _remove(job.archive)
+    return job.status
+
+
+def _score_archive(job, detector, batch_size, prefetch_batches, should_stop):
+    batch_size = max(1, batch_size)
+    window = batch_size * (max(1, prefetch_batches) + 1)
+    with zipfile.ZipFile(job.archive) as archive, \
+            ThreadPoolExecutor(max_workers=max(1, detector.decode_workers)) as pool:
+        entries = archive_entries(archive)
+        pending = deque()
+        # Skip what an interrupted run already committed
+        for index in range(job.processed, len(entries)):
+            info = entries[index]
+            pending.append((index, info.filename, _decode(pool, detector, archive, info)))
+            if len(pending) >= window:
+                _score_batch(job, detector, pending, batch_size, should_stop)
+        while pending:
+            _score_batch(job, detector, pending, batch_size, should_stop)
+
+
+def _decode(pool, detector, archive, info):
+    # Entries are read (inflated) here, in order; decoding runs on the pool
+    if info.file_size > MAX_ENTRY_BYTES:
+        return f'Entry larger than {MAX_ENTRY_BYTES // (1024 * 1024)} MB'
+    try:
+        with archive.open(info) as entry:
+            # Same header checks as direct uploads, before inflating the rest
+            sniffer, head = HeaderSniffer(), []
+            while True:
+                head.append(entry.read(SNIFF_BYTES))
+                if not head[-1] or sniffer.feed(head[-1]):
+                    break
+            data = b''.join(head) + entry.read()
+    except RejectedUpload as e:
+        return str(e)
+    except Exception as e:
+        return f'Unreadable archive entry: {e}'
+    return pool.submit(detector.preprocess_image, data)
+
+
+def _score_batch(job, detector, pending, batch_size, should_stop):
+    """Predict the oldest batch in `pending` and commit its results"""
+    if should_stop is not None and should_stop():
+        raise JobInterrupted()
+    batch = [pending.popleft() for _ in range(min(batch_size, len(pending)))]
+    decoded = []
+    for index, filename, item in batch:
+        if isinstance(item, str):
+            decoded.append((index, filename, None, item))
+        else:
+            array = item.result()
+            decoded.append((index, filename, array, None if array is not None else 'Failed to process image'))
+    valid = [array for _, _, array, _ in decoded if array is not None]
+    try:
+        predictions = detector.predict_preprocessed(np.concatenate(valid, axis=0)) if valid else []
+    except Exception as e:
+        predictions = [{'error': f'Prediction failed: {e}'}] * len(valid)
+    predictions = iter(predictions)
+
+    rows, errors = [], 0
+    for index, filename, array, error in decoded:
+        row = PredictionJobResult(job_id=job.pk, index=index, filename=filename[:512])
+        prediction = next(predictions) if array is not None else {'error': error}
+        if 'error' in prediction:
+            row.error = prediction['error'][:256]
+            errors += 1
+        else:
+            row.predicted_class = prediction['disease']
+            row.confidence = prediction['confidence']
+        rows.append(row)
+
+    with transaction.atomic():
+        # Also the cancellation check: a cancelled job is no longer running
+        updated = PredictionJob.objects.filter(pk=job.pk, status=PredictionJob.RUNNING, worker=job.worker).update(
+            processed=F('processed') + len(rows), errors=F('errors') + errors, heartbeat_at=timezone.now())
+        if not updated:
+            raise JobInterrupted()
+        PredictionJobResult.objects.bulk_create(rows)
+    job.processed += len(rows)
+    job.errors += errors
@@ -0,0 +1,251 @@
+# cascade.py
+"""
+Confidence-gated model cascade for Plant Disease Prediction
+Every image goes through the small CNN first; only predictions it is unsure
+about (top-1 confidence below a threshold, or top-1 minus top-2 below a
+margin) are escalated to EfficientNetB0. The two models were trained with
+differently named and ordered class maps, so the CNN's scores are reordered
+into EfficientNet's class space and every result uses EfficientNet's names.
+`python manage.py tune_cascade` picks the thresholds.
+"""
+
+import json
+import os
+import re
+import threading
+
+import numpy as np
+
+from .ml_model import PlantDiseaseDetector, format_prediction
+
+# Class names that differ between the class maps beyond spelling
+# (canonical form -> canonical form)
+LABEL_ALIASES = {
+    'tomato_spider_mites_two_spotted_spider_mite': 'tomato_two_spotted_spider_mite',
+}
+
+DEFAULT_CONFIDENCE_THRESHOLD = 0.8
+DEFAULT_MARGIN_THRESHOLD = 0.0
+
+
+def canonical_label(name):
+    """
+    Spelling-independent class key: lowercase, runs of underscores folded,
+    the crop name not repeated ('Tomato__Tomato_mosaic_virus' and
+    'Tomato_mosaic_virus' both become 'tomato_mosaic_virus'), then aliased
+    """
+    tokens = [t for t in re.split(r'[^0-9a-z]+', name.lower()) if t]
+    tokens = tokens[:1] + [t for t in tokens[1:2] if t != tokens[0]] + tokens[2:]
+    key = '_'.join(tokens)
+    return LABEL_ALIASES.get(key, key)
+
+
+def label_permutation(source_indices, target_indices):
+    """
+    Reorder scores from one class map into another
+
+    Args:
+        source_indices: {"<index>": "<name>"} of the model producing scores
+        target_indices: {"<index>": "<name>"} of the class space to report in
+
+    Returns:
+        np.ndarray: `order` such that `scores[order]` is in target order
+
+    Raises:
+        ValueError: If the two maps do not cover the same classes
+    """
+    source = {canonical_label(name): int(index) for index, name in source_indices.items()}
+    target = {canonical_label(name): int(index) for index, name in target_indices.items()}
+    if set(source) != set(target) or len(source) != len(source_indices) or len(target) != len(target_indices):
+        missing = sorted(set(source) ^ set(target))
+        raise ValueError(f"Class maps cannot be reconciled; unmatched classes: {missing} "
+                         f"(add them to core.cascade.LABEL_ALIASES)")
+    order = np.empty(len(target), dtype=np.int64)
+    for key, index in target.items():
+        order[index] = source[key]
+    return order
+
+
+def escalation_mask(scores, confidence_threshold, margin_threshold):
+    """
+    Which rows of primary-model scores should be escalated
+
+    Args:
+        scores: (N, classes) array
+        confidence_threshold: Escalate when top-1 < this
+        margin_threshold: Escalate when top-1 - top-2 < this
+
+    Returns:
+        np.ndarray: Boolean mask of shape (N,)
+    """
+    scores = np.asarray(scores, dtype=np.float32)
+    top2 = np.sort(scores, axis=1)[:, -2:]
+    return (top2[:, 1] < confidence_threshold) | (top2[:, 1] - top2[:, 0] < margin_threshold)
+
+
+def load_cascade_config(path):
+    """
+    Thresholds written by `tune_cascade`
+
+    Returns:
+        dict: confidence_threshold / margin_threshold, empty if the file is missing
+    """
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring cascade config {path}: {e}")
+        return {}
+    return {key: data[key] for key in ('confidence_threshold', 'margin_threshold') if data.get(key) is not None}
+
+
+class CascadeDetector:
+    """
+    Detector-compatible front for a two-stage cascade over registry models
+
+    Each call pins the current version of both stages in the model
+    registry, so hot swaps and evictions work as for any other model; the
+    second stage is only loaded once something is escalated.
+    """
+
+    is_remote = False
+
+    def __init__(self, registry, primary='cnn_simple', secondary='efficientnetb0',
+                 confidence_threshold=DEFAULT_CONFIDENCE_THRESHOLD, margin_threshold=DEFAULT_MARGIN_THRESHOLD):
+        """
+        Args:
+            registry: core.model_registry.ModelRegistry holding both stages
+            primary: Registry name of the cheap model
+            secondary: Registry name of the model escalations go to
+            confidence_threshold: Escalate when the primary's top-1 is below this
+            margin_threshold: Escalate when the primary's top-1 - top-2 is below this
+        """
+        self.registry = registry
+        self.primary = primary
+        self.secondary = secondary
+        self.confidence_threshold = float(confidence_threshold)
+        self.margin_threshold = float(margin_threshold)
+        self.model_path = f"cascade:{primary}>{secondary}"
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._escalated = 0
+        self._labels = None
+
+    @property
+    def model(self):
+        """The primary stage's model (loaded on demand), for readiness checks"""
+        with self.registry.use(self.primary) as entry:
+            return entry.detector.model
+
+    @property
+    def model_identity(self):
+        return f"{self.primary}>{self.secondary}@{self.confidence_threshold:g}/{self.margin_threshold:g}"
+
+    def _target_labels(self):
+        # Secondary's class map, even while the secondary is not resident
+        resident = self.registry.resident(self.secondary)
+        if resident is not None and resident.detector.class_indices:
+            return resident.detector.class_indices
+        if self._labels is None:
+            class_indices_path = self.registry.spec(self.secondary)[1]
+            with open(class_indices_path) as f:
+                self._labels = json.load(f)
+        return self._labels
+
+    def predict(self, image_path):
+        """
+        Predict one image through the cascade
+
+        Returns:
+            dict: Same shape as PlantDiseaseDetector.predict, in the
+            secondary model's class space, plus a `cascade` entry
+        """
+        return self.predict_batch([image_path])[0]
+
+    def predict_batch(self, image_paths, max_batch_size=None):
+        """
+        Predict many images: all through the primary, the unsure ones again
+        through the secondary
+
+        Args:
+            image_paths: Image sources (see PlantDiseaseDetector.predict_batch)
+            max_batch_size: Largest chunk per forward pass
+
+        Returns:
+            list: Results in input order
+        """
+        image_paths = list(image_paths)
+        # Read uploads once; both stages decode from the same bytes
+        sources = [PlantDiseaseDetector.read_image_bytes(p) or p for p in image_paths]
+        with self.registry.use(self.primary) as entry:
+            first = entry.detector.predict_batch(sources, max_batch_size=max_batch_size)
+            order = label_permutation(entry.detector.class_indices, self._target_labels())
+
+        results = [None] * len(image_paths)
+        scored = [i for i, result in enumerate(first) if 'error' not in result]
+        for i, result in enumerate(first):
+            if 'error' in result:
+                results[i] = result
+        escalate = []
+        if scored:
+            scores = np.array([first[i]['all_predictions']['confidence_scores'] for i in scored])[:, order]
+            mask = escalation_mask(scores, self.confidence_threshold, self.margin_threshold)
+            top2 = np.sort(scores, axis=1)[:, -2:]
+            for row, i in enumerate(scored):
+                results[i] = format_prediction(scores[row], self._target_labels())
+                results[i]['cascade'] = {
+                    'stage': self.primary,
+                    'escalated': bool(mask[row]),
+                    'primary_confidence': float(top2[row, 1]),
+                    'primary_margin': float(top2[row, 1] - top2[row, 0]),
+                }
+            escalate = [i for row, i in enumerate(scored) if mask[row]]
+
+        if escalate:
+            try:
+                with self.registry.use(self.secondary) as entry:
+                    second = entry.detector.predict_batch([sources[i] for i in escalate],
+                                                          max_batch_size=max_batch_size)
+                for i, result in zip(escalate, second):
+                    if 'error' in result:
+                        results[i]['cascade']['escalation_error'] = result['error']
+                        continue
+                    result['cascade'] = dict(results[i]['cascade'], stage=self.secondary)
+                    results[i] = result
+            except Exception as e:
+                # Fall back to the primary's answers rather than failing
+                for i in escalate:
+                    results[i]['cascade']['escalation_error'] = str(e)
+
+        with self._lock:
+            self._requests += len(scored)
+            self._escalated += len(escalate)
+        for image_path, result in zip(image_paths, results):
+            result['image_path'] = image_path
+        return results
+
+    def stats(self):
+        """
+        Returns:
+            dict: Thresholds, predictions served and escalation rate
+        """
+        with self._lock:
+            requests, escalated = self._requests, self._escalated
+        return {
+            'primary': self.primary,
+            'secondary': self.secondary,
+            'confidence_threshold': self.confidence_threshold,
+            'margin_threshold': self.margin_threshold,
+            'predictions': requests,
+            'escalated': escalated,
+            'escalation_rate': escalated / requests if requests else None,
+        }
+
+    def disable_batching(self):
+        """The stages own their schedulers; nothing to stop here"""
+
+    def reset_after_fork(self):
+        """Fresh counter lock in a forked worker"""
+        self._lock = threading.Lock()
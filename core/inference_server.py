@@ -0,0 +1,604 @@
+# inference_server.py
+"""
+Local inference daemon for Plant Disease Prediction
+One process (`python manage.py run_inference_server`) owns the model; web
+workers reach it over a Unix domain socket. Images are decoded and resized
+in the web worker and handed over as uint8 tensors through a per-connection
+shared-memory ring buffer, so only small JSON control messages cross the
+socket and nothing is pickled.
+
+Protocol (each message is a 4-byte big-endian length + UTF-8 JSON):
+    hello   {slots}                 -> model description + ring name/geometry
+    predict {segment, count}        -> {scores, model_identity}
+    load    {model_path?, class_indices_path?} -> model description
+    stats   {}                      -> batching/cache statistics
+"""
+
+import contextvars
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+from multiprocessing import shared_memory
+from types import SimpleNamespace
+
+import numpy as np
+
+from .ml_model import PlantDiseaseDetector, PreprocessPlan
+from .model_registry import get_registry
+
+# Images per ring segment, and segments per connection (requests in flight)
+DEFAULT_SLOTS = 16
+RING_DEPTH = 2
+
+_LENGTH = struct.Struct('!I')
+
+
+def send_message(sock, message):
+    """Write one length-prefixed JSON message"""
+    payload = json.dumps(message).encode('utf-8')
+    sock.sendall(_LENGTH.pack(len(payload)) + payload)
+
+
+def recv_message(sock):
+    """
+    Read one length-prefixed JSON message
+
+    Returns:
+        dict or None: The message, or None if the peer closed the connection
+    """
+    header = _recv_exact(sock, _LENGTH.size)
+    if header is None:
+        return None
+    (length,) = _LENGTH.unpack(header)
+    payload = _recv_exact(sock, length)
+    if payload is None:
+        raise ConnectionError("Inference socket closed mid-message")
+    return json.loads(payload)
+
+
+def _recv_exact(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:])
+        if not n:
+            if received == 0:
+                return None
+            raise ConnectionError("Inference socket closed mid-message")
+        received += n
+    return bytes(buffer)
+
+
+def _plan_dict(plan):
+    return {
+        'normalization': plan.normalization,
+        'target_size': list(plan.target_size),
+        'channels': plan.channels,
+        'channel_order': plan.channel_order,
+        'channels_first': plan.channels_first,
+    }
+
+
+def _slot_bytes(plan):
+    width, height = plan.target_size
+    return width * height * plan.channels
+
+
+def _attach(name):
+    """Attach to a segment the daemon owns without adopting its cleanup"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 registers attached segments with the resource
+        # tracker, which would unlink them when this process exits
+        from multiprocessing import resource_tracker
+        segment = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(segment._name, 'shared_memory')
+        return segment
+
+
+def _close(segment):
+    try:
+        segment.close()
+    except BufferError:
+        # A numpy view is still alive; the mapping goes when it is collected
+        pass
+
+
+class _Ring:
+    """A connection's shared-memory ring: RING_DEPTH segments of `slots` images"""
+
+    def __init__(self, slots, slot_bytes):
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.segment_bytes = slots * slot_bytes
+        self.memory = shared_memory.SharedMemory(create=True, size=RING_DEPTH * self.segment_bytes)
+
+    def release(self):
+        _close(self.memory)
+        try:
+            self.memory.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class _ConnectionHandler(socketserver.BaseRequestHandler):
+    """Serves one web-worker connection until it closes"""
+
+    def setup(self):
+        self.ring = None
+
+    def handle(self):
+        while True:
+            message = recv_message(self.request)
+            if message is None:
+                return
+            try:
+                reply = self.server.dispatch(self, message)
+            except Exception as e:
+                reply = {'ok': False, 'error': str(e)}
+            send_message(self.request, reply)
+
+    def finish(self):
+        self.server.release_ring(self)
+
+
+class InferenceServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Unix-socket server around a loaded PlantDiseaseDetector
+
+    Each connection gets a handler thread and its own ring. Single-image
+    requests go through the detector's batcher when batching is enabled, so
+    concurrent requests from different web workers share forward passes.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, detector):
+        """
+        Args:
+            socket_path: Filesystem path of the Unix socket (replaced if stale)
+            detector: Loaded PlantDiseaseDetector that serves the requests
+        """
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        self.detector = detector
+        self._load_lock = threading.Lock()
+        self._rings = {}
+        self._rings_lock = threading.Lock()
+        super().__init__(socket_path, _ConnectionHandler)
+
+    def dispatch(self, handler, message):
+        """Handle one request message and return the reply"""
+        op = message.get('op')
+        if op == 'predict':
+            return self._predict(handler, message)
+        if op == 'hello':
+            self._allocate_ring(handler, message.get('slots', DEFAULT_SLOTS))
+            return self._describe(handler)
+        if op == 'load':
+            with self._load_lock:
+                model_path = message.get('model_path')
+                class_indices_path = message.get('class_indices_path')
+                if (model_path and model_path != self.detector.model_path) or class_indices_path:
+                    # Load the replacement aside and swap it in whole, so
+                    # in-flight predictions keep a matching model + class map
+                    registry = get_registry()
+                    entry = registry.load(
+                        registry.default_name or 'default', model_path or self.detector.model_path,
+                        class_indices_path
+                    ).result()
+                    self.detector = entry.detector
+            self._allocate_ring(handler, handler.ring.slots if handler.ring else DEFAULT_SLOTS)
+            return self._describe(handler)
+        if op == 'stats':
+            detector = self.detector
+            return {
+                'ok': True,
+                'connections': len(self._rings),
+                'batching': detector.batcher.stats() if detector.batcher is not None else None,
+            }
+        raise ValueError(f"Unknown op '{op}'")
+
+    def _describe(self, handler):
+        detector = self.detector
+        ring = handler.ring
+        return {
+            'ok': True,
+            'model_loaded': detector.model is not None,
+            'model_path': detector.model_path,
+            'model_name': getattr(detector.model, 'name', None),
+            'model_identity': detector.model_identity,
+            'class_indices': detector.class_indices,
+            'plan': _plan_dict(detector.preprocess_plan),
+            'ring': ring.memory.name,
+            'slots': ring.slots,
+            'slot_bytes': ring.slot_bytes,
+            'depth': RING_DEPTH,
+        }
+
+    def _allocate_ring(self, handler, slots):
+        self.release_ring(handler)
+        slots = max(1, min(int(slots), 256))
+        handler.ring = _Ring(slots, _slot_bytes(self.detector.preprocess_plan))
+        with self._rings_lock:
+            self._rings[id(handler)] = handler.ring
+
+    def release_ring(self, handler):
+        """Unlink a connection's ring (connection closed or re-sized)"""
+        ring = getattr(handler, 'ring', None)
+        if ring is None:
+            return
+        with self._rings_lock:
+            self._rings.pop(id(handler), None)
+        ring.release()
+        handler.ring = None
+
+    def _predict(self, handler, message):
+        detector = self.detector
+        ring = handler.ring
+        if detector.model is None:
+            return {'ok': False, 'error': 'Model not loaded in the inference daemon'}
+        plan = detector.preprocess_plan
+        if ring is None or ring.slot_bytes != _slot_bytes(plan):
+            # The model was swapped for one with another input size
+            return {'ok': False, 'stale': True, 'error': 'Ring geometry is stale; send hello again'}
+
+        count = int(message['count'])
+        segment = int(message['segment'])
+        if not 0 < count <= ring.slots or not 0 <= segment < RING_DEPTH:
+            return {'ok': False, 'error': 'Segment or count out of range'}
+        width, height = plan.target_size
+        pixels = np.ndarray((count, height, width, plan.channels), dtype=np.uint8,
+                            buffer=ring.memory.buf, offset=segment * ring.segment_bytes)
+        try:
+            batch = plan.normalize(pixels)
+            if count == 1 and detector.batcher is not None:
+                scores = detector.batcher.submit(batch[0])[None]
+            else:
+                scores = detector._run_model(batch)
+            scores = np.asarray(scores, dtype=np.float32).tolist()
+        finally:
+            # Drop every view of the ring before it may be closed
+            del pixels
+            batch = None
+        return {'ok': True, 'scores': scores, 'model_identity': detector.model_identity}
+
+    def server_close(self):
+        """Close the socket, remove its file and unlink every live ring"""
+        super().server_close()
+        with self._rings_lock:
+            rings = list(self._rings.values())
+            self._rings.clear()
+        for ring in rings:
+            ring.release()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+class _ClientConnection:
+    """One socket + attached ring, used by a single thread"""
+
+    def __init__(self, socket_path, slots, timeout=None):
+        self.slots = slots
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(socket_path)
+        self.memory = None
+        self.cursor = 0
+
+    def request(self, message):
+        send_message(self.sock, message)
+        return self._reply()
+
+    def _reply(self):
+        reply = recv_message(self.sock)
+        if reply is None:
+            raise ConnectionError("Inference daemon closed the connection")
+        return reply
+
+    def hello(self):
+        """(Re)negotiate the ring; returns the daemon's model description"""
+        description = self.request({'op': 'hello', 'slots': self.slots})
+        self.attach(description)
+        return description
+
+    def attach(self, description):
+        if self.memory is not None:
+            _close(self.memory)
+        self.memory = _attach(description['ring'])
+        self.slots = description['slots']
+        self.slot_bytes = description['slot_bytes']
+        self.segment_bytes = self.slots * self.slot_bytes
+        self.cursor = 0
+
+    def run(self, pixels):
+        """
+        Send uint8 images through the ring, keeping up to RING_DEPTH
+        segments in flight, and collect their scores
+
+        Args:
+            pixels: uint8 array (N, H, W, C) matching the daemon's plan
+
+        Returns:
+            tuple: (scores list, model identity reported by the daemon)
+        """
+        if pixels[0].nbytes != self.slot_bytes:
+            raise ValueError("Image tensor does not match the daemon's input size")
+        scores, errors, identity = [], [], None
+        in_flight = 0
+
+        def collect():
+            nonlocal identity
+            reply = self._reply()
+            if reply.get('ok'):
+                scores.extend(reply['scores'])
+                identity = reply.get('model_identity')
+            else:
+                errors.append(reply)
+
+        for start in range(0, len(pixels), self.slots):
+            if in_flight == RING_DEPTH:
+                collect()
+                in_flight -= 1
+            chunk = pixels[start:start + self.slots]
+            segment = self.cursor
+            self.cursor = (self.cursor + 1) % RING_DEPTH
+            view = np.ndarray(chunk.shape, dtype=np.uint8, buffer=self.memory.buf,
+                              offset=segment * self.segment_bytes)
+            view[...] = chunk
+            del view
+            send_message(self.sock, {'op': 'predict', 'segment': segment, 'count': len(chunk)})
+            in_flight += 1
+        while in_flight:
+            collect()
+            in_flight -= 1
+
+        # Replies are drained even after an error so the stream stays in sync
+        if errors:
+            error = errors[0]
+            raise (_StaleRing if error.get('stale') else RuntimeError)(error['error'])
+        return scores, identity
+
+    def close(self):
+        if self.memory is not None:
+            _close(self.memory)
+            self.memory = None
+        self.sock.close()
+
+
+class _StaleRing(RuntimeError):
+    pass
+
+
+class _RemoteModel:
+    """
+    The daemon's model as the client sees it. Never modified once built:
+    a new description replaces the old one in a single assignment.
+    """
+
+    __slots__ = ('model', 'model_path', 'class_indices', 'preprocess_plan', 'identity')
+
+    def __init__(self, model=None, model_path=None, class_indices=None, preprocess_plan=None, identity=None):
+        self.model = model
+        self.model_path = model_path
+        self.class_indices = class_indices
+        self.preprocess_plan = preprocess_plan or PreprocessPlan()
+        self.identity = identity
+
+    @classmethod
+    def from_description(cls, description):
+        """Build from a hello/load reply"""
+        plan = PreprocessPlan(**description['plan'])
+        model = None
+        if description.get('model_loaded'):
+            width, height = plan.target_size
+            model = SimpleNamespace(
+                name=description.get('model_name'),
+                input_shape=(None, height, width, plan.channels),
+                layers=[],
+            )
+        return cls(model, description.get('model_path'), description.get('class_indices'), plan,
+                   description.get('model_identity'))
+
+    def replace(self, **changes):
+        """Copy with some attributes changed"""
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values.update(changes)
+        return type(self)(**values)
+
+
+# The description a request started with; every step of that request
+# (cache key, preprocessing, labels) reads this one instead of the latest
+_request_model = contextvars.ContextVar('inference_client_model', default=None)
+
+
+def _remote_attribute(name, doc):
+    def getter(self):
+        return getattr(self._remote_model, name)
+
+    def setter(self, value):
+        self._current = self._current.replace(**{name: value})
+    return property(getter, setter, doc=doc)
+
+
+class InferenceClient(PlantDiseaseDetector):
+    """
+    Detector proxy that runs the model in the inference daemon
+
+    Has the detector's `predict` / `predict_batch` API: decoding, resizing
+    and the prediction caches run here, the forward pass in the daemon.
+    Each thread keeps its own connection and ring.
+
+    The daemon's model description (`model`, `class_indices`,
+    `preprocess_plan`, ...) is one immutable `_RemoteModel`, swapped whole
+    when the daemon reports a change and read once per request.
+    """
+
+    is_remote = True
+    _current = _RemoteModel()
+
+    model = _remote_attribute('model', "Stand-in for the daemon's model (None if it has none)")
+    model_path = _remote_attribute('model_path', "Path of the daemon's model")
+    class_indices = _remote_attribute('class_indices', "The daemon's class map")
+    preprocess_plan = _remote_attribute('preprocess_plan', "The daemon's preprocessing plan")
+
+    def __init__(self, socket_path, slots=DEFAULT_SLOTS, timeout=None):
+        """
+        Args:
+            socket_path: Unix socket of `run_inference_server`
+            slots: Images per ring segment (each connection has RING_DEPTH)
+            timeout: Socket timeout in seconds (None = block)
+        """
+        super().__init__()
+        self.socket_path = socket_path
+        self.ring_slots = slots
+        self.timeout = timeout
+        self._local = threading.local()
+
+    @property
+    def _remote_model(self):
+        # The request's description, or the latest outside of a request
+        return _request_model.get() or self._current
+
+    @property
+    def image_size(self):
+        return self._remote_model.preprocess_plan.target_size
+
+    @image_size.setter
+    def image_size(self, value):
+        pass  # Always the daemon plan's target size
+
+    @property
+    def model_identity(self):
+        """Identity of the daemon's model, as reported at the last exchange"""
+        return self._remote_model.identity
+
+    def predict(self, image_path):
+        token = _request_model.set(self._current)
+        try:
+            return super().predict(image_path)
+        finally:
+            _request_model.reset(token)
+
+    def predict_batch(self, image_paths, max_batch_size=None):
+        # Decode threads read the latest plan; a changed geometry makes the
+        # ring refuse the chunk rather than mislabel it
+        token = _request_model.set(self._current)
+        try:
+            return super().predict_batch(image_paths, max_batch_size)
+        finally:
+            _request_model.reset(token)
+
+    def connect(self):
+        """
+        Connect this thread to the daemon and pick up its model description
+
+        Returns:
+            bool: True if the daemon has a model loaded
+        """
+        try:
+            self._connection()
+        except OSError as e:
+            print(f"Inference daemon not reachable at {self.socket_path}: {str(e)}")
+            return False
+        return self.model is not None
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = _ClientConnection(self.socket_path, self.ring_slots, self.timeout)
+            try:
+                self._apply(connection.hello())
+            except Exception:
+                connection.close()
+                raise
+            self._local.connection = connection
+        return connection
+
+    def _apply(self, description):
+        """Mirror the daemon's model description locally, in one assignment"""
+        self._current = _RemoteModel.from_description(description)
+        return self._current
+
+    def load_model(self, model_path):
+        """Ask the daemon to load `model_path` (no-op if it already serves it)"""
+        return self._load_remote(model_path=os.path.abspath(model_path))
+
+    def load_class_indices(self, json_path):
+        """Ask the daemon to load a class indices file"""
+        self._load_remote(class_indices_path=os.path.abspath(json_path))
+
+    def _load_remote(self, **paths):
+        try:
+            connection = self._connection()
+            description = connection.request({'op': 'load', **paths})
+            if not description.get('ok'):
+                raise RuntimeError(description.get('error'))
+            connection.attach(description)
+            self._apply(description)
+            return self.model is not None
+        except Exception as e:
+            print(f"Error loading model in inference daemon: {str(e)}")
+            return False
+
+    def remote_stats(self):
+        """Batching statistics of the daemon, or None if it is unreachable"""
+        try:
+            return self._connection().request({'op': 'stats'})
+        except OSError:
+            return None
+
+    @property
+    def _resize_single_images(self):
+        # Every image crosses a fixed-size ring slot
+        return True
+
+    def preprocess_image(self, image_path, resize=True):
+        """
+        Decode and resize only; the daemon normalizes. Images are always
+        resized, whatever `resize` says, to fit the ring's slots.
+
+        Returns:
+            np.array: uint8 array of shape (1, H, W, C), or None on failure
+        """
+        try:
+            image = self.open_image(image_path)
+            return self.preprocess_plan.load_pixels(image, draft=self.jpeg_draft)[None]
+        except Exception as e:
+            print(f"Error preprocessing image: {str(e)}")
+            return None
+
+    def _run_model(self, batch):
+        """Run a uint8 batch through the daemon's model"""
+        connection = self._connection()
+        batch = np.ascontiguousarray(batch, dtype=np.uint8)
+        try:
+            scores, identity = connection.run(batch)
+        except _StaleRing:
+            self._apply(connection.hello())
+            raise RuntimeError("The daemon switched models; please retry")
+        except OSError:
+            # Daemon restarted: reconnect on the next call
+            self._local.connection = None
+            connection.close()
+            raise
+        if identity != self._remote_model.identity:
+            current = self._apply(connection.hello())
+            if _request_model.get() is not None:
+                # Label these scores with the model that produced them
+                _request_model.set(current)
+        return np.asarray(scores, dtype=np.float32)
+
+    def _build_compiled_functions(self):
+        # The daemon compiles its own graphs
+        return {}
+
+    def reset_after_fork(self):
+        """Forget the parent's connections (the parent keeps using them)"""
+        super().reset_after_fork()
+        self._local = threading.local()
@@ -0,0 +1,226 @@
+"""
+Management command to benchmark end-to-end inference.
+Measures cold model load, the first prediction, p50/p95/p99 latency and
+throughput per batch size and peak RSS, on reproducible synthetic JPEGs or
+the images in media/. Results can be written to JSON and compared with a
+stored baseline; the command exits non-zero when a metric regresses by more
+than --tolerance, so it can gate CI or a deploy.
+"""
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+import io
+import os
+import glob
+import json
+import time
+import numpy as np
+from PIL import Image
+from core.ml_model import PlantDiseaseDetector
+from core.resources import peak_rss_mb, rss_mb
+from core.thread_tuning import machine_fingerprint
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+# Metrics compared against a baseline, and whether higher is better
+LOWER_IS_BETTER = ('cold_load_s', 'first_prediction_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'peak_rss_mb')
+HIGHER_IS_BETTER = ('images_per_sec',)
+
+
+def synthetic_images(count, width, height, seed=0):
+    """
+    Reproducible leaf-sized JPEGs: smooth colour gradients plus noise, so
+    they decode and compress like photos rather than flat squares
+
+    Returns:
+        list: JPEG bytes
+    """
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    images = []
+    for _ in range(count):
+        base = rng.uniform(0, 255, size=3)
+        slope = rng.uniform(-0.3, 0.3, size=(3, 2))
+        pixels = np.stack([base[c] + slope[c, 0] * x + slope[c, 1] * y for c in range(3)], axis=-1)
+        pixels += rng.normal(0, 12, size=pixels.shape)
+        buffer = io.BytesIO()
+        Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(buffer, format='JPEG', quality=90)
+        images.append(buffer.getvalue())
+    return images
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    """
+    Metrics that got worse than `baseline` by more than `tolerance`
+
+    Args:
+        results: Report from this run
+        baseline: Report from an earlier run
+        tolerance: Allowed relative change (0.1 = 10%)
+
+    Returns:
+        list: (metric, baseline value, current value, relative change) per regression
+    """
+    def flatten(report):
+        metrics = {key: report.get(key) for key in ('cold_load_s', 'first_prediction_ms', 'peak_rss_mb')}
+        for batch_size, row in report.get('batch_sizes', {}).items():
+            for key in ('p50_ms', 'p95_ms', 'p99_ms', 'images_per_sec'):
+                metrics[f'batch_{batch_size}.{key}'] = row.get(key)
+        return metrics
+
+    current, previous = flatten(results), flatten(baseline)
+    regressions = []
+    for metric, old in previous.items():
+        new = current.get(metric)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        worse = -change if metric.rsplit('.', 1)[-1] in HIGHER_IS_BETTER else change
+        if worse > tolerance:
+            regressions.append((metric, old, new, change))
+    return regressions
+
+
+class Command(BaseCommand):
+    help = 'Benchmark load time, latency percentiles, throughput and memory; optionally check against a baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model-path', help='Model to benchmark (default: the one CoreConfig would preload)')
+        parser.add_argument('--images', choices=('synthetic', 'media'), default='synthetic',
+                            help='Reproducible synthetic JPEGs (default) or the images in media/')
+        parser.add_argument('--samples', type=int, default=16, help='Number of distinct images')
+        parser.add_argument('--image-size', default='640x480', help='Synthetic image size, WxH')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for the synthetic images')
+        parser.add_argument('--batch-sizes',
+                            help='Comma-separated batch sizes (default: 1 plus PREDICT_BATCH_BUCKETS)')
+        parser.add_argument('--repeats', type=int, default=20, help='Timed calls per batch size')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--baseline', help='Compare with the results JSON of an earlier run')
+        parser.add_argument('--tolerance', type=float, default=0.15,
+                            help='Relative slowdown allowed before a metric counts as a regression (default: 0.15)')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        config = apps.get_app_config('core')
+        model_path, class_indices_path = options['model_path'], None
+        if not model_path:
+            found = config.find_model()
+            if found is None:
+                raise CommandError('No model found in models/; pass --model-path')
+            _label, model_path, class_indices_path = found
+        if options['batch_sizes']:
+            batch_sizes = sorted({int(b) for b in options['batch_sizes'].split(',') if b.strip()})
+        else:
+            batch_sizes = sorted({1, *getattr(settings, 'PREDICT_BATCH_BUCKETS', [])})
+        images = self._images(options)
+
+        # Deployed thread / decode settings, but no caches: every image really runs
+        detector = PlantDiseaseDetector()
+        config.configure_detector(detector)
+        detector.cache = None
+        detector.near_duplicates = None
+        detector.disable_batching()
+
+        rss_before = rss_mb()
+        started = time.perf_counter()
+        if not detector.load_model(model_path):
+            raise CommandError(f'Could not load {model_path}')
+        cold_load_s = time.perf_counter() - started
+        if class_indices_path and os.path.exists(class_indices_path):
+            detector.load_class_indices(class_indices_path)
+        rss_loaded = rss_mb()
+
+        started = time.perf_counter()
+        detector.predict(images[0])
+        first_prediction_ms = (time.perf_counter() - started) * 1000.0
+
+        rows = {}
+        for batch_size in batch_sizes:
+            batch = [images[i % len(images)] for i in range(batch_size)]
+            detector.predict_batch(batch, max_batch_size=batch_size)  # untimed: new input shape
+            timings = []
+            for _ in range(options['repeats']):
+                started = time.perf_counter()
+                detector.predict_batch(batch, max_batch_size=batch_size)
+                timings.append((time.perf_counter() - started) * 1000.0)
+            timings = np.array(timings)
+            rows[str(batch_size)] = {
+                'p50_ms': float(np.percentile(timings, 50)),
+                'p95_ms': float(np.percentile(timings, 95)),
+                'p99_ms': float(np.percentile(timings, 99)),
+                'images_per_sec': float(batch_size * 1000.0 / np.median(timings)),
+            }
+        detector.disable_batching()
+
+        results = {
+            'model': os.path.basename(model_path),
+            'model_identity': detector.model_identity,
+            'machine': machine_fingerprint(),
+            'images': options['images'],
+            'samples': len(images),
+            'repeats': options['repeats'],
+            'cold_load_s': cold_load_s,
+            'first_prediction_ms': first_prediction_ms,
+            'model_rss_mb': rss_loaded - rss_before if rss_before is not None and rss_loaded is not None else None,
+            'peak_rss_mb': peak_rss_mb(),
+            'batch_sizes': rows,
+            'measured_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        }
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            self._print(results)
+        if options['output']:
+            os.makedirs(os.path.dirname(os.path.abspath(options['output'])), exist_ok=True)
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Wrote {options['output']}")
+        if options['baseline']:
+            self._check_baseline(results, options['baseline'], options['tolerance'])
+
+    def _images(self, options):
+        if options['images'] == 'synthetic':
+            try:
+                width, height = (int(v) for v in options['image_size'].lower().split('x'))
+            except ValueError:
+                raise CommandError(f"--image-size must look like 640x480, not {options['image_size']}")
+            return synthetic_images(options['samples'], width, height, options['seed'])
+        files = sorted(
+            path for path in glob.glob(os.path.join(settings.MEDIA_ROOT, '**', '*'), recursive=True)
+            if path.lower().endswith(IMAGE_EXTENSIONS)
+        )[:options['samples']]
+        if not files:
+            raise CommandError(f'No images in {settings.MEDIA_ROOT}')
+        images = []
+        for path in files:
+            with open(path, 'rb') as f:
+                images.append(f.read())
+        return images
+
+    def _print(self, results):
+        self.stdout.write(f"{results['model']} ({results['model_identity']}) on {results['machine']}")
+        self.stdout.write(f"cold load {results['cold_load_s']:.2f} s, first prediction "
+                          f"{results['first_prediction_ms']:.1f} ms, peak RSS {results['peak_rss_mb'] or 0:.0f} MB")
+        self.stdout.write(f"{'batch':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'images/s':>10}")
+        for batch_size, row in results['batch_sizes'].items():
+            self.stdout.write(f"{batch_size:>6}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}"
+                              f"{row['p99_ms']:>10.1f}{row['images_per_sec']:>10.1f}")
+
+    def _check_baseline(self, results, path, tolerance):
+        try:
+            with open(path) as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Cannot read baseline {path}: {e}')
+        if baseline.get('machine') != results['machine']:
+            self.stdout.write(self.style.WARNING(
+                f"Baseline was measured on {baseline.get('machine')}; timings may not be comparable"
+            ))
+        regressions = compare_with_baseline(results, baseline, tolerance)
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS(f'No regressions beyond {tolerance:.0%} against {path}'))
+            return
+        for metric, old, new, change in regressions:
+            self.stdout.write(self.style.ERROR(f'{metric}: {old:.2f} -> {new:.2f} ({change:+.1%})'))
+        raise CommandError(f'{len(regressions)} metric(s) regressed beyond {tolerance:.0%} against {path}')
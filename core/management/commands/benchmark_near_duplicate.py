@@ -0,0 +1,153 @@
+"""
+Management command to benchmark the near-duplicate (perceptual hash) cache.
+Builds burst-like variants of the sample images in media/ (re-encoded,
+EXIF-stripped, slightly brighter, slightly cropped), then reports the hit
+rate, the latency saved and whether cached answers match the model's own.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+import io
+import os
+import time
+import json
+from PIL import Image, ImageEnhance
+import numpy as np
+from core.ml_model import ensure_model_loaded, get_detector, initialize_model
+from core.prediction_cache import NearDuplicateIndex, dhash
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+def _encode(image, quality=90):
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+def burst_variants(data):
+    """
+    Simulate a phone burst: the same leaf, re-encoded and slightly changed
+
+    Args:
+        data: Original encoded image bytes
+
+    Returns:
+        list: (name, bytes) pairs, original first
+    """
+    image = Image.open(io.BytesIO(data)).convert('RGB')
+    w, h = image.size
+    dx, dy = max(1, w // 100), max(1, h // 100)
+    return [
+        ('original', data),
+        ('reencoded_q75', _encode(image, quality=75)),
+        ('exif_stripped', _encode(image, quality=95)),
+        ('brighter_4pct', _encode(ImageEnhance.Brightness(image).enhance(1.04))),
+        ('cropped_1pct', _encode(image.crop((dx, dy, w - dx, h - dy)).resize((w, h)))),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the near-duplicate prediction cache on burst variants of media/ images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--media-dir', default=str(settings.MEDIA_ROOT),
+                            help='Directory of sample images (default: MEDIA_ROOT)')
+        parser.add_argument('--model-path', help='Model to load if none is loaded yet')
+        parser.add_argument('--class-indices', help='Class indices JSON for --model-path')
+        parser.add_argument('--max-distance', type=int,
+                            default=getattr(settings, 'PREDICT_NEAR_DUPLICATE_MAX_DISTANCE', 6),
+                            help='Hamming distance threshold (out of 64 bits)')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        if options['model_path']:
+            initialize_model(model_path=options['model_path'], class_indices_path=options['class_indices'])
+            detector = get_detector()
+        else:
+            detector = ensure_model_loaded()
+        if detector.model is None:
+            raise CommandError('Model not loaded; pass --model-path or add a model to models/')
+
+        media_dir = options['media_dir']
+        files = sorted(
+            os.path.join(media_dir, name) for name in os.listdir(media_dir)
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        if not files:
+            raise CommandError(f'No images found in {media_dir}')
+
+        bursts = []
+        for path in files:
+            with open(path, 'rb') as f:
+                bursts.append(burst_variants(f.read()))
+
+        # Warm the model so tracing does not count against the first image
+        detector._predict_model(bursts[0][0][1])
+
+        # Baseline: every shot runs through the model
+        baseline_ms, truth = [], []
+        for burst in bursts:
+            for _, data in burst:
+                started = time.perf_counter()
+                result = detector._predict_model(data)
+                baseline_ms.append((time.perf_counter() - started) * 1000.0)
+                truth.append(result.get('disease'))
+
+        hash_ms = []
+        for burst in bursts:
+            for _, data in burst:
+                started = time.perf_counter()
+                dhash(Image.open(io.BytesIO(data)))
+                hash_ms.append((time.perf_counter() - started) * 1000.0)
+
+        # Near-duplicate layer in front of the model (exact cache off)
+        saved_cache, saved_index = detector.cache, detector.near_duplicates
+        index = NearDuplicateIndex(max_distance=options['max_distance'], max_entries=4096, ttl_seconds=None)
+        detector.cache, detector.near_duplicates = None, index
+        cached_ms, answers = [], []
+        try:
+            for burst in bursts:
+                for _, data in burst:
+                    started = time.perf_counter()
+                    result = detector._predict_uncached(data)
+                    cached_ms.append((time.perf_counter() - started) * 1000.0)
+                    answers.append(result.get('disease'))
+        finally:
+            detector.cache, detector.near_duplicates = saved_cache, saved_index
+
+        # Distinct leaves must not collide: smallest distance between originals
+        originals = [dhash(Image.open(io.BytesIO(burst[0][1]))) for burst in bursts]
+        min_distinct = min(
+            (bin(a ^ b).count('1') for i, a in enumerate(originals) for b in originals[i + 1:]),
+            default=None
+        )
+
+        stats = index.stats()
+        report = {
+            'images': len(bursts),
+            'requests': len(baseline_ms),
+            'max_distance': options['max_distance'],
+            'hit_rate': stats['hits'] / len(baseline_ms),
+            'expected_hit_rate': (len(baseline_ms) - len(bursts)) / len(baseline_ms),
+            'mean_hit_distance': stats['mean_hit_distance'],
+            'min_distance_between_distinct_images': min_distinct,
+            'top1_agreement': float(np.mean([a == t for a, t in zip(answers, truth)])),
+            'dhash_ms_mean': float(np.mean(hash_ms)),
+            'baseline_ms_mean': float(np.mean(baseline_ms)),
+            'near_duplicate_ms_mean': float(np.mean(cached_ms)),
+            'latency_saved_pct': 100.0 * (1.0 - float(np.sum(cached_ms)) / float(np.sum(baseline_ms))),
+        }
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(f"Images: {report['images']} originals, {report['requests']} requests (bursts of 5)")
+        self.stdout.write(f"Hit rate: {report['hit_rate']:.1%} (ideal {report['expected_hit_rate']:.1%}), "
+                          f"mean hit distance {report['mean_hit_distance']:.2f} bits")
+        self.stdout.write(f"Closest distinct originals: {min_distinct} bits (threshold {options['max_distance']})")
+        self.stdout.write(f"Top-1 agreement with uncached model: {report['top1_agreement']:.1%}")
+        self.stdout.write(f"dHash cost: {report['dhash_ms_mean']:.2f} ms/image")
+        self.stdout.write(f"Mean latency: {report['baseline_ms_mean']:.2f} ms -> "
+                          f"{report['near_duplicate_ms_mean']:.2f} ms")
+        self.stdout.write(self.style.SUCCESS(f"Latency saved: {report['latency_saved_pct']:.1f}%"))
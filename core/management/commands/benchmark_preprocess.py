@@ -0,0 +1,115 @@
+"""
+Management command to benchmark image decode + preprocessing.
+Compares the previous per-call path (full JPEG decode, layer scan, float
+division) with the load-time preprocessing plan and JPEG draft decoding on
+the sample JPEGs in media/, optionally upscaled to phone-camera resolution.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+import io
+import os
+import time
+import json
+from PIL import Image
+import numpy as np
+from core.ml_model import PreprocessPlan
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg')
+
+
+def legacy_preprocess(data, target_size):
+    """The pre-plan hot path: full decode, convert, resize, float copy, divide"""
+    image = Image.open(io.BytesIO(data))
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    image = image.resize(target_size)
+    image_array = np.array(image).astype('float32')
+    image_array = image_array / 255.0
+    return np.expand_dims(image_array, axis=0)
+
+
+def _time_ms(fn, samples, repeats):
+    timings = []
+    for _ in range(repeats):
+        for sample in samples:
+            started = time.perf_counter()
+            fn(sample)
+            timings.append((time.perf_counter() - started) * 1000.0)
+    return np.array(timings)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark decode + preprocess time on media/ JPEGs (plan + draft mode vs. the old path)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--media-dir', default=str(settings.MEDIA_ROOT))
+        parser.add_argument('--size', type=int, default=224, help='Model input size (square)')
+        parser.add_argument('--upscale', default='256,1600,4000',
+                            help='Comma-separated long-edge sizes to re-encode the samples at '
+                                 '(mimics phone photos; the native size is always included)')
+        parser.add_argument('--repeats', type=int, default=5)
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        media_dir = options['media_dir']
+        files = sorted(
+            os.path.join(media_dir, name) for name in os.listdir(media_dir)
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        if not files:
+            raise CommandError(f'No JPEG images found in {media_dir}')
+
+        originals = []
+        for path in files:
+            with open(path, 'rb') as f:
+                originals.append(f.read())
+
+        target = (options['size'], options['size'])
+        plan = PreprocessPlan(target_size=target)
+        rows = []
+        for long_edge in sorted({int(s) for s in options['upscale'].split(',') if s.strip()}):
+            samples = [self._reencode(data, long_edge) for data in originals]
+            width, height = Image.open(io.BytesIO(samples[0])).size
+
+            legacy = _time_ms(lambda d: legacy_preprocess(d, target), samples, options['repeats'])
+            planned = _time_ms(lambda d: plan.apply(Image.open(io.BytesIO(d)), draft=False),
+                               samples, options['repeats'])
+            drafted = _time_ms(lambda d: plan.apply(Image.open(io.BytesIO(d)), draft=True),
+                               samples, options['repeats'])
+
+            # How far draft decoding moves the pixels the model sees
+            diffs = [
+                np.abs(plan.apply(Image.open(io.BytesIO(d)), draft=True)
+                       - legacy_preprocess(d, target)).mean() * 255.0
+                for d in samples
+            ]
+            rows.append({
+                'source_size': f'{width}x{height}',
+                'legacy_ms': float(np.median(legacy)),
+                'plan_ms': float(np.median(planned)),
+                'plan_draft_ms': float(np.median(drafted)),
+                'speedup': float(np.median(legacy) / np.median(drafted)),
+                'mean_abs_pixel_diff': float(np.mean(diffs)),
+            })
+
+        if options['json']:
+            self.stdout.write(json.dumps({'images': len(files), 'target_size': target, 'results': rows}, indent=2))
+            return
+
+        self.stdout.write(f'{len(files)} images -> {target[0]}x{target[1]}, median ms per image')
+        self.stdout.write(f"{'source':>12}{'legacy':>10}{'plan':>10}{'plan+draft':>12}{'speedup':>9}{'|diff| /255':>13}")
+        for row in rows:
+            self.stdout.write(
+                f"{row['source_size']:>12}{row['legacy_ms']:>10.2f}{row['plan_ms']:>10.2f}"
+                f"{row['plan_draft_ms']:>12.2f}{row['speedup']:>8.1f}x{row['mean_abs_pixel_diff']:>13.2f}"
+            )
+
+    @staticmethod
+    def _reencode(data, long_edge):
+        image = Image.open(io.BytesIO(data)).convert('RGB')
+        scale = long_edge / max(image.size)
+        if abs(scale - 1.0) > 1e-6:
+            image = image.resize((round(image.width * scale), round(image.height * scale)), Image.BICUBIC)
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=92)
+        return buffer.getvalue()
@@ -0,0 +1,108 @@
+"""
+Management command to compare the resolution speed tiers of a model.
+Runs held-out images through the model each tier resolves to (see
+core.resolution_tiers) one at a time and reports p50/p95 latency, the
+speedup over the accurate tier and top-1 agreement with it.
+"""
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+import os
+import glob
+import json
+import time
+import numpy as np
+from core.ml_model import PlantDiseaseDetector
+from core.model_registry import ModelRegistry
+from core.resolution_tiers import parse_tiers, select_tier
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+class Command(BaseCommand):
+    help = 'Report latency and top-1 agreement of every resolution speed tier on held-out images'
+
+    def add_arguments(self, parser):
+        default_dir = os.path.join(settings.BASE_DIR, 'PlantVillage', 'test')
+        parser.add_argument('--model', default='efficientnetb0', help='Registry name of the model (default: efficientnetb0)')
+        parser.add_argument('--data-dir', default=default_dir if os.path.isdir(default_dir) else str(settings.MEDIA_ROOT),
+                            help='Held-out images, searched recursively (default: PlantVillage/test)')
+        parser.add_argument('--samples', type=int, default=100, help='Most images to use (0 = all)')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        config = apps.get_app_config('core')
+        registry = ModelRegistry()
+        config.register_models(registry)
+        if registry.spec(options['model']) is None:
+            raise CommandError(f"Model {options['model']} not found in models/")
+
+        files = sorted(
+            path for path in glob.glob(os.path.join(options['data_dir'], '**', '*'), recursive=True)
+            if path.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        if options['samples']:
+            files = files[::max(1, len(files) // options['samples'])][:options['samples']]
+        if not files:
+            raise CommandError(f"No images in {options['data_dir']}")
+        images = []
+        for path in files:
+            with open(path, 'rb') as f:
+                images.append(f.read())
+
+        # Tiers resolving to the same variant are measured once
+        tier_sizes = parse_tiers(settings.PREDICT_RESOLUTION_TIERS)
+        tiers = {tier: select_tier(registry, options['model'], tier, tier_sizes) for tier in tier_sizes}
+        measured = {}
+        for name in dict.fromkeys(tiers.values()):
+            self.stdout.write(f'Measuring {name}...')
+            measured[name] = self._measure(config, registry.spec(name), images)
+
+        reference = measured[options['model']]
+        report = {'model': options['model'], 'images': len(images), 'tiers': []}
+        for tier, name in tiers.items():
+            top1, latencies, input_size = measured[name]
+            report['tiers'].append({
+                'tier': tier,
+                'model': name,
+                'input_size': input_size,
+                'p50_ms': float(np.median(latencies)),
+                'p95_ms': float(np.percentile(latencies, 95)),
+                'speedup': float(np.median(reference[1]) / np.median(latencies)),
+                'top1_agreement': float(np.mean(top1 == reference[0])),
+            })
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.stdout.write(f"{len(images)} images from {options['data_dir']}")
+        self.stdout.write(f"{'tier':<10}{'model':<22}{'input':>7}{'p50 ms':>9}{'p95 ms':>9}{'speedup':>9}{'agreement':>11}")
+        for row in report['tiers']:
+            self.stdout.write(f"{row['tier']:<10}{row['model']:<22}{row['input_size']:>7}{row['p50_ms']:>9.1f}"
+                              f"{row['p95_ms']:>9.1f}{row['speedup']:>8.2f}x{row['top1_agreement']:>11.1%}")
+        if len(set(tiers.values())) == 1:
+            self.stdout.write(self.style.WARNING(
+                f"Every tier uses {options['model']}; run `python manage.py export_resolution_variants` first"
+            ))
+
+    def _measure(self, config, spec, images):
+        # Deployed thread / decode settings, but no caches: every image really runs
+        model_path, class_indices_path = spec
+        detector = PlantDiseaseDetector()
+        config.configure_detector(detector)
+        detector.cache = None
+        detector.near_duplicates = None
+        detector.disable_batching()
+        if not detector.load_model(model_path):
+            raise CommandError(f'Could not load {model_path}')
+        detector.load_class_indices(class_indices_path)
+
+        detector.predict(images[0])  # untimed: the first call traces / allocates
+        top1, latencies = [], []
+        for data in images:
+            started = time.perf_counter()
+            result = detector.predict(data)
+            latencies.append((time.perf_counter() - started) * 1000.0)
+            top1.append(int(np.argmax(result['all_predictions']['confidence_scores'])) if 'error' not in result else -1)
+        detector.disable_batching()
+        return np.array(top1), np.array(latencies), detector.image_size[0]
@@ -0,0 +1,60 @@
+"""
+Management command to export a sequential Keras model (the cnn_simple model
+by default) to a flat .npz file for the TensorFlow-free NumPy engine, and
+check the exported model against Keras on sample images.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+import os
+import glob
+import numpy as np
+from core.ml_model import PlantDiseaseDetector
+from core.numpy_engine import NumpyModel, export_keras_model
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+class Command(BaseCommand):
+    help = 'Export a sequential Keras model to .npz for the NumPy inference engine'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', default=os.path.join(settings.BASE_DIR, 'models', 'plant_disease_model_cnn_simple.keras'),
+                            help='Keras model to export (default: models/plant_disease_model_cnn_simple.keras)')
+        parser.add_argument('--output', help='Destination .npz (default: next to the model)')
+        parser.add_argument('--float16', action='store_true', help='Store weights as float16')
+        parser.add_argument('--check-dir', default=str(settings.MEDIA_ROOT),
+                            help='Images used to compare the export with Keras')
+
+    def handle(self, *args, **options):
+        model_path = options['model']
+        if not os.path.exists(model_path):
+            raise CommandError(f'Model file not found: {model_path}')
+        output_path = options['output'] or os.path.splitext(model_path)[0] + '.npz'
+
+        detector = PlantDiseaseDetector()
+        if not detector.load_model(model_path):
+            raise CommandError(f'Could not load {model_path}')
+
+        try:
+            spec = export_keras_model(detector.model, output_path, float16=options['float16'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        size_mb = os.path.getsize(output_path) / (1024.0 * 1024.0)
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {output_path} ({len(spec['layers'])} layers, {size_mb:.1f} MB)"
+        ))
+
+        files = sorted(
+            path for path in glob.glob(os.path.join(options['check_dir'], '*'))
+            if path.lower().endswith(IMAGE_EXTENSIONS)
+        )[:32]
+        batches = [b for b in map(detector.preprocess_image, files) if b is not None]
+        if not batches:
+            return
+
+        batch = np.concatenate(batches, axis=0)
+        expected = detector.model.predict(batch, verbose=0)
+        actual = NumpyModel(output_path).predict(batch)
+        max_diff = float(np.max(np.abs(expected - actual)))
+        agreement = float(np.mean(np.argmax(expected, axis=1) == np.argmax(actual, axis=1)))
+        self.stdout.write(f'Parity on {len(batch)} images: max |diff| {max_diff:.2e}, top-1 agreement {agreement:.1%}')
@@ -0,0 +1,60 @@
+"""
+Management command to save lower-resolution variants of the Keras models.
+Each variant keeps the model's weights with a smaller input layer and is
+written next to it as <model>_<size>px.keras, where CoreConfig registers it
+as '<name>@<size>' for the resolution speed tiers (see core.resolution_tiers).
+Only fully convolutional models with global pooling (EfficientNetB0) can be
+re-resolved; a model that flattens into Dense layers needs a retrained variant.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+import os
+import re
+import glob
+from core.resolution_tiers import build_resolution_variant, parse_tiers, variant_path
+
+
+class Command(BaseCommand):
+    help = 'Save lower input-resolution variants of the Keras models for the speed tiers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', action='append', dest='models',
+                            help='Keras model to export (repeatable; default: every .keras/.h5 in models/)')
+        parser.add_argument('--sizes',
+                            help='Comma-separated input sizes (default: the sizes in PREDICT_RESOLUTION_TIERS)')
+
+    def handle(self, *args, **options):
+        if options['sizes']:
+            sizes = sorted({int(s) for s in options['sizes'].split(',') if s.strip()})
+        else:
+            sizes = sorted({s for s in parse_tiers(settings.PREDICT_RESOLUTION_TIERS).values() if s})
+        if not sizes:
+            raise CommandError('No sizes to export; pass --sizes')
+
+        models_dir = os.path.join(settings.BASE_DIR, 'models')
+        model_paths = options['models'] or sorted(
+            path for path in glob.glob(os.path.join(models_dir, '*.keras')) + glob.glob(os.path.join(models_dir, '*.h5'))
+            if not re.search(r'_\d+px\.keras$', path)
+        )
+        if not model_paths:
+            raise CommandError(f'No .keras or .h5 models found in {models_dir}')
+
+        from tensorflow import keras
+        for model_path in model_paths:
+            model = keras.models.load_model(model_path, compile=False)
+            native = model.input_shape[1]
+            for size in sizes:
+                if size >= native:
+                    self.stdout.write(f'{os.path.basename(model_path)}: {size}px is not below native {native}px, skipping')
+                    continue
+                try:
+                    variant = build_resolution_variant(model, size)
+                except ValueError as e:
+                    self.stdout.write(self.style.WARNING(f'{os.path.basename(model_path)}: {e}'))
+                    break
+                output = variant_path(model_path, size)
+                variant.save(output)
+                self.stdout.write(self.style.SUCCESS(
+                    f'{os.path.basename(model_path)} -> {output} '
+                    f'({os.path.getsize(output) / 1024 / 1024:.1f} MB, ~{(size / native) ** 2:.0%} of the compute)'
+                ))
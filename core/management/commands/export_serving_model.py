@@ -0,0 +1,99 @@
+"""
+Management command to build uint8 serving graphs for the models in models/.
+Each model is wrapped with in-graph Resizing/Rescaling layers and saved as
+<model>_serving.keras; the command then checks the serving graph against
+the original on sample images and compares host-side preprocessing cost.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+import io
+import os
+import glob
+import time
+import tracemalloc
+import numpy as np
+from PIL import Image
+from core.ml_model import PlantDiseaseDetector
+from core.serving_graph import build_serving_model, serving_path
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+def _host_cost(detector, samples):
+    """Median ms and peak bytes allocated by preprocess_image per sample"""
+    timings, peaks = [], []
+    for data in samples:
+        tracemalloc.start()
+        started = time.perf_counter()
+        detector.preprocess_image(data)
+        timings.append((time.perf_counter() - started) * 1000.0)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return float(np.median(timings)), int(np.median(peaks))
+
+
+class Command(BaseCommand):
+    help = 'Wrap models with in-graph resize + rescale so they accept raw uint8 images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', action='append', dest='models',
+                            help='Keras model to wrap (repeatable; default: every .keras/.h5 in models/)')
+        parser.add_argument('--check-dir', default=str(settings.MEDIA_ROOT),
+                            help='Images used to compare the serving graph with the original')
+
+    def handle(self, *args, **options):
+        models_dir = os.path.join(settings.BASE_DIR, 'models')
+        model_paths = options['models'] or sorted(
+            path for path in glob.glob(os.path.join(models_dir, '*.keras')) + glob.glob(os.path.join(models_dir, '*.h5'))
+            if not path.endswith('_serving.keras')
+        )
+        if not model_paths:
+            raise CommandError(f'No .keras or .h5 models found in {models_dir}')
+
+        files = sorted(
+            path for path in glob.glob(os.path.join(options['check_dir'], '*'))
+            if path.lower().endswith(IMAGE_EXTENSIONS)
+        )[:32]
+        samples = []
+        for path in files:
+            with open(path, 'rb') as f:
+                samples.append(f.read())
+
+        for model_path in model_paths:
+            detector = PlantDiseaseDetector()
+            if not detector.load_model(model_path):
+                self.stdout.write(self.style.ERROR(f'Could not load {model_path}, skipping'))
+                continue
+
+            try:
+                serving = build_serving_model(detector.model, detector.preprocess_plan)
+            except ValueError as e:
+                self.stdout.write(self.style.ERROR(f'{model_path}: {e}'))
+                continue
+            output_path = serving_path(model_path)
+            serving.save(output_path)
+            self.stdout.write(self.style.SUCCESS(f'Wrote {output_path}'))
+
+            if not samples:
+                continue
+            served = PlantDiseaseDetector()
+            served.load_model(output_path)
+
+            float_input = np.concatenate([detector.preprocess_image(d) for d in samples])
+            uint8_input = np.concatenate([served.preprocess_image(d) for d in samples])
+            expected = detector._run_model(float_input)
+            actual = served._run_model(uint8_input)
+            max_diff = float(np.max(np.abs(expected - actual)))
+            agreement = float(np.mean(expected.argmax(axis=1) == actual.argmax(axis=1)))
+
+            # Raw, full-size images straight into the graph (no host resize at all)
+            raw = np.asarray(Image.open(io.BytesIO(samples[0])).convert('RGB'))[None]
+            raw_top1 = int(served._run_model(raw).argmax())
+
+            float_ms, float_bytes = _host_cost(detector, samples)
+            uint8_ms, uint8_bytes = _host_cost(served, samples)
+            self.stdout.write(f'  parity on {len(samples)} images: max |diff| {max_diff:.2e}, '
+                              f'top-1 agreement {agreement:.1%}')
+            self.stdout.write(f'  raw {raw.shape[2]}x{raw.shape[1]} input accepted, top-1 class {raw_top1}')
+            self.stdout.write(f'  host preprocessing: float32 {float_ms:.2f} ms / {float_bytes / 1024:.0f} KiB peak, '
+                              f'uint8 {uint8_ms:.2f} ms / {uint8_bytes / 1024:.0f} KiB peak')
@@ -0,0 +1,128 @@
+"""
+Management command to convert the Keras models in models/ to TensorFlow Lite.
+Writes float16 and int8 (post-training quantized, calibrated on sample
+images) variants next to each model and reports size, RSS, latency and
+top-1 agreement of every variant against the Keras model.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+import os
+import glob
+import json
+import multiprocessing
+import numpy as np
+from core.ml_model import PlantDiseaseDetector
+from core.tflite_backend import (
+    QUANTIZATION_MODES, convert_model, measure_variant, tflite_path, write_metadata
+)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+def _image_files(directory, limit):
+    files = sorted(
+        path for path in glob.glob(os.path.join(directory, '**', '*'), recursive=True)
+        if path.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    return files[:limit] if limit else files
+
+
+class Command(BaseCommand):
+    help = 'Export models/ to TFLite (float16 / int8) and compare the variants with Keras'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', action='append', dest='models',
+                            help='Keras model to convert (repeatable; default: every .keras/.h5 in models/)')
+        parser.add_argument('--modes', default='float16,int8',
+                            help=f'Comma-separated quantization modes from {QUANTIZATION_MODES}')
+        parser.add_argument('--calibration-dir', default=str(settings.MEDIA_ROOT),
+                            help='Images used to calibrate int8 activation ranges')
+        parser.add_argument('--calibration-samples', type=int, default=200,
+                            help='Maximum number of calibration images')
+        parser.add_argument('--eval-dir', default=str(settings.MEDIA_ROOT),
+                            help='Images used for the latency/agreement report')
+        parser.add_argument('--eval-samples', type=int, default=50)
+        parser.add_argument('--no-report', action='store_true', help='Only convert, skip the comparison')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        modes = [m.strip() for m in options['modes'].split(',') if m.strip()]
+        unknown = set(modes) - set(QUANTIZATION_MODES)
+        if unknown:
+            raise CommandError(f"Unknown quantization modes: {', '.join(sorted(unknown))}")
+
+        models_dir = os.path.join(settings.BASE_DIR, 'models')
+        model_paths = options['models'] or sorted(
+            glob.glob(os.path.join(models_dir, '*.keras')) + glob.glob(os.path.join(models_dir, '*.h5'))
+        )
+        if not model_paths:
+            raise CommandError(f'No .keras or .h5 models found in {models_dir}')
+
+        calibration_files = _image_files(options['calibration_dir'], options['calibration_samples'])
+        eval_files = _image_files(options['eval_dir'], options['eval_samples'])
+        if 'int8' in modes and not calibration_files:
+            raise CommandError(f"No calibration images in {options['calibration_dir']}")
+
+        reports = []
+        for model_path in model_paths:
+            self.stdout.write(f'Converting {model_path}...')
+            detector = PlantDiseaseDetector()
+            if not detector.load_model(model_path):
+                self.stdout.write(self.style.ERROR(f'Could not load {model_path}, skipping'))
+                continue
+
+            # Calibrate on images preprocessed exactly the way they are served
+            calibration = [b for b in map(detector.preprocess_image, calibration_files) if b is not None]
+            if 'int8' in modes and len(calibration) < 100:
+                self.stdout.write(self.style.WARNING(
+                    f'Only {len(calibration)} calibration images; 100+ gives steadier int8 ranges'
+                ))
+
+            variants = [('keras', model_path)]
+            for mode in modes:
+                output_path = tflite_path(model_path, mode)
+                with open(output_path, 'wb') as f:
+                    f.write(convert_model(detector.model, mode, calibration))
+                write_metadata(output_path, detector.model, mode, model_path)
+                self.stdout.write(self.style.SUCCESS(f'  wrote {output_path}'))
+                variants.append((mode, output_path))
+
+            if not options['no_report'] and eval_files:
+                batches = [b for b in map(detector.preprocess_image, eval_files) if b is not None]
+                reports.append(self._report(model_path, variants, batches))
+
+        if not reports:
+            return
+        if options['json']:
+            self.stdout.write(json.dumps(reports, indent=2))
+            return
+        for report in reports:
+            self.stdout.write(f"\n{report['model']} ({report['images']} images)")
+            self.stdout.write(f"{'variant':<10}{'size MB':>9}{'RSS MB':>9}{'p50 ms':>9}{'p95 ms':>9}{'top-1 agree':>13}")
+            for row in report['variants']:
+                self.stdout.write(
+                    f"{row['variant']:<10}{row['size_mb']:>9.2f}{row['rss_mb']:>9.1f}"
+                    f"{row['latency_ms_p50']:>9.2f}{row['latency_ms_p95']:>9.2f}{row['top1_agreement']:>12.1%}"
+                )
+
+    def _report(self, model_path, variants, batches):
+        # Each variant runs in a fresh process so RSS reflects that variant alone
+        context = multiprocessing.get_context('spawn')
+        rows, reference = [], None
+        for name, path in variants:
+            with context.Pool(1) as pool:
+                measured = pool.apply(measure_variant, (path, batches))
+            if reference is None:
+                reference = measured['top1']
+            latencies = np.array(measured['latency_ms'])
+            rows.append({
+                'variant': name,
+                'path': path,
+                'size_mb': os.path.getsize(path) / (1024.0 * 1024.0),
+                'rss_mb': (measured['rss_mb_after_predict'] or 0.0),
+                'rss_mb_model': (measured['rss_mb_after_predict'] or 0.0) - (measured['rss_mb_before'] or 0.0),
+                'latency_ms_p50': float(np.percentile(latencies, 50)),
+                'latency_ms_p95': float(np.percentile(latencies, 95)),
+                'top1_agreement': float(np.mean([a == b for a, b in zip(measured['top1'], reference)])),
+            })
+        return {'model': model_path, 'images': len(batches), 'variants': rows}
@@ -0,0 +1,227 @@
+"""
+Management command to score a whole directory of leaf images offline.
+Files are streamed through a bounded pipeline - a decode pool working a few
+batches ahead, batched inference on the main thread, and a writer appending
+one JSONL / CSV row per image in directory order - so memory stays flat
+however many images there are. Output is flushed after every batch;
+--resume continues after the last row of a partial output file.
+
+Works on a PlantVillage-style tree (one sub-directory per class; the class
+directory is written next to each prediction) as well as flat dumps.
+"""
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+import os
+import csv
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from core.ml_model import PlantDiseaseDetector
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+CSV_FIELDS = ('path', 'directory', 'predicted_class', 'confidence', 'error')
+
+
+def iter_images(root):
+    """
+    Image files under `root` in a stable order (each directory's files by
+    name, then its sub-directories depth first); a generator, so huge trees
+    are never listed in full
+
+    Yields:
+        str: Path relative to `root`
+    """
+    stack = ['']
+    while stack:
+        relative = stack.pop()
+        with os.scandir(os.path.join(root, relative)) as entries:
+            entries = sorted(entries, key=lambda e: e.name)
+        subdirectories = []
+        for entry in entries:
+            path = os.path.join(relative, entry.name)
+            if entry.is_dir():
+                subdirectories.append(path)
+            elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                yield path
+        stack.extend(reversed(subdirectories))
+
+
+def last_written(output, output_format):
+    """
+    Drop a torn last line left by an interrupted run and return the last
+    complete row's path and the row count
+
+    Returns:
+        tuple: (path or None, rows)
+    """
+    with open(output, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        # Find the end of the last complete line, reading backwards
+        end, position = size, size
+        while position > 0:
+            step = min(65536, position)
+            position -= step
+            f.seek(position)
+            chunk = f.read(step)
+            newline = chunk.rfind(b'\n')
+            if newline != -1:
+                end = position + newline + 1
+                break
+        else:
+            end = 0
+        if end != size:
+            f.truncate(end)
+        rows, last = 0, None
+        f.seek(0)
+        for line in f:
+            rows += 1
+            last = line
+    if last is None:
+        return None, 0
+    if output_format == 'csv':
+        rows -= 1  # header
+        values = next(csv.reader([last.decode('utf-8')]))
+        return (values[0] if rows > 0 else None), rows
+    return json.loads(last)['path'], rows
+
+
+class Command(BaseCommand):
+    help = 'Score every image under a directory in batches and stream the predictions to JSONL or CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='Images to score (flat, or one sub-directory per class)')
+        parser.add_argument('--output', required=True, help='Output file (.jsonl or .csv)')
+        parser.add_argument('--format', choices=('jsonl', 'csv'), help='Output format (default: from the extension)')
+        parser.add_argument('--model', help='Model name from models/ (cnn_simple, efficientnetb0, ...; '
+                                            'default: the one CoreConfig would preload)')
+        parser.add_argument('--batch-size', type=int, default=32, help='Images per forward pass')
+        parser.add_argument('--decode-workers', type=int,
+                            help='Decode threads (default: PREDICT_DECODE_WORKERS / the thread config)')
+        parser.add_argument('--prefetch-batches', type=int, default=2,
+                            help='Batches decoded ahead of inference; bounds memory')
+        parser.add_argument('--resume', action='store_true', help='Continue after the last row of --output')
+        parser.add_argument('--limit', type=int, default=0, help='Stop after this many images (0 = all)')
+        parser.add_argument('--progress-every', type=float, default=10.0, help='Seconds between progress lines')
+
+    def handle(self, *args, **options):
+        root = options['directory']
+        if not os.path.isdir(root):
+            raise CommandError(f'Not a directory: {root}')
+        output = options['output']
+        output_format = options['format'] or ('csv' if output.lower().endswith('.csv') else 'jsonl')
+        batch_size = max(1, options['batch_size'])
+
+        detector, name = self._detector(options['model'])
+        if options['decode_workers']:
+            detector.decode_workers = options['decode_workers']
+
+        files = iter_images(root)
+        done = 0
+        resuming = options['resume'] and os.path.exists(output) and os.path.getsize(output) > 0
+        if resuming:
+            last, done = last_written(output, output_format)
+            if last is not None:
+                for path in files:
+                    if path == last:
+                        break
+                else:
+                    raise CommandError(f'{last} (last row of {output}) is no longer under {root}; cannot resume')
+            self.stdout.write(f'Resuming after {done} rows ({last})')
+        elif os.path.exists(output) and os.path.getsize(output) > 0:
+            raise CommandError(f'{output} exists; pass --resume to continue it or remove it')
+
+        self.stdout.write(f'Scoring {root} with {name} ({detector.model_path}), batches of {batch_size}, '
+                          f'{detector.decode_workers} decode workers -> {output}')
+        window = batch_size * (max(1, options['prefetch_batches']) + 1)
+        stats = {'images': 0, 'errors': 0, 'started': time.perf_counter()}
+        stats['reported'], stats['reported_images'] = stats['started'], 0
+
+        with open(output, 'a', newline='', encoding='utf-8') as f, \
+                ThreadPoolExecutor(max_workers=max(1, detector.decode_workers)) as pool:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS) if output_format == 'csv' else None
+            if writer is not None and not resuming:
+                writer.writeheader()
+            pending = deque()
+            for path in files:
+                if options['limit'] and stats['images'] + len(pending) >= options['limit']:
+                    break
+                pending.append((path, pool.submit(detector.preprocess_image, os.path.join(root, path))))
+                if len(pending) >= window:
+                    self._flush(detector, pending, batch_size, f, writer, stats, options['progress_every'])
+            while pending:
+                self._flush(detector, pending, batch_size, f, writer, stats, options['progress_every'])
+
+        elapsed = time.perf_counter() - stats['started']
+        detector.disable_batching()
+        self.stdout.write(self.style.SUCCESS(
+            f"Scored {stats['images']} images in {elapsed:.1f} s "
+            f"({stats['images'] / elapsed if elapsed else 0.0:.1f} images/s, {stats['errors']} errors); "
+            f"{done + stats['images']} rows in {output}"
+        ))
+
+    def _detector(self, name):
+        config = apps.get_app_config('core')
+        found = config.find_models()
+        if not found:
+            raise CommandError('No model found in models/')
+        specs = {model_name: (model_path, class_indices_path)
+                 for model_name, _label, model_path, class_indices_path in found}
+        name = name or found[0][0]
+        if name not in specs:
+            raise CommandError(f"Unknown model '{name}'. Available: {', '.join(specs)}")
+        model_path, class_indices_path = specs[name]
+
+        # Deployed thread / decode settings; caches would only hold each image once
+        detector = PlantDiseaseDetector()
+        config.configure_detector(detector)
+        detector.cache = None
+        detector.near_duplicates = None
+        detector.disable_batching()
+        if not detector.load_model(model_path):
+            raise CommandError(f'Could not load {model_path}')
+        if class_indices_path and os.path.exists(class_indices_path):
+            detector.load_class_indices(class_indices_path)
+        return detector, name
+
+    def _flush(self, detector, pending, batch_size, f, writer, stats, progress_every):
+        """Predict the oldest batch in `pending` and append its rows"""
+        batch = [pending.popleft() for _ in range(min(batch_size, len(pending)))]
+        arrays = [(path, future.result()) for path, future in batch]
+        valid = [array for _, array in arrays if array is not None]
+        try:
+            predictions = detector.predict_preprocessed(np.concatenate(valid, axis=0)) if valid else []
+        except Exception as e:
+            predictions = [{'error': f'Prediction failed: {e}'}] * len(valid)
+        predictions = iter(predictions)
+
+        for path, array in arrays:
+            directory = os.path.dirname(path)
+            row = {'path': path, 'directory': directory or None}
+            if array is None:
+                row['error'] = 'Failed to process image'
+                stats['errors'] += 1
+            else:
+                prediction = next(predictions)
+                if 'error' in prediction:
+                    row['error'] = prediction['error']
+                    stats['errors'] += 1
+                else:
+                    row['predicted_class'] = prediction['disease']
+                    row['confidence'] = round(prediction['confidence'], 6)
+            if writer is not None:
+                writer.writerow(row)
+            else:
+                f.write(json.dumps(row) + '\n')
+        f.flush()
+        stats['images'] += len(arrays)
+
+        now = time.perf_counter()
+        if now - stats['reported'] >= progress_every:
+            recent = (stats['images'] - stats['reported_images']) / (now - stats['reported'])
+            overall = stats['images'] / (now - stats['started'])
+            self.stdout.write(f"{stats['images']} images, {recent:.1f} images/s now, "
+                              f"{overall:.1f} images/s overall, {stats['errors']} errors")
+            stats['reported'], stats['reported_images'] = now, stats['images']
@@ -0,0 +1,88 @@
+"""
+Management command to profile live prediction traffic on a running server.
+Arms /api/profile/ so the next N prediction requests are profiled (cProfile,
+optionally a TensorFlow trace), then waits for them and prints the summary
+of the hottest functions and ops. Authenticates with PROFILING_TOKEN.
+
+Each Gunicorn worker profiles the requests it serves itself; the request
+arms whichever worker receives it (use WEB_CONCURRENCY=1 while profiling
+for a complete picture).
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+import os
+import json
+import time
+import urllib.error
+import urllib.request
+
+
+class Command(BaseCommand):
+    help = 'Profile the next N live prediction requests of a running server and print the summary'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Base URL of the running server')
+        parser.add_argument('--requests', type=int, default=10, help='Prediction requests to profile')
+        parser.add_argument('--tensorflow', action='store_true',
+                            help='Also record a TensorFlow profiler trace of each forward pass')
+        parser.add_argument('--status', action='store_true', help='Only report the current session')
+        parser.add_argument('--stop', action='store_true', help='Stop the current session early')
+        parser.add_argument('--no-wait', action='store_true', help='Arm and return without waiting')
+        parser.add_argument('--timeout', type=float, default=600, help='Seconds to wait for the requests')
+
+    def handle(self, *args, **options):
+        if not settings.PROFILING_TOKEN:
+            raise CommandError('Set PROFILING_TOKEN (same value as the server) to use this command')
+        endpoint = options['url'].rstrip('/') + '/api/profile/'
+
+        if options['status']:
+            self.stdout.write(json.dumps(self._call(endpoint, 'GET'), indent=2))
+            return
+        if options['stop']:
+            self.stdout.write(json.dumps(self._call(endpoint, 'DELETE'), indent=2))
+            return
+
+        response = self._call(endpoint, 'POST', {'requests': options['requests'], 'tensorflow': options['tensorflow']})
+        if response.get('status') != 'armed':
+            raise CommandError(response.get('message', response))
+        session = response['session']
+        self.stdout.write(f"Profiling the next {session['requests']} prediction requests "
+                          f"in pid {session['pid']} -> {session['directory']}")
+        if options['no_wait']:
+            return
+
+        deadline = time.monotonic() + options['timeout']
+        while time.monotonic() < deadline:
+            armed = self._call(endpoint, 'GET').get('armed')
+            if not armed or armed['id'] != session['id']:
+                break
+            time.sleep(1.0)
+        else:
+            self.stdout.write(self.style.WARNING("Timed out; the session keeps running (--stop to end it)"))
+            return
+
+        summary = os.path.join(session['directory'], 'summary.txt')
+        for _ in range(30):
+            # The last profiled request may still be finishing
+            if os.path.exists(summary):
+                with open(summary) as f:
+                    self.stdout.write(f.read())
+                return
+            time.sleep(1.0)
+        self.stdout.write(f"Done; the summary is written on the server to {summary}")
+
+    @staticmethod
+    def _call(endpoint, method, payload=None):
+        request = urllib.request.Request(
+            endpoint,
+            data=json.dumps(payload).encode() if payload is not None else None,
+            method=method,
+            headers={'Authorization': f'Bearer {settings.PROFILING_TOKEN}', 'Content-Type': 'application/json'},
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            raise CommandError(f'{endpoint}: HTTP {e.code} {e.read()[:200]!r}')
+        except urllib.error.URLError as e:
+            raise CommandError(f'{endpoint}: {e.reason}')
@@ -0,0 +1,56 @@
+"""
+Management command to run the local inference daemon.
+The daemon owns the detector (and the model's memory); web workers started
+with INFERENCE_SOCKET set talk to it over a Unix socket, passing decoded
+images through shared memory. Run one daemon per host:
+
+    INFERENCE_SOCKET=/tmp/plant_inference.sock python manage.py run_inference_server
+"""
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+import signal
+import sys
+from core.inference_server import InferenceServer
+from core.ml_model import configure_remote, get_detector, initialize_model
+from core.startup import startup_report
+
+
+class Command(BaseCommand):
+    help = 'Run the inference daemon that serves predictions to web workers over a Unix socket'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', default=getattr(settings, 'INFERENCE_SOCKET', None) or '/tmp/plant_inference.sock',
+                            help='Unix socket path (default: INFERENCE_SOCKET)')
+        parser.add_argument('--model-path', help='Model to serve (default: the one CoreConfig would preload)')
+        parser.add_argument('--class-indices', help='Class indices JSON for --model-path')
+
+    def handle(self, *args, **options):
+        # This process serves the model itself, even if INFERENCE_SOCKET is set
+        configure_remote(None)
+        detector = get_detector()
+        config = apps.get_app_config('core')
+        config.configure_detector(detector)
+
+        if options['model_path']:
+            initialize_model(model_path=options['model_path'], class_indices_path=options['class_indices'])
+        else:
+            config.preload_model()
+        if detector.model is None:
+            raise CommandError('Model not loaded; pass --model-path or add a model to models/')
+
+        server = InferenceServer(options['socket'], detector)
+        # Let SIGTERM unwind through server_close so rings are unlinked
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+        self.stdout.write(startup_report.format())
+        batching = 'on' if detector.batcher is not None else 'off (set PREDICT_BATCHING=True)'
+        self.stdout.write(self.style.SUCCESS(
+            f"Serving {detector.model_path} on {options['socket']} (cross-request batching {batching})"
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,74 @@
+"""
+Management command that drains the asynchronous batch job queue (/api/jobs/).
+Run it next to the web server, on the same database and PREDICT_JOBS_DIR:
+
+    python manage.py run_job_worker
+
+It lowers its own CPU priority (PREDICT_JOB_WORKER_NICE) so the web process's
+single-image requests are scheduled first, scores each job in batches and
+commits results as it goes. SIGTERM / Ctrl-C stop it after the current batch;
+the job goes back to the queue and resumes there on the next start.
+"""
+from django.core.management.base import BaseCommand
+from django.conf import settings
+import os
+import signal
+import threading
+import time
+from core.batch_jobs import claim_next_job, requeue_stale, run_job, worker_name
+from core.ml_model import ensure_model_loaded
+
+
+class Command(BaseCommand):
+    help = 'Process queued batch prediction jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.PREDICT_JOB_BATCH_SIZE,
+                            help='Images per forward pass')
+        parser.add_argument('--prefetch-batches', type=int, default=2,
+                            help='Batches decoded ahead of inference; bounds memory')
+        parser.add_argument('--nice', type=int, default=settings.PREDICT_JOB_WORKER_NICE,
+                            help='Raise the process niceness by this much (0 = leave it)')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between queue checks when idle')
+        parser.add_argument('--stale-after', type=float, default=300,
+                            help='Requeue running jobs without a heartbeat for this many seconds')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        if options['nice'] and hasattr(os, 'nice'):
+            os.nice(options['nice'])
+        # The handler runs between bytecodes of whatever is executing (often
+        # inference), so it only sets the flag checked between batches
+        stopping = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+        signal.signal(signal.SIGINT, lambda signum, frame: stopping.set())
+
+        name = worker_name()
+        detector = ensure_model_loaded()
+        self.stdout.write(f'Job worker {name} ready ({detector.model_path}), '
+                          f"batches of {options['batch_size']}, nice {os.nice(0) if hasattr(os, 'nice') else 0}")
+
+        while not stopping.is_set():
+            requeued = requeue_stale(options['stale_after'])
+            if requeued:
+                self.stdout.write(self.style.WARNING(f'Requeued {requeued} job(s) left running by a dead worker'))
+            job = claim_next_job(name)
+            if job is None:
+                if options['once']:
+                    break
+                stopping.wait(options['poll_interval'])
+                continue
+
+            self.stdout.write(f'Job {job.id}: {job.total} images'
+                              + (f', resuming at {job.processed}' if job.processed else ''))
+            started = time.perf_counter()
+            status = run_job(job, batch_size=options['batch_size'], prefetch_batches=options['prefetch_batches'],
+                             should_stop=stopping.is_set)
+            elapsed = time.perf_counter() - started
+            message = (f'Job {job.id}: {status}, {job.processed}/{job.total} images '
+                       f'({job.errors} errors) in {elapsed:.1f} s')
+            if job.error:
+                message += f' - {job.error}'
+            style = self.style.SUCCESS if status == 'done' else self.style.WARNING
+            self.stdout.write(style(message))
+        self.stdout.write('Job worker stopped')
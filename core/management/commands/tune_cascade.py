@@ -0,0 +1,187 @@
+"""
+Management command to pick the cascade's escalation thresholds.
+Runs every held-out image through both stages once, then searches the
+confidence and margin thresholds for the lowest mean latency that still
+reaches --target-accuracy, and writes them to PREDICT_CASCADE_CONFIG.
+
+The held-out set is a directory with one sub-directory per class (named as
+in either class map, e.g. PlantVillage/test from train_from_notebook). A
+flat directory of unlabeled images also works; accuracy is then agreement
+with the secondary model.
+"""
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+import os
+import json
+import time
+import numpy as np
+from core.cascade import canonical_label, escalation_mask, label_permutation
+from core.ml_model import PlantDiseaseDetector
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+MARGIN_GRID = np.round(np.arange(0.0, 1.0001, 0.05), 2)
+
+
+def _held_out(directory, limit):
+    """(path, class directory name or None) for every image under `directory`"""
+    samples = []
+    for root, _dirs, files in sorted(os.walk(directory)):
+        label = None if os.path.samefile(root, directory) else os.path.relpath(root, directory).split(os.sep)[0]
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                samples.append((os.path.join(root, name), label))
+    if limit:
+        # Spread the sample over classes instead of taking the first few
+        step = max(1, len(samples) // limit)
+        samples = samples[::step][:limit]
+    return samples
+
+
+class Command(BaseCommand):
+    help = 'Choose cascade escalation thresholds for a target accuracy at minimum mean latency'
+
+    def add_arguments(self, parser):
+        default_dir = os.path.join(settings.BASE_DIR, 'PlantVillage', 'test')
+        parser.add_argument('--data-dir', default=default_dir if os.path.isdir(default_dir) else str(settings.MEDIA_ROOT),
+                            help='Held-out images, one sub-directory per class (default: PlantVillage/test)')
+        parser.add_argument('--samples', type=int, default=0, help='Most images to use (0 = all)')
+        parser.add_argument('--target-accuracy', type=float, default=0.98,
+                            help='Required top-1 accuracy (agreement with the secondary when unlabeled)')
+        parser.add_argument('--output', default=settings.PREDICT_CASCADE_CONFIG,
+                            help='Where to write the thresholds (default: PREDICT_CASCADE_CONFIG)')
+        parser.add_argument('--dry-run', action='store_true', help='Report, but do not write')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        config = apps.get_app_config('core')
+        found = {name: (model_path, class_indices_path)
+                 for name, _label, model_path, class_indices_path in config.find_models()}
+        primary_name, secondary_name = settings.PREDICT_CASCADE_PRIMARY, settings.PREDICT_CASCADE_SECONDARY
+        for name in (primary_name, secondary_name):
+            if name not in found:
+                raise CommandError(f'Cascade stage {name} not found in models/')
+
+        samples = _held_out(options['data_dir'], options['samples'])
+        if not samples:
+            raise CommandError(f"No images in {options['data_dir']}")
+        labelled = all(label is not None for _, label in samples)
+
+        primary = self._detector(config, *found[primary_name])
+        secondary = self._detector(config, *found[secondary_name])
+        order = label_permutation(primary.class_indices, secondary.class_indices)
+        classes = {canonical_label(name): int(index) for index, name in secondary.class_indices.items()}
+
+        # Untimed first call: models trace / allocate on their first prediction
+        with open(samples[0][0], 'rb') as f:
+            warmup = f.read()
+        primary.predict(warmup)
+        secondary.predict(warmup)
+
+        truth, first, second, first_ms, second_ms = [], [], [], [], []
+        for path, label in samples:
+            with open(path, 'rb') as f:
+                data = f.read()
+            scores_1, ms_1 = self._timed(primary, data)
+            scores_2, ms_2 = self._timed(secondary, data)
+            if scores_1 is None or scores_2 is None:
+                self.stdout.write(self.style.WARNING(f'Skipping unreadable {path}'))
+                continue
+            if labelled:
+                if canonical_label(label) not in classes:
+                    raise CommandError(f"Class directory '{label}' matches no class of {secondary_name}")
+                truth.append(classes[canonical_label(label)])
+            first.append(scores_1[order])
+            second.append(scores_2)
+            first_ms.append(ms_1)
+            second_ms.append(ms_2)
+
+        first, second = np.array(first), np.array(second)
+        first_ms, second_ms = np.array(first_ms), np.array(second_ms)
+        truth = np.array(truth) if labelled else second.argmax(axis=1)
+        first_correct = first.argmax(axis=1) == truth
+        second_correct = second.argmax(axis=1) == truth
+
+        def evaluate(confidence, margin):
+            escalate = escalation_mask(first, confidence, margin)
+            return {
+                'confidence_threshold': float(confidence),
+                'margin_threshold': float(margin),
+                'accuracy': float(np.where(escalate, second_correct, first_correct).mean()),
+                'escalation_rate': float(escalate.mean()),
+                'mean_latency_ms': float(first_ms.mean() + (escalate * second_ms).mean()),
+            }
+
+        # Every distinct top-1 confidence is a possible cut; margins on a grid
+        confidences = np.unique(np.concatenate([[0.0, 1.0 + 1e-6], first.max(axis=1)]))
+        candidates = [evaluate(c, m) for m in MARGIN_GRID for c in confidences]
+        feasible = [c for c in candidates if c['accuracy'] >= options['target_accuracy']]
+        best = min(feasible or candidates, key=lambda c: (
+            (0 if feasible else -c['accuracy']), c['mean_latency_ms'], c['escalation_rate']
+        ))
+
+        report = {
+            'primary': primary_name,
+            'secondary': secondary_name,
+            'images': len(truth),
+            'labelled': labelled,
+            'target_accuracy': options['target_accuracy'],
+            'primary_only': {'accuracy': float(first_correct.mean()), 'mean_latency_ms': float(first_ms.mean())},
+            'secondary_only': {'accuracy': float(second_correct.mean()), 'mean_latency_ms': float(second_ms.mean())},
+            'chosen': best,
+            'target_met': bool(feasible),
+            'curve': [evaluate(c, 0.0) for c in (0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99)],
+        }
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.stdout.write(f"{len(truth)} images from {options['data_dir']} "
+                              f"({'labelled' if labelled else f'unlabelled: accuracy = agreement with {secondary_name}'})")
+            self.stdout.write(f"{'':<26}{'accuracy':>10}{'escalated':>11}{'mean ms':>10}")
+            self.stdout.write(f"{primary_name + ' only':<26}{report['primary_only']['accuracy']:>10.1%}{0:>11.1%}"
+                              f"{report['primary_only']['mean_latency_ms']:>10.1f}")
+            self.stdout.write(f"{secondary_name + ' only':<26}{report['secondary_only']['accuracy']:>10.1%}{1:>11.1%}"
+                              f"{report['secondary_only']['mean_latency_ms']:>10.1f}")
+            for row in report['curve'] + [best]:
+                name = f"cascade c<{row['confidence_threshold']:.3g} m<{row['margin_threshold']:.2g}"
+                self.stdout.write(f"{name:<26}{row['accuracy']:>10.1%}{row['escalation_rate']:>11.1%}"
+                                  f"{row['mean_latency_ms']:>10.1f}" + ('  <- chosen' if row is best else ''))
+
+        if not feasible:
+            self.stdout.write(self.style.WARNING(
+                f"No thresholds reach {options['target_accuracy']:.1%}; chose the most accurate"
+            ))
+        if options['dry_run']:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(options['output'])), exist_ok=True)
+        with open(options['output'], 'w') as f:
+            json.dump(dict(best, primary=primary_name, secondary=secondary_name, images=len(truth),
+                           labelled=labelled, target_accuracy=options['target_accuracy'],
+                           tuned_at=time.strftime('%Y-%m-%dT%H:%M:%S%z')), f, indent=2)
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote confidence < {best['confidence_threshold']:.3g}, margin < {best['margin_threshold']:.2g} "
+            f"(escalation rate {best['escalation_rate']:.1%}) to {options['output']}"
+        ))
+
+    @staticmethod
+    def _detector(config, model_path, class_indices_path):
+        # Deployed thread / decode settings, but no caches: every image really runs
+        detector = PlantDiseaseDetector()
+        config.configure_detector(detector)
+        detector.cache = None
+        detector.near_duplicates = None
+        detector.disable_batching()
+        if not detector.load_model(model_path):
+            raise CommandError(f'Could not load {model_path}')
+        detector.load_class_indices(class_indices_path)
+        return detector
+
+    @staticmethod
+    def _timed(detector, data):
+        started = time.perf_counter()
+        result = detector.predict(data)
+        elapsed_ms = (time.perf_counter() - started) * 1000.0
+        if 'error' in result:
+            return None, None
+        return np.array(result['all_predictions']['confidence_scores']), elapsed_ms
@@ -0,0 +1,144 @@
+"""
+Management command to pick the CPU thread topology for this machine.
+Sweeps TensorFlow intra-op / inter-op threads, oneDNN on/off and the decode
+pool size against the served model at the batch sizes in use, each
+candidate in a fresh process (thread pools are fixed once TensorFlow starts),
+and writes the fastest to PREDICT_THREAD_CONFIG for the detector to apply
+at load time. Explicit PREDICT_* thread settings still override it.
+"""
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+import os
+import glob
+import json
+import multiprocessing
+import numpy as np
+from core.ml_model import NON_KERAS_FORMATS
+from core.thread_tuning import (
+    available_cpus, machine_fingerprint, measure_thread_config, save_thread_config, spawn_environment
+)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+def _thread_counts(cpus):
+    """1, 2, 4, ... up to and including `cpus`"""
+    counts, n = [], 1
+    while n < cpus:
+        counts.append(n)
+        n *= 2
+    return counts + [cpus]
+
+
+def _score(latencies):
+    """Geometric mean over batch sizes of the median per-image time (ms)"""
+    per_image = [np.median(timings) / batch_size for batch_size, timings in latencies.items()]
+    return float(np.exp(np.mean(np.log(per_image))))
+
+
+class Command(BaseCommand):
+    help = 'Sweep intra/inter-op threads, oneDNN and decode workers; write the fastest config for this machine'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model-path', help='Model to tune for (default: the one CoreConfig would preload)')
+        parser.add_argument('--batch-sizes',
+                            help='Comma-separated batch sizes (default: 1 plus PREDICT_BATCH_BUCKETS)')
+        parser.add_argument('--image-dir', default=str(settings.MEDIA_ROOT), help='Sample images to predict on')
+        parser.add_argument('--samples', type=int, default=16, help='Most sample images to load')
+        parser.add_argument('--repeats', type=int, default=5, help='Timed calls per batch size and candidate')
+        parser.add_argument('--max-threads', type=int, default=available_cpus(),
+                            help='Largest thread count to try (default: CPUs available to this process)')
+        parser.add_argument('--onednn', choices=('sweep', 'on', 'off', 'default'), default='sweep',
+                            help='oneDNN kernels for Keras models (default: try both)')
+        parser.add_argument('--output', default=settings.PREDICT_THREAD_CONFIG,
+                            help='Where to write the winner (default: PREDICT_THREAD_CONFIG)')
+        parser.add_argument('--dry-run', action='store_true', help='Measure and report, but do not write')
+        parser.add_argument('--json', action='store_true', help='Print the measurements as JSON')
+
+    def handle(self, *args, **options):
+        model_path = options['model_path']
+        if not model_path:
+            found = apps.get_app_config('core').find_model()
+            if found is None:
+                raise CommandError('No model found in models/; pass --model-path')
+            model_path = found[1]
+        if options['batch_sizes']:
+            batch_sizes = sorted({int(b) for b in options['batch_sizes'].split(',') if b.strip()})
+        else:
+            batch_sizes = sorted({1, *getattr(settings, 'PREDICT_BATCH_BUCKETS', [])})
+
+        files = sorted(
+            path for path in glob.glob(os.path.join(options['image_dir'], '**', '*'), recursive=True)
+            if path.lower().endswith(IMAGE_EXTENSIONS)
+        )[:options['samples']]
+        if not files:
+            raise CommandError(f"No sample images in {options['image_dir']}")
+        images = []
+        for path in files:
+            with open(path, 'rb') as f:
+                images.append(f.read())
+
+        is_keras = os.path.splitext(model_path)[1] not in NON_KERAS_FORMATS
+        counts = _thread_counts(max(1, options['max_threads']))
+        onednn = {'sweep': [True, False], 'on': [True], 'off': [False], 'default': [None]}[options['onednn']]
+        self.stdout.write(f"Tuning {model_path} on {machine_fingerprint()} at batch sizes {batch_sizes}")
+
+        # Stage 1: model threads, with single-threaded decode so they do not compete
+        candidates = [
+            {'intra_op_threads': intra, 'inter_op_threads': inter, 'onednn': dnn, 'decode_workers': 1}
+            for intra in counts
+            for inter in ([c for c in counts if c <= 2] if is_keras else [None])
+            for dnn in (onednn if is_keras else [None])
+        ]
+        rows = [self._measure(model_path, config, images, batch_sizes, options['repeats'])
+                for config in candidates]
+        best = min(rows, key=lambda row: row['score_ms'])
+
+        # Stage 2: decode pool size on top of the best model threads; it
+        # only matters for multi-image requests
+        multi = [b for b in batch_sizes if b > 1]
+        if multi:
+            decode_rows = [
+                self._measure(model_path, dict(best['config'], decode_workers=workers),
+                              images, [max(multi)], options['repeats'])
+                for workers in counts
+            ]
+            rows.extend(decode_rows)
+            best_decode = min(decode_rows, key=lambda row: row['score_ms'])
+            best = dict(best, config=dict(best['config'], decode_workers=best_decode['config']['decode_workers']))
+
+        if options['json']:
+            self.stdout.write(json.dumps({'model': model_path, 'best': best['config'], 'results': rows}, indent=2))
+        else:
+            self.stdout.write(f"{'intra':>6}{'inter':>6}{'oneDNN':>8}{'decode':>8}"
+                              + ''.join(f"{f'b={b} ms':>11}" for b in batch_sizes) + f"{'ms/image':>10}")
+            for row in rows:
+                config = row['config']
+                self.stdout.write(
+                    f"{str(config['intra_op_threads'] or '-'):>6}{str(config['inter_op_threads'] or '-'):>6}"
+                    f"{'-' if config['onednn'] is None else ('on' if config['onednn'] else 'off'):>8}"
+                    f"{config['decode_workers']:>8}"
+                    + ''.join(f"{row['p50_ms'][b]:>11.1f}" if b in row['p50_ms'] else f"{'':>11}"
+                              for b in batch_sizes)
+                    + f"{row['score_ms']:>10.2f}"
+                )
+
+        if options['dry_run']:
+            self.stdout.write(f"Best: {best['config']} (not written, --dry-run)")
+            return
+        save_thread_config(options['output'], best['config'],
+                           model=os.path.basename(model_path), batch_sizes=batch_sizes, results=rows)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {best['config']} to {options['output']}"))
+
+    def _measure(self, model_path, config, images, batch_sizes, repeats):
+        # A fresh process per candidate: TensorFlow and BLAS fix their pools at start
+        context = multiprocessing.get_context('spawn')
+        with spawn_environment(config), context.Pool(1) as pool:
+            latencies = pool.apply(measure_thread_config, (model_path, config, images, batch_sizes, repeats))
+        return {
+            'config': config,
+            'p50_ms': {b: float(np.median(t)) for b, t in latencies.items()},
+            'p95_ms': {b: float(np.percentile(t, 95)) for b, t in latencies.items()},
+            'score_ms': _score(latencies),
+        }
@@ -3,10 +3,9 @@ Management command to pre-warm the ML model by running a dummy prediction.
 This helps avoid timeout issues on the first real prediction.
 """
 from django.core.management.base import BaseCommand
-from django.conf import settings
-import os
 import logging
-from core.ml_model import get_detector, initialize_model
+from core.ml_model import ensure_model_loaded
+from core.startup import startup_report
 from PIL import Image
 import numpy as np
 
@@ -20,19 +19,8 @@ class Command(BaseCommand):
         self.stdout.write('Warming up ML model...')
         
         try:
-            detector = get_detector()
-            
-            if detector.model is None:
-                self.stdout.write(self.style.WARNING('Model not loaded, attempting to load...'))
-                model_path = os.path.join(settings.BASE_DIR, 'models', 'plant_disease_model.keras')
-                class_indices_path = os.path.join(settings.BASE_DIR, 'models', 'class_indices.json')
-                
-                if os.path.exists(model_path):
-                    initialize_model(model_path=model_path, class_indices_path=class_indices_path)
-                else:
-                    alt_h5 = os.path.join(settings.BASE_DIR, 'models', 'plant_disease_model.h5')
-                    if os.path.exists(alt_h5):
-                        initialize_model(model_path=alt_h5, class_indices_path=class_indices_path)
+            # Management commands skip the startup preload; load it here
+            detector = ensure_model_loaded()
             
             if detector.model is None:
                 self.stdout.write(self.style.ERROR('Failed to load model'))
@@ -41,21 +29,17 @@ class Command(BaseCommand):
             # Run a dummy prediction to warm up the model
             self.stdout.write('Running dummy prediction to warm up model...')
             
-            # Create a simple test image
+            # Create a simple test image in memory (no temp file needed)
             dummy_image = Image.new('RGB', (224, 224), color='green')
-            dummy_path = os.path.join(settings.MEDIA_ROOT, 'warmup_test.jpg')
-            os.makedirs(settings.MEDIA_ROOT, exist_ok=True)
-            dummy_image.save(dummy_path)
             
             # Run prediction
-            result = detector.predict(dummy_path)
-            
-            # Clean up
-            if os.path.exists(dummy_path):
-                os.remove(dummy_path)
+            with startup_report.phase('warmup_prediction'):
+                result = detector.predict(dummy_image)
             
             self.stdout.write(self.style.SUCCESS('Model warm-up complete!'))
             self.stdout.write(f'Warm-up result: {result}')
+            self.stdout.write('Startup phases:')
+            self.stdout.write(startup_report.format())
             
         except Exception as e:
             logger.exception('Error during model warm-up')
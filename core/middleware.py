@@ -0,0 +1,54 @@
+# middleware.py
+"""
+Request middleware for Plant Disease Prediction
+"""
+
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from . import stage_timing
+
+
+class ServerTimingMiddleware:
+    """
+    Time every request: the prediction stages it ran go out as a
+    Server-Timing header (visible in the browser's network panel) and the
+    total goes into the per-view histogram on /metrics
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self._acall(request)
+        if not stage_timing.enabled:
+            return self.get_response(request)
+        started = time.perf_counter()
+        with stage_timing.request_timings() as timings:
+            response = self.get_response(request)
+        return self._finish(request, response, timings, started)
+
+    async def _acall(self, request):
+        if not stage_timing.enabled:
+            return await self.get_response(request)
+        started = time.perf_counter()
+        with stage_timing.request_timings() as timings:
+            response = await self.get_response(request)
+        return self._finish(request, response, timings, started)
+
+    @staticmethod
+    def _finish(request, response, timings, started):
+        elapsed = time.perf_counter() - started
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match is not None else 'unmatched'
+        stage_timing.REQUEST_SECONDS.observe(view, elapsed)
+        response['Server-Timing'] = timings.server_timing(elapsed)
+        return response
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-16 18:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CachedPrediction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=128, unique=True)),
+                ('result', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
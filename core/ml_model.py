@@ -4,27 +4,183 @@ Machine Learning Model Integration for Plant Disease Prediction
 This module handles the connection to the PlantDiseaseAI model
 """
 
+import io
 import os
+import hashlib
 import sys
+import time
+import queue
 import threading
 import numpy as np
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 # Suppress TensorFlow warnings and reduce verbosity
 os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '3')  # Suppress INFO and WARNING
 os.environ['TF_FORCE_GPU_ALLOW_GROWTH'] = 'true'
 logging.getLogger('tensorflow').setLevel(logging.ERROR)
 
-from tensorflow import keras
 from PIL import Image
 import json
 
+from .prediction_cache import content_key, dhash
+from .stage_timing import bind, stage
+from .startup import startup_report
+from .thread_tuning import configure_tensorflow_threads, limit_blas_threads, set_onednn
+
+# Model formats served without TensorFlow's Keras runtime
+NON_KERAS_FORMATS = ('.tflite', '.npz')
+
+
+def _keras():
+    """Import Keras on first use so TensorFlow-free backends never load it"""
+    if 'tensorflow' not in sys.modules:
+        with startup_report.phase('tensorflow_import'):
+            from tensorflow import keras
+        return keras
+    from tensorflow import keras
+    return keras
+
+
+class PreprocessPlan:
+    """
+    How images are turned into model input, resolved once per loaded model
+    
+    Attributes:
+        normalization: 'rescale' (x / 255), 'none' (the model rescales
+            internally, as Keras' EfficientNet does - its preprocess_input
+            is a pass-through) or 'graph' (serving graph: feed raw uint8,
+            the model casts and rescales in-graph)
+        target_size: (width, height) the image is resized to
+        channels: 3 for RGB input, 1 for grayscale
+        channel_order: 'RGB' or 'BGR'
+        channels_first: Whether the model expects (C, H, W) input
+    """
+    
+    def __init__(self, normalization='rescale', target_size=(224, 224), channels=3,
+                 channel_order='RGB', channels_first=False):
+        self.normalization = normalization
+        self.target_size = tuple(target_size)
+        self.channels = channels
+        self.channel_order = channel_order
+        self.channels_first = channels_first
+    
+    def __repr__(self):
+        layout = 'CHW' if self.channels_first else 'HWC'
+        return (f"PreprocessPlan(normalization={self.normalization}, size={self.target_size}, "
+                f"{self.channel_order if self.channels == 3 else 'L'}, {layout})")
+    
+    @classmethod
+    def for_model(cls, model, target_size, channels=3, channels_first=False, input_dtype='float32'):
+        """
+        Inspect a loaded model once and build its plan
+        
+        Args:
+            model: Loaded model (Keras, TFLiteModel or NumpyModel)
+            target_size: (width, height) detected from the model input
+            channels: Input channel count
+            channels_first: Whether the input is channels-first
+            input_dtype: Model input dtype; 'uint8' means a serving graph
+            
+        Returns:
+            PreprocessPlan: The resolved plan
+        """
+        if input_dtype == 'uint8':
+            return cls(normalization='graph', target_size=target_size, channels=channels)
+        
+        normalization = 'rescale'
+        try:
+            model_name = getattr(model, 'name', '').lower()
+            layer_names = [l.name.lower() for l in model.layers[:6]]
+            # EfficientNet rescales inside the graph; its preprocess_input is the identity
+            if 'efficientnet' in model_name or any('efficientnet' in n for n in layer_names):
+                normalization = 'none'
+            # You can add other backbone preprocess checks here (resnet, mobilenet, etc.)
+        except Exception:
+            pass
+        return cls(normalization=normalization, target_size=target_size, channels=channels,
+                   channels_first=channels_first)
+    
+    @property
+    def resizes_in_graph(self):
+        """Whether the model resizes its input itself (serving graphs do)"""
+        return self.normalization == 'graph'
+    
+    def load_pixels(self, image, draft=True, resize=True):
+        """
+        Decode and resize an image to a uint8 (H, W, C) array
+        
+        Args:
+            image: Opened (not yet decoded) PIL image
+            draft: Let libjpeg decode large JPEGs at a reduced DCT scale
+                (1/2, 1/4 or 1/8) that is still at least the target size
+            resize: Resize to `target_size`. Only a model that
+                `resizes_in_graph` can take the unresized pixels, and only
+                one image at a time: stacked batches need a common size.
+            
+        Returns:
+            np.array: uint8 array of shape (H, W, channels)
+        """
+        mode = 'RGB' if self.channels == 3 else 'L'
+        with stage('decode'):
+            if draft and image.format == 'JPEG':
+                image.draft(mode, self.target_size)
+            image.load()
+        with stage('resize'):
+            if image.mode != mode:
+                image = image.convert(mode)
+            if resize and image.size != self.target_size:
+                image = image.resize(self.target_size)
+            pixels = np.asarray(image)
+        if pixels.ndim == 2:
+            pixels = pixels[:, :, None]
+        if self.channel_order == 'BGR':
+            pixels = pixels[:, :, ::-1]
+        return pixels
+    
+    def normalize(self, pixels):
+        """
+        Turn uint8 pixels (N, H, W, C) into model input
+        
+        Args:
+            pixels: uint8 array with a batch dimension
+            
+        Returns:
+            np.array: float32 model input (uint8 for serving graphs)
+        """
+        with stage('normalize'):
+            if self.normalization == 'graph':
+                return np.ascontiguousarray(pixels)
+            batch = pixels.astype(np.float32)
+            if self.normalization == 'rescale':
+                batch *= np.float32(1.0 / 255.0)
+            if self.channels_first:
+                batch = np.ascontiguousarray(batch.transpose(0, 3, 1, 2))
+            return batch
+    
+    def apply(self, image, draft=True, resize=True):
+        """
+        Decode, resize and normalize one image
+        
+        Args:
+            image: Opened PIL image
+            draft: See `load_pixels`
+            resize: See `load_pixels`
+            
+        Returns:
+            np.array: Model input of shape (1, ...)
+        """
+        return self.normalize(self.load_pixels(image, draft=draft, resize=resize)[None])
+
 
 class PlantDiseaseDetector:
     """
     Plant Disease Detection Model using CNN
     """
     
+    # True for the inference-daemon client (see core.inference_server)
+    is_remote = False
+    
     def __init__(self, model_path=None):
         """
         Initialize the model
@@ -36,27 +192,61 @@ class PlantDiseaseDetector:
         self.model_path = model_path
         self.class_indices = None
         self.image_size = (224, 224)  # Model expects 150x150 RGB images
+        self.preprocess_plan = PreprocessPlan(target_size=self.image_size)
+        self.jpeg_draft = True
+        self.batcher = None
+        self.cache = None
+        self.near_duplicates = None
+        self.model_digest = None
+        self.class_indices_digest = None
+        self.tflite_threads = None
+        self.numpy_weights_dtype = None
+        self.numpy_mmap = True
+        self.fast_inference = False
+        self.batch_buckets = (1, 4, 8, 16)
+        self._compiled = {}
+        self.batch_chunk_size = 32
+        self.decode_workers = min(4, os.cpu_count() or 1)
+        # intra/inter-op threads and oneDNN (see core.thread_tuning)
+        self.thread_config = {}
         
     def load_model(self, model_path):
         """
         Load a pre-trained model
         
-        Supports both formats:
+        Supports these formats:
         - .keras (modern Keras format - recommended)
         - .h5 (legacy HDF5 format)
+        - .tflite (TensorFlow Lite, see the `export_tflite` command)
+        - .npz (NumPy engine, see the `export_numpy_model` command; no TensorFlow needed)
         
         Args:
-            model_path: Path to the saved model file (.keras or .h5)
+            model_path: Path to the saved model file (.keras, .h5, .tflite or .npz)
             
         Returns:
             bool: True if model loaded successfully
         """
         try:
-            # Keras automatically handles both .keras and .h5 formats
-            self.model = keras.models.load_model(model_path)
+            file_ext = os.path.splitext(model_path)[1]
+            self._apply_thread_config(file_ext)
+            load_started = time.perf_counter()
+            if file_ext == '.tflite':
+                from .tflite_backend import TFLiteModel
+                self.model = TFLiteModel(
+                    model_path, num_threads=self.tflite_threads or self.thread_config.get('intra_op_threads')
+                )
+            elif file_ext == '.npz':
+                from .numpy_engine import NumpyModel
+                self.model = NumpyModel(model_path, weights_dtype=self.numpy_weights_dtype, mmap=self.numpy_mmap)
+            else:
+                # Keras automatically handles both .keras and .h5 formats
+                self.model = _keras().models.load_model(model_path)
             self.model_path = model_path
+            self.model_digest = _file_digest(model_path)
 
             # Try to detect model input size and adjust preprocessing
+            channels_first = False
+            channels = 3
             try:
                 input_shape = None
                 # Common attribute
@@ -94,11 +284,14 @@ class PlantDiseaseDetector:
                                 h = int(shape_list[0])
                                 w = int(shape_list[1])
                                 self.image_size = (w, h)
+                                channels = int(shape_list[-1])
                             # Channels-first e.g. [C, H, W]
                             elif len(shape_list) == 3 and (shape_list[0] == 1 or shape_list[0] == 3):
                                 h = int(shape_list[1])
                                 w = int(shape_list[2])
                                 self.image_size = (w, h)
+                                channels = int(shape_list[0])
+                                channels_first = True
                     except Exception:
                         # If any parsing fails, keep default image_size
                         pass
@@ -106,19 +299,64 @@ class PlantDiseaseDetector:
                 # Non-fatal: leave default image_size
                 pass
 
+            # Serving graphs (see `export_serving_model`) take uint8 images
+            # of any size and carry their target size in a Resizing layer
+            input_dtype = _model_input_dtype(self.model)
+            if input_dtype == 'uint8':
+                from .serving_graph import graph_input_size
+                self.image_size = graph_input_size(self.model) or self.image_size
+
+            # Decide normalization/size/layout once instead of on every request
+            self.preprocess_plan = PreprocessPlan.for_model(
+                self.model, self.image_size, channels=channels, channels_first=channels_first,
+                input_dtype=input_dtype
+            )
+
+            # Trace and warm one fixed-shape callable per batch bucket up front
+            startup_report.mark(f"model_load:{os.path.basename(model_path)}", load_started)
+            
+            use_compiled = self.fast_inference and file_ext not in NON_KERAS_FORMATS
+            if use_compiled:
+                with startup_report.phase('compile_warmup'):
+                    self._compiled = self._build_compiled_functions()
+            else:
+                self._compiled = {}
+
             # Determine format
-            file_ext = os.path.splitext(model_path)[1]
-            format_type = "Keras format (.keras)" if file_ext == ".keras" else "HDF5 format (.h5)"
+            format_type = {
+                ".keras": "Keras format (.keras)",
+                ".tflite": "TensorFlow Lite (.tflite)",
+                ".npz": "NumPy engine (.npz)",
+            }.get(file_ext, "HDF5 format (.h5)")
 
             print(f"Model loaded successfully from {model_path}")
             print(f"Format: {format_type}")
-            print(f"Using image_size={self.image_size} for preprocessing")
+            print(f"Using image_size={self.image_size} for preprocessing ({self.preprocess_plan})")
+            if self._compiled:
+                print(f"Fast inference buckets: {sorted(self._compiled)}")
             return True
         except Exception as e:
             print(f"Error loading model: {str(e)}")
-            print(f"Supported formats: .keras (recommended) or .h5 (legacy)")
+            print(f"Supported formats: .keras (recommended), .h5 (legacy), .tflite or .npz")
             return False
     
+    def _apply_thread_config(self, file_ext):
+        """
+        Size the runtime's thread pools from `thread_config` before the
+        model loads (TensorFlow fixes them when it runs its first op)
+        
+        Args:
+            file_ext: Extension of the model about to be loaded
+        """
+        intra = self.thread_config.get('intra_op_threads')
+        if file_ext == '.npz':
+            limit_blas_threads(intra)
+        if file_ext in NON_KERAS_FORMATS:
+            return
+        set_onednn(self.thread_config.get('onednn'))
+        _keras()  # timed separately from the model load itself
+        configure_tensorflow_threads(intra, self.thread_config.get('inter_op_threads'))
+    
     def load_class_indices(self, json_path):
         """
         Load class indices mapping
@@ -129,62 +367,119 @@ class PlantDiseaseDetector:
         try:
             with open(json_path, 'r') as f:
                 self.class_indices = json.load(f)
+            self.class_indices_digest = hashlib.sha256(
+                json.dumps(self.class_indices, sort_keys=True).encode()
+            ).hexdigest()
             print(f"Class indices loaded successfully from {json_path}")
         except Exception as e:
             print(f"Error loading class indices: {str(e)}")
     
-    def preprocess_image(self, image_path):
+    @staticmethod
+    def open_image(source):
+        """
+        Open an image from a path or straight from memory
+        
+        Args:
+            source: File path, raw bytes, a file-like object, a Django
+                UploadedFile or an already opened PIL image
+            
+        Returns:
+            PIL.Image.Image: The opened (lazily decoded) image
+        """
+        if isinstance(source, Image.Image):
+            return source
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            return Image.open(io.BytesIO(source))
+        if isinstance(source, (str, os.PathLike)):
+            return Image.open(source)
+        
+        # Large Django uploads are already spooled to a temp file by the
+        # upload handler; read that file instead of copying it again
+        if hasattr(source, 'temporary_file_path'):
+            return Image.open(source.temporary_file_path())
+        
+        # InMemoryUploadedFile wraps a BytesIO in `.file`; plain file objects work directly
+        stream = getattr(source, 'file', None) if hasattr(source, 'chunks') else None
+        stream = stream if stream is not None else source
+        if hasattr(stream, 'seek'):
+            stream.seek(0)
+        return Image.open(stream)
+    
+    @staticmethod
+    def read_image_bytes(source):
+        """
+        Read the raw encoded bytes of an image source
+        
+        Args:
+            source: File path, bytes, file-like object or Django UploadedFile
+            
+        Returns:
+            bytes or None: The encoded bytes, or None for already decoded PIL images
+        """
+        if isinstance(source, Image.Image):
+            return None
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            return bytes(source)
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, 'rb') as f:
+                return f.read()
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        return source.read()
+    
+    @property
+    def model_identity(self):
+        """
+        Short digest of the loaded model file and class map, used in cache keys
+        """
+        if self.model_digest is None:
+            return None
+        combined = f"{self.model_digest}:{self.class_indices_digest or ''}"
+        return hashlib.sha256(combined.encode()).hexdigest()[:16]
+    
+    def enable_cache(self, cache):
+        """
+        Serve repeated images from a `PredictionCache`
+        
+        Args:
+            cache: A `core.prediction_cache.PredictionCache` (None disables caching)
+        """
+        self.cache = cache
+    
+    def enable_near_duplicates(self, index):
+        """
+        Serve near-identical images (burst shots, re-encodes) from a perceptual-hash index
+        
+        Args:
+            index: A `core.prediction_cache.NearDuplicateIndex` (None disables it)
+        """
+        self.near_duplicates = index
+    
+    def _cache_key(self, source):
+        """Return (key, bytes) for a cacheable source, or (None, None)"""
+        if self.cache is None or self.model_identity is None:
+            return None, None
+        data = self.read_image_bytes(source)
+        if data is None:
+            return None, None
+        return content_key(data, self.model_identity), data
+    
+    def preprocess_image(self, image_path, resize=True):
         """
         Preprocess an image for model prediction
         
         Args:
-            image_path: Path to the image file
+            image_path: Path to the image file, or any source accepted by `open_image`
+            resize: Resize to the model's input size (see `PreprocessPlan.load_pixels`)
             
         Returns:
             np.array: Preprocessed image array
         """
         try:
-            # Open image
-            image = Image.open(image_path)
-            
-            # Convert to RGB if not already (handles RGBA, grayscale, etc.)
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            
-            # Resize to model input size (150x150)
-            image = image.resize(self.image_size)
-            
-            # Convert to array as float32
-            image_array = np.array(image).astype('float32')
-
-            # Try model-specific preprocessing if the model is known (e.g. EfficientNet)
-            _preprocessed = None
-            try:
-                model_name = getattr(self.model, 'name', '').lower() if self.model is not None else ''
-                layer_names = [l.name.lower() for l in self.model.layers[:6]] if self.model is not None else []
-
-                # EfficientNet detection
-                if 'efficientnet' in model_name or any('efficientnet' in n for n in layer_names):
-                    try:
-                        from tensorflow.keras.applications.efficientnet import preprocess_input as _eff_pre
-                        _preprocessed = _eff_pre(image_array)
-                    except Exception:
-                        _preprocessed = None
-
-                # You can add other backbone preprocess checks here (resnet, mobilenet, etc.)
-            except Exception:
-                _preprocessed = None
-
-            if _preprocessed is None:
-                # default normalization used during training for many models
-                image_array = image_array / 255.0
-            else:
-                image_array = _preprocessed
-
-            # Add batch dimension
-            image_array = np.expand_dims(image_array, axis=0)
-            
-            return image_array
+            # Open image (from disk or directly from memory)
+            with stage('read'):
+                image = self.open_image(image_path)
+            return self.preprocess_plan.apply(image, draft=self.jpeg_draft, resize=resize)
         except Exception as e:
             print(f"Error preprocessing image: {str(e)}")
             return None
@@ -193,8 +488,12 @@ class PlantDiseaseDetector:
         """
         Make a prediction on an image
         
+        When batching is enabled (see `enable_batching`) the preprocessed
+        image is queued and merged with concurrent requests into a single
+        forward pass; the returned dict is the same either way.
+        
         Args:
-            image_path: Path to the image file
+            image_path: Path to the image file, or bytes / file-like / UploadedFile
             
         Returns:
             dict: Prediction results with disease name and confidence
@@ -203,59 +502,587 @@ class PlantDiseaseDetector:
             return {"error": "Model not loaded. Please load a model first."}
         
         try:
-            # Preprocess image
-            processed_image = self.preprocess_image(image_path)
+            # Hash the bytes once; identical images share one cached result
+            with stage('cache_lookup'):
+                key, data = self._cache_key(image_path)
+            if key is not None:
+                return self.cache.get_or_compute(key, lambda: self._predict_uncached(data))
+            return self._predict_uncached(image_path)
+        
+        except Exception as e:
+            return {"error": f"Prediction failed: {str(e)}"}
+    
+    def _predict_uncached(self, image_path):
+        """Preprocess and run one image through the model (or the batcher)"""
+        try:
+            # Near-duplicate lookup on a cheap grayscale thumbnail hash
+            image_hash = None
+            processed_image = None
+            if self.near_duplicates is not None and self.model_identity is not None:
+                if isinstance(image_path, Image.Image):
+                    # dhash drafts and converts what it is given: preprocess the
+                    # caller's image first, then hash a copy of the decoded result
+                    processed_image = self.preprocess_image(image_path, resize=self._resize_single_images)
+                    if processed_image is None:
+                        return {"error": "Failed to process image"}
+                    image_hash = dhash(image_path.copy())
+                else:
+                    # A separately opened image; the model input is decoded afresh
+                    image_hash = dhash(self.open_image(image_path))
+                result = self._near_duplicate(image_hash)
+                if result is not None:
+                    return result
             
+            result = self._predict_model(image_path, processed_image)
+            if image_hash is not None:
+                self.near_duplicates.add(image_hash, self.model_identity, result)
+            return result
+        
+        except Exception as e:
+            return {"error": f"Prediction failed: {str(e)}"}
+    
+    def _predict_model(self, image_path, processed_image=None):
+        """Preprocess and run one image through the model, bypassing every cache"""
+        try:
+            # Preprocess image (unless the caller already has)
             if processed_image is None:
-                return {"error": "Failed to process image"}
-            
-            # Make prediction
-            predictions = self.model.predict(processed_image, verbose=0)
+                processed_image = self.preprocess_image(image_path, resize=self._resize_single_images)
             
-            # Get top prediction
-            predicted_class_idx = np.argmax(predictions[0])
-            confidence = float(predictions[0][predicted_class_idx])
+            if processed_image is None:
+                return {"error": "Failed to process image"}
             
-            # Get class name (if indices are loaded)
-            predicted_class_name = "Unknown"
-            if self.class_indices:
-                # Convert index to string to match JSON keys
-                idx_str = str(predicted_class_idx)
-                predicted_class_name = self.class_indices.get(idx_str, "Unknown")
+            # Make prediction (with batching, includes the wait for company)
+            with stage('inference'):
+                if self.batcher is not None:
+                    scores = self.batcher.submit(processed_image[0])
+                else:
+                    scores = self._run_model(processed_image)[0]
             
-            return {
-                "disease": predicted_class_name,
-                "confidence": confidence,
-                "all_predictions": {
-                    "class_index": int(predicted_class_idx),
-                    "confidence_scores": predictions[0].tolist()
-                }
-            }
+            with stage('postprocess'):
+                return self._format_prediction(scores)
         
         except Exception as e:
             return {"error": f"Prediction failed: {str(e)}"}
     
-    def predict_batch(self, image_paths):
+    @property
+    def _resize_single_images(self):
+        # A serving graph resizes in-graph, so a lone image goes in at its
+        # decoded size; the batcher stacks images and needs them resized
+        return self.batcher is not None or not self.preprocess_plan.resizes_in_graph
+    
+    def _near_duplicate(self, image_hash):
+        """Earlier result for a near-identical image, or None"""
+        result, _ = self.near_duplicates.lookup(image_hash, self.model_identity)
+        return result
+    
+    def _run_model(self, batch):
+        """
+        Run the model forward pass on a preprocessed batch
+        
+        Args:
+            batch: Array of shape (N, H, W, C)
+            
+        Returns:
+            np.array: Class scores of shape (N, num_classes)
+        """
+        compiled = self._compiled
+        if not compiled:
+            return np.asarray(self.model.predict(batch, verbose=0))
+        
+        # Pad each chunk up to the nearest bucket so no call ever retraces
+        buckets = sorted(compiled)
+        outputs = []
+        for start in range(0, len(batch), buckets[-1]):
+            chunk = batch[start:start + buckets[-1]]
+            n = len(chunk)
+            bucket = next(b for b in buckets if b >= n)
+            if bucket != n:
+                padded = np.zeros((bucket,) + chunk.shape[1:], dtype=chunk.dtype)
+                padded[:n] = chunk
+                chunk = padded
+            outputs.append(compiled[bucket](chunk).numpy()[:n])
+        return np.concatenate(outputs, axis=0)
+    
+    def enable_fast_inference(self, buckets=(1, 4, 8, 16)):
+        """
+        Serve predictions from pre-traced fixed-signature callables
+        
+        `keras.Model.predict` builds a data adapter and dispatches callbacks
+        on every call. In fast mode one concrete function per batch-size
+        bucket is traced and warmed at `load_model` time; batches are padded
+        up to the nearest bucket.
+        
+        Args:
+            buckets: Batch sizes to compile, e.g. (1, 4, 8, 16)
+        """
+        self.fast_inference = True
+        self.batch_buckets = tuple(sorted({max(1, int(b)) for b in buckets}))
+        if self.model is not None and os.path.splitext(str(self.model_path))[1] not in NON_KERAS_FORMATS:
+            self._compiled = self._build_compiled_functions()
+    
+    def _build_compiled_functions(self):
+        """
+        Trace and warm one concrete function per batch bucket
+        
+        Returns:
+            dict: bucket size -> concrete function taking a batch in the model's input dtype
+        """
+        import tensorflow as tf
+        
+        model = self.model
+        dtype = tf.uint8 if self.preprocess_plan.normalization == 'graph' else tf.float32
+        input_shape = None
+        try:
+            input_shape = tuple(model.inputs[0].shape[1:])
+        except Exception:
+            pass
+        if not input_shape or any(d is None for d in input_shape):
+            input_shape = (self.image_size[1], self.image_size[0], 3)
+        warmup_shape = input_shape
+        if self.preprocess_plan.resizes_in_graph:
+            # Any image size; the graph resizes (see `_resize_single_images`)
+            input_shape = (None, None, self.preprocess_plan.channels)
+        
+        @tf.function(reduce_retracing=True)
+        def forward(x):
+            return model(x, training=False)
+        
+        compiled = {}
+        for bucket in self.batch_buckets:
+            spec = tf.TensorSpec((bucket,) + input_shape, dtype)
+            fn = forward.get_concrete_function(spec)
+            fn(tf.zeros((bucket,) + warmup_shape, dtype))  # warmup run
+            compiled[bucket] = fn
+        return compiled
+    
+    def _format_prediction(self, scores):
+        """
+        Build the result dict for one row of model output
+        
+        Args:
+            scores: 1-D array of class scores
+            
+        Returns:
+            dict: Prediction results with disease name and confidence
+        """
+        return format_prediction(scores, self.class_indices)
+    
+    def enable_batching(self, max_batch_size=8, max_wait_ms=5.0):
+        """
+        Route `predict` through a dynamic micro-batching scheduler
+        
+        Args:
+            max_batch_size: Largest number of images merged into one forward pass
+            max_wait_ms: How long the first queued request waits for company
+        """
+        if self.batcher is not None:
+            self.batcher.stop()
+        self.batcher = BatchScheduler(
+            self._run_model,
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_wait_ms,
+        )
+    
+    def disable_batching(self):
+        """Stop the batching scheduler and go back to one forward pass per call"""
+        if self.batcher is not None:
+            self.batcher.stop()
+            self.batcher = None
+    
+    def reset_after_fork(self):
+        """
+        Rebuild per-process runtime state in a forked worker (call from
+        Gunicorn's post_fork hook). Model weights loaded by the parent stay
+        shared copy-on-write; threads, locks, queues and interpreter handles
+        do not survive fork() and are recreated here.
+        """
+        if self.batcher is not None:
+            # The inherited scheduler's worker thread is gone; start over
+            self.batcher = BatchScheduler(
+                self._run_model,
+                max_batch_size=self.batcher.max_batch_size,
+                max_wait_ms=self.batcher.max_wait * 1000.0,
+            )
+        if self.cache is not None:
+            self.cache.reset_after_fork()
+        if self.near_duplicates is not None:
+            self.near_duplicates.reset_after_fork()
+        if hasattr(self.model, 'reset_after_fork'):
+            self.model.reset_after_fork()
+    
+    def predict_preprocessed(self, batch):
+        """
+        Run already preprocessed images through the model in one forward
+        pass, for callers that decode on their own schedule (predict_dir)
+        
+        Args:
+            batch: Array of shape (N, ...) from `preprocess_image` outputs
+            
+        Returns:
+            list: Prediction results, one per row
+        """
+        with stage('inference'):
+            scores = self._run_model(batch)
+        with stage('postprocess'):
+            return [self._format_prediction(row) for row in scores]
+    
+    def predict_batch(self, image_paths, max_batch_size=None):
         """
         Make predictions on multiple images
         
+        Images are decoded in parallel, stacked into one array and run
+        through the model in chunks of at most `max_batch_size` images, so
+        N images cost ceil(N / max_batch_size) forward passes instead of N.
+        The prediction cache and the near-duplicate index are consulted and
+        filled exactly as by `predict`.
+        
         Args:
-            image_paths: List of image file paths
+            image_paths: List of image file paths, bytes, file-like or UploadedFile objects
+            max_batch_size: Largest chunk per forward pass (defaults to `batch_chunk_size`)
             
         Returns:
-            list: List of prediction results
+            list: List of prediction results, in the same order as `image_paths`
         """
-        results = []
-        for image_path in image_paths:
-            result = self.predict(image_path)
+        image_paths = list(image_paths)
+        if self.model is None:
+            return [
+                {"error": "Model not loaded. Please load a model first.", "image_path": p}
+                for p in image_paths
+            ]
+        
+        chunk_size = max(1, int(max_batch_size or self.batch_chunk_size))
+        results = [None] * len(image_paths)
+        
+        # Serve cached images first; only the misses are decoded and run
+        sources = list(image_paths)
+        keys = [None] * len(image_paths)
+        cached = set()
+        if self.cache is not None:
+            with stage('cache_lookup'):
+                for i, image_path in enumerate(image_paths):
+                    try:
+                        keys[i], data = self._cache_key(image_path)
+                    except Exception:
+                        keys[i], data = None, None
+                    if keys[i] is not None:
+                        results[i] = self.cache.get(keys[i])
+                        sources[i] = data
+                        if results[i] is not None:
+                            cached.add(i)
+        pending = [i for i in range(len(image_paths)) if results[i] is None]
+        
+        # Near-duplicate lookup on separately opened images; already decoded
+        # PIL images are hashed after preprocessing (see `_predict_uncached`)
+        hashes = [None] * len(image_paths)
+        use_index = self.near_duplicates is not None and self.model_identity is not None
+        if use_index:
+            for i in pending:
+                if isinstance(sources[i], Image.Image):
+                    continue
+                try:
+                    hashes[i] = dhash(self.open_image(sources[i]))
+                except Exception:
+                    continue  # Left to preprocessing to report
+                results[i] = self._near_duplicate(hashes[i])
+            pending = [i for i in pending if results[i] is None]
+        
+        # Decode + resize in parallel; PIL releases the GIL while decoding
+        processed = {}
+        workers = max(1, min(self.decode_workers, len(pending)))
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                arrays = list(pool.map(bind(self.preprocess_image), [sources[i] for i in pending]))
+        else:
+            arrays = [self.preprocess_image(sources[i]) for i in pending]
+        
+        valid = []
+        for i, array in zip(pending, arrays):
+            if array is None:
+                results[i] = {"error": "Failed to process image"}
+                continue
+            if use_index and isinstance(sources[i], Image.Image):
+                hashes[i] = dhash(sources[i].copy())
+                results[i] = self._near_duplicate(hashes[i])
+                if results[i] is not None:
+                    continue
+            processed[i] = array
+            valid.append(i)
+        
+        for start in range(0, len(valid), chunk_size):
+            chunk = valid[start:start + chunk_size]
+            try:
+                batch = np.concatenate([processed[i] for i in chunk], axis=0)
+                with stage('inference'):
+                    scores = self._run_model(batch)
+                with stage('postprocess'):
+                    for i, row in zip(chunk, scores):
+                        results[i] = self._format_prediction(row)
+                        if hashes[i] is not None:
+                            self.near_duplicates.add(hashes[i], self.model_identity, results[i])
+            except Exception as e:
+                for i in chunk:
+                    results[i] = {"error": f"Prediction failed: {str(e)}"}
+        
+        # Near-duplicate hits are cached too, as `predict` does
+        if self.cache is not None:
+            for i in range(len(image_paths)):
+                if keys[i] is not None and i not in cached and 'error' not in results[i]:
+                    self.cache.set(keys[i], results[i])
+        
+        for image_path, result in zip(image_paths, results):
             result['image_path'] = image_path
-            results.append(result)
         return results
 
 
+def format_prediction(scores, class_indices):
+    """
+    Result dict for one row of class scores
+    
+    Args:
+        scores: 1-D array of class scores
+        class_indices: {"<index>": "<class name>"} map, or None
+        
+    Returns:
+        dict: Prediction results with disease name and confidence
+    """
+    # Get top prediction
+    predicted_class_idx = np.argmax(scores)
+    confidence = float(scores[predicted_class_idx])
+    
+    # Get class name (if indices are loaded)
+    predicted_class_name = "Unknown"
+    if class_indices:
+        # Convert index to string to match JSON keys
+        idx_str = str(predicted_class_idx)
+        predicted_class_name = class_indices.get(idx_str, "Unknown")
+    
+    return {
+        "disease": predicted_class_name,
+        "confidence": confidence,
+        "all_predictions": {
+            "class_index": int(predicted_class_idx),
+            "confidence_scores": scores.tolist()
+        }
+    }
+
+
+def _model_input_dtype(model):
+    """Input dtype name of a loaded model ('float32' when unknown)"""
+    try:
+        dtype = model.inputs[0].dtype
+        return getattr(dtype, 'name', str(dtype))
+    except Exception:
+        return 'float32'
+
+
+def _file_digest(path, chunk_size=1024 * 1024):
+    """SHA-256 of a file's contents, read in chunks"""
+    if not os.path.isfile(path):
+        # SavedModel directories: fall back to the path itself
+        return hashlib.sha256(os.path.abspath(path).encode()).hexdigest()
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class _PendingRequest:
+    """A single image waiting in the batching queue"""
+    
+    __slots__ = ('image', 'enqueued_at', 'done', 'scores', 'error')
+    
+    def __init__(self, image):
+        self.image = image
+        self.enqueued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.scores = None
+        self.error = None
+
+
+class BatchScheduler:
+    """
+    Dynamic micro-batching in front of a model forward pass
+    
+    Callers hand in one preprocessed image each and block until their row of
+    the batched output is ready. A background thread takes the first queued
+    image, keeps collecting until either `max_batch_size` images are queued
+    or `max_wait_ms` has passed since the first one arrived, and then runs a
+    single forward pass for the whole group.
+    """
+    
+    def __init__(self, run_batch, max_batch_size=8, max_wait_ms=5.0, stats_window=1024):
+        """
+        Args:
+            run_batch: Callable taking an (N, H, W, C) array and returning (N, classes) scores
+            max_batch_size: Largest batch handed to `run_batch`
+            max_wait_ms: Longest time the oldest queued request waits before its batch runs
+            stats_window: Number of recent queue-wait samples kept for percentiles
+        """
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        
+        self._queue = queue.Queue()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._stopped = False
+        
+        self._stats_lock = threading.Lock()
+        self._requests = 0
+        self._batches = 0
+        self._batch_sizes = {}
+        self._waits = []
+        self._stats_window = stats_window
+        self._max_wait_seen = 0.0
+    
+    def submit(self, image, timeout=None):
+        """
+        Queue one preprocessed image and wait for its scores
+        
+        Args:
+            image: Array of shape (H, W, C), without the batch dimension
+            timeout: Optional number of seconds to wait for the result
+            
+        Returns:
+            np.array: 1-D class scores for this image
+        """
+        self._ensure_worker()
+        pending = _PendingRequest(image)
+        self._queue.put(pending)
+        if not pending.done.wait(timeout):
+            raise TimeoutError("Timed out waiting for batched prediction")
+        if pending.error is not None:
+            raise pending.error
+        return pending.scores
+    
+    def stop(self):
+        """Stop the background thread once the queue is drained"""
+        self._stopped = True
+        self._queue.put(None)
+    
+    def stats(self):
+        """
+        Batch-size and queue-wait statistics since the scheduler started
+        
+        Returns:
+            dict: Request/batch counts, batch size histogram and queue wait percentiles (ms)
+        """
+        with self._stats_lock:
+            waits = sorted(self._waits)
+            sizes = dict(sorted(self._batch_sizes.items()))
+            requests = self._requests
+            batches = self._batches
+            max_wait_seen = self._max_wait_seen
+        
+        def percentile(p):
+            if not waits:
+                return 0.0
+            return waits[min(len(waits) - 1, int(round(p / 100.0 * (len(waits) - 1))))] * 1000.0
+        
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "requests": requests,
+            "batches": batches,
+            "mean_batch_size": (requests / batches) if batches else 0.0,
+            "batch_size_histogram": {str(k): v for k, v in sizes.items()},
+            "queue_wait_ms": {
+                "p50": percentile(50),
+                "p95": percentile(95),
+                "p99": percentile(99),
+                "max": max_wait_seen * 1000.0,
+            },
+            "queue_depth": self._queue.qsize(),
+        }
+    
+    def _ensure_worker(self):
+        # Started lazily so the thread is created in the process that serves requests
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopped = False
+                self._thread = threading.Thread(
+                    target=self._worker, name='predict-batcher', daemon=True
+                )
+                self._thread.start()
+    
+    def _collect(self, first):
+        batch = [first]
+        deadline = first.enqueued_at + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining > 0:
+                    item = self._queue.get(timeout=remaining)
+                else:
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Put the stop marker back for the outer loop
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+    
+    def _worker(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                if self._stopped:
+                    return
+                continue
+            
+            batch = self._collect(first)
+            started = time.perf_counter()
+            try:
+                scores = self.run_batch(np.stack([item.image for item in batch]))
+                for item, row in zip(batch, scores):
+                    item.scores = row
+            except Exception as e:
+                for item in batch:
+                    item.error = e
+            finally:
+                self._record(batch, started)
+                for item in batch:
+                    item.done.set()
+    
+    def _record(self, batch, started):
+        with self._stats_lock:
+            self._requests += len(batch)
+            self._batches += 1
+            self._batch_sizes[len(batch)] = self._batch_sizes.get(len(batch), 0) + 1
+            for item in batch:
+                wait = started - item.enqueued_at
+                self._waits.append(wait)
+                if wait > self._max_wait_seen:
+                    self._max_wait_seen = wait
+            if len(self._waits) > self._stats_window:
+                del self._waits[:len(self._waits) - self._stats_window]
+
+
 # Global model instance + lock for thread-safe lazy initialization
 _detector_instance = None
 _detector_lock = threading.Lock()
+# Unix socket of the inference daemon; when set get_detector() returns a client
+_remote_socket = None
+
+
+def configure_remote(socket_path):
+    """
+    Serve predictions from the inference daemon instead of in-process
+    
+    Args:
+        socket_path: Unix socket of `run_inference_server`, or None for a
+            local detector. Drops the current instance if the mode changes.
+    """
+    global _remote_socket, _detector_instance
+    with _detector_lock:
+        if (socket_path or None) != _remote_socket:
+            _remote_socket = socket_path or None
+            _detector_instance = None
 
 
 def get_detector():
@@ -263,16 +1090,70 @@ def get_detector():
     Thread-safe get-or-create for the global detector instance.
 
     Returns:
-        PlantDiseaseDetector: The detector instance
+        PlantDiseaseDetector: The detector instance (an InferenceClient
+        proxy with the same API when the inference daemon is configured)
     """
     global _detector_instance
     if _detector_instance is None:
         with _detector_lock:
             if _detector_instance is None:
-                _detector_instance = PlantDiseaseDetector()
+                if _remote_socket:
+                    from .inference_server import InferenceClient
+                    _detector_instance = InferenceClient(_remote_socket)
+                else:
+                    _detector_instance = PlantDiseaseDetector()
     return _detector_instance
 
 
+def install_detector(detector):
+    """
+    Atomically make `detector` the one get_detector() returns (see
+    core.model_registry, which swaps in fully loaded replacements)
+    
+    Args:
+        detector: A loaded PlantDiseaseDetector
+        
+    Returns:
+        PlantDiseaseDetector or None: The detector it replaced
+    """
+    global _detector_instance
+    with _detector_lock:
+        previous, _detector_instance = _detector_instance, detector
+    return previous
+
+
+# Loads the default model on demand when startup preloading was skipped
+_model_loader = None
+_model_load_lock = threading.Lock()
+
+
+def set_model_loader(loader):
+    """
+    Register the callable that loads the default model on first use
+    
+    Args:
+        loader: Zero-argument callable (see CoreConfig.preload_model)
+    """
+    global _model_loader
+    _model_loader = loader
+
+
+def ensure_model_loaded():
+    """
+    Return the global detector, loading the default model first if nothing
+    has been loaded yet (e.g. preloading was skipped at startup)
+    
+    Returns:
+        PlantDiseaseDetector: The detector instance
+    """
+    detector = get_detector()
+    if detector.model is None and _model_loader is not None:
+        with _model_load_lock:
+            if detector.model is None:
+                _model_loader()
+    return detector
+
+
 def initialize_model(model_path=None, class_indices_path=None):
     """
     Initialize the model with optional paths
@@ -0,0 +1,381 @@
+# model_registry.py
+"""
+Registry of named, versioned models for Plant Disease Prediction
+Every entry is a complete detector - model, class map and preprocessing
+plan - so a request that picked an entry sees a consistent set for its whole
+lifetime. Replacements load on a background thread into a fresh detector
+and are installed with one reference swap; the entry they replace finishes
+its in-flight requests and is then retired. With a memory budget, idle
+models are evicted least recently used first and reloaded on demand.
+"""
+
+import gc
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from .ml_model import PlantDiseaseDetector, ensure_model_loaded, get_detector, install_detector
+from .resources import rss_mb
+
+logger = logging.getLogger(__name__)
+
+
+class UnknownModel(Exception):
+    """Raised when a request names a model the registry does not know"""
+
+
+class ModelEntry:
+    """
+    One resident model version
+
+    Attributes:
+        name: Registry name ('cnn_simple', 'efficientnetb0', 'default', ...)
+        version: Increments every time `name` is (re)loaded; None for the
+            unmanaged detector used when nothing is registered
+        detector: The loaded PlantDiseaseDetector
+        memory_mb: Resident memory attributed to the model (RSS growth
+            during the load, or the file size if that cannot be measured)
+    """
+
+    def __init__(self, name, version, detector, class_indices_path=None, memory_mb=0.0):
+        self.name = name
+        self.version = version
+        self.detector = detector
+        self.model_path = detector.model_path
+        self.class_indices_path = class_indices_path
+        self.memory_mb = memory_mb
+        self.loaded_at = time.time()
+        self.last_used = time.monotonic()
+        self.in_flight = 0
+        self.retired = False
+        self.pinned = False
+
+    def describe(self):
+        """
+        Returns:
+            dict: JSON-serializable summary
+        """
+        return {
+            'name': self.name,
+            'version': self.version,
+            'model_path': self.model_path,
+            'model_identity': self.detector.model_identity,
+            'memory_mb': round(self.memory_mb, 1),
+            'in_flight': self.in_flight,
+            'idle_seconds': round(time.monotonic() - self.last_used, 1),
+            'loaded_at': self.loaded_at,
+        }
+
+
+def _file_size_mb(path):
+    try:
+        return os.path.getsize(path) / (1024.0 * 1024.0)
+    except (OSError, TypeError):
+        return 0.0
+
+
+class ModelRegistry:
+    """
+    Named model versions with background loading, atomic swap and LRU eviction
+    """
+
+    def __init__(self, memory_budget_mb=0, configure=None):
+        """
+        Args:
+            memory_budget_mb: Most memory resident models may take
+                together; 0 means no limit. The default model is never evicted.
+            configure: Callable applied to every new detector before it loads
+                (CoreConfig.configure_detector)
+        """
+        self.memory_budget_mb = float(memory_budget_mb or 0)
+        self._configure = configure
+        self._specs = {}
+        self._entries = {}
+        self._versions = {}
+        self._loading = {}
+        self.default_name = None
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix='model-load')
+
+    def register(self, name, model_path, class_indices_path=None):
+        """
+        Make `name` loadable on demand without loading it yet
+
+        Args:
+            name: Registry name
+            model_path: Model file
+            class_indices_path: Class indices JSON (optional)
+        """
+        with self._lock:
+            self._specs[name] = (model_path, class_indices_path)
+
+    def register_detector(self, name, detector):
+        """
+        Serve a detector-like object that holds no model of its own (such as
+        core.cascade.CascadeDetector, which uses other entries); it is
+        never evicted or made the default
+
+        Args:
+            name: Registry name
+            detector: Object with the PlantDiseaseDetector predict API
+        """
+        entry = ModelEntry(name, 1, detector)
+        entry.pinned = True
+        with self._lock:
+            self._entries[name] = entry
+
+    def names(self):
+        """Names that can be requested"""
+        with self._lock:
+            return sorted(set(self._specs) | set(self._entries))
+
+    def spec(self, name):
+        """
+        Returns:
+            tuple or None: (model_path, class_indices_path) registered for `name`
+        """
+        with self._lock:
+            return self._specs.get(name)
+
+    def resident(self, name):
+        """
+        Returns:
+            ModelEntry or None: Current version of `name` if it is loaded;
+            only use() keeps it from being evicted or retired
+        """
+        with self._lock:
+            return self._entries.get(name)
+
+    def adopt(self, name, detector, class_indices_path=None):
+        """
+        Record an already loaded detector (the model preloaded at startup)
+        as the current version of `name`; the first model becomes the default
+
+        Args:
+            name: Registry name
+            detector: Loaded PlantDiseaseDetector
+            class_indices_path: Class map it was loaded with
+
+        Returns:
+            ModelEntry: The new entry
+        """
+        with self._lock:
+            self._specs.setdefault(name, (detector.model_path, class_indices_path))
+        return self._install(name, detector, class_indices_path, _file_size_mb(detector.model_path))
+
+    def load(self, name, model_path=None, class_indices_path=None):
+        """
+        Load (a new version of) `name` on the background loader thread. The
+        current version keeps serving until the new one is ready.
+
+        Args:
+            name: Registry name
+            model_path: New model file; omit to reload the registered one
+            class_indices_path: Class map for `model_path` (default: keep
+                the current one)
+
+        Returns:
+            concurrent.futures.Future: Resolves to the installed ModelEntry
+
+        Raises:
+            UnknownModel: If `name` is not registered and no path is given
+        """
+        if get_detector().is_remote:
+            raise RuntimeError('The inference daemon serves a single model; named models need '
+                               'the in-process backend (unset INFERENCE_SOCKET)')
+        with self._lock:
+            if model_path:
+                # Without a new class map the current one carries over
+                previous = self._specs.get(name, (None, None))[1]
+                self._specs[name] = (model_path, class_indices_path or previous)
+            elif name not in self._specs:
+                raise UnknownModel(name)
+            spec = self._specs[name]
+            pending = self._loading.get(name)
+            if pending is not None and pending[0] == spec:
+                return pending[1]
+            future = self._loader.submit(self._build, name, *spec)
+            self._loading[name] = (spec, future)
+        future.add_done_callback(lambda f: self._load_done(name, f))
+        return future
+
+    def _load_done(self, name, future):
+        with self._lock:
+            if self._loading.get(name, (None, None))[1] is future:
+                del self._loading[name]
+
+    def _build(self, name, model_path, class_indices_path):
+        detector = PlantDiseaseDetector()
+        if self._configure is not None:
+            self._configure(detector)
+        before = rss_mb()
+        if not detector.load_model(model_path):
+            raise RuntimeError(f'Could not load {model_path}')
+        if class_indices_path and os.path.exists(class_indices_path):
+            detector.load_class_indices(class_indices_path)
+        after = rss_mb()
+        grown = after - before if before is not None and after is not None else 0.0
+        return self._install(name, detector, class_indices_path, grown if grown > 0 else _file_size_mb(model_path))
+
+    def _install(self, name, detector, class_indices_path, memory_mb):
+        with self._lock:
+            version = self._versions.get(name, 0) + 1
+            self._versions[name] = version
+            entry = ModelEntry(name, version, detector, class_indices_path, memory_mb)
+            previous = self._entries.get(name)
+            self._entries[name] = entry
+            if self.default_name is None:
+                self.default_name = name
+            if name == self.default_name:
+                install_detector(detector)
+            if previous is not None and previous.detector is not detector:
+                self._retire(previous)
+            evicted = self._evict(keep=name)
+        logger.info(f"Installed model {name} v{version} ({entry.model_path}, ~{memory_mb:.0f} MB)")
+        self._collect(evicted)
+        return entry
+
+    @staticmethod
+    def _retire(entry):
+        # Called with the lock held; stop the scheduler once nobody uses it
+        entry.retired = True
+        if entry.in_flight == 0:
+            entry.detector.disable_batching()
+
+    def _evict(self, keep=None):
+        # Called with the lock held; returns the evicted entries
+        if not self.memory_budget_mb:
+            return []
+        evicted = []
+        for entry in sorted(self._entries.values(), key=lambda e: e.last_used):
+            if sum(e.memory_mb for e in self._entries.values()) <= self.memory_budget_mb:
+                break
+            if entry.name in (keep, self.default_name) or entry.in_flight or entry.pinned:
+                continue
+            del self._entries[entry.name]
+            self._retire(entry)
+            self.evictions += 1
+            evicted.append(entry)
+        return evicted
+
+    @staticmethod
+    def _collect(evicted):
+        for entry in evicted:
+            logger.info(f"Evicted idle model {entry.name} v{entry.version} (~{entry.memory_mb:.0f} MB)")
+        if evicted:
+            gc.collect()
+
+    @contextmanager
+    def use(self, name=None):
+        """
+        Hold a model for the duration of one request; it cannot be evicted
+        or retired meanwhile, and a concurrent swap does not affect it
+
+        Args:
+            name: Registry name, or None for the default model
+
+        Yields:
+            ModelEntry: Entry whose `detector` serves the request
+
+        Raises:
+            UnknownModel: If `name` is not registered
+        """
+        entry = self._acquire(name)
+        try:
+            yield entry
+        finally:
+            self._release(entry)
+
+    def _acquire(self, name):
+        if name is None:
+            # Loads (and adopts) the default model if startup skipped it
+            ensure_model_loaded()
+            name = self.default_name
+            if name is None:
+                # Loaded outside the registry (e.g. by the inference daemon)
+                return ModelEntry(None, None, get_detector())
+        while True:
+            with self._lock:
+                entry = self._entries.get(name)
+                if entry is not None:
+                    entry.in_flight += 1
+                    entry.last_used = time.monotonic()
+                    return entry
+            if name not in self.names():
+                raise UnknownModel(name)
+            self.load(name).result()
+
+    def _release(self, entry):
+        if entry.name is None:
+            return
+        with self._lock:
+            entry.in_flight -= 1
+            if entry.retired and entry.in_flight == 0:
+                entry.detector.disable_batching()
+            evicted = self._evict()
+        self._collect(evicted)
+
+    def stats(self):
+        """
+        Returns:
+            dict: Default model, budget and the resident / loading / available models
+        """
+        with self._lock:
+            entries = [entry.describe() for entry in self._entries.values()]
+            loading = sorted(self._loading)
+        return {
+            'default': self.default_name,
+            'memory_budget_mb': self.memory_budget_mb or None,
+            'resident_mb': round(sum(e['memory_mb'] for e in entries), 1),
+            'evictions': self.evictions,
+            'resident': entries,
+            'loading': loading,
+            'available': self.names(),
+        }
+
+    def reset_after_fork(self):
+        """
+        Recreate locks, the loader thread and every detector's runtime state
+        in a forked worker (see PlantDiseaseDetector.reset_after_fork)
+        """
+        self._lock = threading.Lock()
+        self._loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix='model-load')
+        self._loading = {}
+        detectors = {id(get_detector()): get_detector()}
+        for entry in self._entries.values():
+            entry.in_flight = 0
+            detectors[id(entry.detector)] = entry.detector
+        for detector in detectors.values():
+            detector.reset_after_fork()
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """
+    Process-wide registry with every model CoreConfig finds in models/
+    registered (see CoreConfig.register_models), bounded by MODEL_MEMORY_BUDGET_MB
+
+    Returns:
+        ModelRegistry: The shared registry
+    """
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                from django.apps import apps
+                from django.conf import settings
+                config = apps.get_app_config('core')
+                registry = ModelRegistry(
+                    memory_budget_mb=getattr(settings, 'MODEL_MEMORY_BUDGET_MB', 0),
+                    configure=config.configure_detector,
+                )
+                config.register_models(registry)
+                _registry = registry
+    return _registry
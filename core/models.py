@@ -1,3 +1,74 @@
+import uuid
+
 from django.db import models
 
 # Create your models here.
+
+
+class CachedPrediction(models.Model):
+    """Persistent tier of the prediction cache (see core.prediction_cache)."""
+
+    key = models.CharField(max_length=128, unique=True)
+    result = models.JSONField()
+    created_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.key
+
+
+class PredictionJob(models.Model):
+    """Asynchronous batch prediction over an uploaded archive (see core.batch_jobs)."""
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+        (CANCELLED, 'Cancelled'),
+    ]
+    FINISHED = (DONE, FAILED, CANCELLED)
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED, db_index=True)
+    model = models.CharField(max_length=128, blank=True)
+    archive = models.CharField(max_length=512)
+    total = models.PositiveIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    errors = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    worker = models.CharField(max_length=128, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+
+    def __str__(self):
+        return f"{self.id} ({self.status})"
+
+
+class PredictionJobResult(models.Model):
+    """One image of a PredictionJob, written as soon as its batch is scored."""
+
+    job = models.ForeignKey(PredictionJob, on_delete=models.CASCADE, related_name='results')
+    index = models.PositiveIntegerField()
+    filename = models.CharField(max_length=512)
+    predicted_class = models.CharField(max_length=128, blank=True)
+    confidence = models.FloatField(null=True, blank=True)
+    error = models.CharField(max_length=256, blank=True)
+
+    class Meta:
+        ordering = ['job', 'index']
+        constraints = [
+            models.UniqueConstraint(fields=['job', 'index'], name='unique_prediction_job_result'),
+        ]
+
+    def __str__(self):
+        return f"{self.job_id}[{self.index}] {self.filename}"
@@ -0,0 +1,360 @@
+# numpy_engine.py
+"""
+TensorFlow-free inference engine for small sequential CNNs
+Exports a Keras model's layer graph and weights to a flat .npz file and runs
+it with NumPy only: convolutions are lowered to im2col + a single BLAS matmul
+per layer, pooling uses strided window views
+"""
+
+import json
+import os
+import struct
+import zipfile
+from types import SimpleNamespace
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Layer types the engine can run, with the config keys it needs from each
+SUPPORTED_LAYERS = {
+    'InputLayer': (),
+    'Rescaling': ('scale', 'offset'),
+    'Conv2D': ('filters', 'kernel_size', 'strides', 'padding', 'activation', 'use_bias',
+               'dilation_rate', 'groups', 'data_format'),
+    'Dense': ('units', 'activation', 'use_bias'),
+    'MaxPooling2D': ('pool_size', 'strides', 'padding', 'data_format'),
+    'AveragePooling2D': ('pool_size', 'strides', 'padding', 'data_format'),
+    'GlobalAveragePooling2D': ('data_format', 'keepdims'),
+    'GlobalMaxPooling2D': ('data_format', 'keepdims'),
+    'BatchNormalization': ('axis', 'epsilon', 'center', 'scale'),
+    'Flatten': ('data_format',),
+    'Dropout': (),
+    'SpatialDropout2D': (),
+    'Activation': ('activation',),
+    'ReLU': ('max_value', 'negative_slope', 'threshold'),
+    'Softmax': ('axis',),
+}
+
+
+def _softmax(x, axis=-1):
+    x = x - np.max(x, axis=axis, keepdims=True)
+    np.exp(x, out=x)
+    x /= np.sum(x, axis=axis, keepdims=True)
+    return x
+
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    None: lambda x: x,
+    'relu': lambda x: np.maximum(x, 0, out=x),
+    'relu6': lambda x: np.clip(x, 0, 6, out=x),
+    'sigmoid': lambda x: 1.0 / (1.0 + np.exp(-x)),
+    'tanh': np.tanh,
+    'softmax': _softmax,
+    'swish': lambda x: x / (1.0 + np.exp(-x)),
+    'silu': lambda x: x / (1.0 + np.exp(-x)),
+    'elu': lambda x: np.where(x > 0, x, np.expm1(np.minimum(x, 0))),
+}
+
+
+def _activation_name(activation):
+    # Keras configs store activations as strings (or serialized dicts)
+    if isinstance(activation, dict):
+        activation = activation.get('config', {}).get('name') or activation.get('class_name')
+    return activation
+
+
+def _inbound_names(layer):
+    # Names of the layers feeding `layer`, or None if Keras does not expose them
+    try:
+        return [node.operation.name for node in layer._inbound_nodes[0].parent_nodes]
+    except (AttributeError, IndexError):
+        return None
+
+
+def _normalization_axis(axis):
+    # Keras stores BatchNormalization's axis as an int or a one-item list
+    if isinstance(axis, (list, tuple)):
+        if len(axis) != 1:
+            raise ValueError(f"Expected a single axis, got {axis}")
+        axis = axis[0]
+    return -1 if axis is None else int(axis)
+
+
+def export_keras_model(keras_model, output_path, float16=False):
+    """
+    Write a sequential Keras model to a flat .npz file
+
+    Args:
+        keras_model: Loaded Keras model whose layers form a single chain
+        output_path: Destination .npz path
+        float16: Store weights as float16 (half the file and resident size)
+
+    Returns:
+        dict: The layer spec that was written
+
+    Raises:
+        ValueError: If a layer type or option is not supported
+    """
+    layers, arrays = [], {}
+    previous = None
+    for index, layer in enumerate(keras_model.layers):
+        kind = layer.__class__.__name__
+        if kind not in SUPPORTED_LAYERS:
+            raise ValueError(f"Layer '{layer.name}' of type {kind} is not supported by the NumPy engine")
+        if previous is not None and _inbound_names(layer) not in (None, [previous.name]):
+            raise ValueError("Only sequential (single-chain) models can be exported")
+        previous = layer
+
+        config = layer.get_config()
+        options = {key: config.get(key) for key in SUPPORTED_LAYERS[kind]}
+        if 'activation' in options:
+            options['activation'] = _activation_name(options['activation'])
+            if options['activation'] not in ACTIVATIONS:
+                raise ValueError(f"Activation '{options['activation']}' in '{layer.name}' is not supported")
+        if options.get('data_format') not in (None, 'channels_last'):
+            raise ValueError(f"Layer '{layer.name}' uses {options['data_format']}; only channels_last is supported")
+        if kind == 'Conv2D' and (tuple(options['dilation_rate']) != (1, 1) or options['groups'] != 1):
+            raise ValueError(f"Conv2D '{layer.name}' uses dilation or groups, which are not supported")
+        if kind == 'BatchNormalization':
+            try:
+                options['axis'] = _normalization_axis(options['axis'])
+            except ValueError:
+                raise ValueError(f"BatchNormalization '{layer.name}' normalizes several axes, which is not supported")
+
+        weights = layer.get_weights()
+        for j, weight in enumerate(weights):
+            arrays[f'w{index}_{j}'] = weight.astype(np.float16 if float16 else np.float32)
+        layers.append({'type': kind, 'name': layer.name, 'config': options, 'weights': len(weights)})
+
+    spec = {
+        'name': keras_model.name,
+        'input_shape': [d for d in keras_model.input_shape[1:]],
+        'layers': layers,
+        'float16': bool(float16),
+    }
+    arrays['__spec__'] = np.frombuffer(json.dumps(spec).encode('utf-8'), dtype=np.uint8)
+    np.savez(output_path, **arrays)
+    return spec
+
+
+def _mmap_npz(path):
+    """
+    Memory-map every array of an uncompressed .npz (as written by np.savez)
+
+    Pages then come straight from the page cache, so forked workers, and
+    separate processes serving the same file, share one physical copy.
+
+    Args:
+        path: .npz file path
+
+    Returns:
+        dict: name -> read-only np.memmap (compressed or empty members are
+        read normally)
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as f:
+        for info in archive.infolist():
+            name = info.filename[:-4] if info.filename.endswith('.npy') else info.filename
+            if info.compress_type == zipfile.ZIP_STORED:
+                # Local file header: 30 fixed bytes, then file name and extra field
+                f.seek(info.header_offset)
+                name_length, extra_length = struct.unpack('<HH', f.read(30)[26:30])
+                f.seek(info.header_offset + 30 + name_length + extra_length)
+                version = np.lib.format.read_magic(f)
+                read_header = (np.lib.format.read_array_header_1_0 if version == (1, 0)
+                               else np.lib.format.read_array_header_2_0)
+                shape, fortran_order, dtype = read_header(f)
+                if not dtype.hasobject and np.prod(shape):
+                    arrays[name] = np.memmap(path, dtype=dtype, mode='r', offset=f.tell(), shape=shape,
+                                             order='F' if fortran_order else 'C')
+                    continue
+            with archive.open(info) as member:
+                arrays[name] = np.lib.format.read_array(member)
+    return arrays
+
+
+def _same_padding(size, kernel, stride):
+    # TensorFlow's SAME padding: output = ceil(size / stride), extra pad goes after
+    out = -(-size // stride)
+    total = max((out - 1) * stride + kernel - size, 0)
+    return total // 2, total - total // 2
+
+
+def _pad(x, kernel, strides, padding, value=0.0):
+    if padding != 'same':
+        return x
+    top, bottom = _same_padding(x.shape[1], kernel[0], strides[0])
+    left, right = _same_padding(x.shape[2], kernel[1], strides[1])
+    if not (top or bottom or left or right):
+        return x
+    return np.pad(x, ((0, 0), (top, bottom), (left, right), (0, 0)), constant_values=value)
+
+
+def _windows(x, kernel, strides):
+    """(N, H, W, C) -> (N, Ho, Wo, C, kh, kw) strided view, no copy"""
+    view = sliding_window_view(x, kernel, axis=(1, 2))
+    return view[:, ::strides[0], ::strides[1]]
+
+
+def conv2d(x, kernel, bias, strides, padding):
+    """
+    2-D convolution as im2col + one matmul
+
+    Args:
+        x: Input (N, H, W, Cin)
+        kernel: Weights (kh, kw, Cin, Cout)
+        bias: (Cout,) or None
+        strides: (sh, sw)
+        padding: 'valid' or 'same'
+
+    Returns:
+        np.array: (N, Ho, Wo, Cout)
+    """
+    kh, kw, cin, cout = kernel.shape
+    x = _pad(x, (kh, kw), strides, padding)
+    patches = _windows(x, (kh, kw), strides)
+    n, ho, wo = patches.shape[:3]
+    # Lay patches out as (kh, kw, Cin) rows to match the kernel's memory order
+    columns = patches.transpose(0, 1, 2, 4, 5, 3).reshape(n * ho * wo, kh * kw * cin)
+    out = columns @ kernel.reshape(kh * kw * cin, cout)
+    if bias is not None:
+        out += bias
+    return out.reshape(n, ho, wo, cout)
+
+
+def pool2d(x, pool_size, strides, padding, reduce):
+    """Max/average pooling over (N, H, W, C)"""
+    strides = tuple(strides or pool_size)
+    if reduce is np.max:
+        x = _pad(x, pool_size, strides, padding, value=-np.inf)
+        return _windows(x, pool_size, strides).max(axis=(4, 5))
+    if padding == 'same':
+        # Average only over the valid (unpadded) part of each window
+        ones = _pad(np.ones((1,) + x.shape[1:3] + (1,), dtype=x.dtype), pool_size, strides, padding)
+        counts = _windows(ones, pool_size, strides).sum(axis=(4, 5))
+        x = _pad(x, pool_size, strides, padding)
+        return _windows(x, pool_size, strides).sum(axis=(4, 5)) / counts
+    return _windows(x, pool_size, strides).mean(axis=(4, 5))
+
+
+class NumpyModel:
+    """
+    Runs an exported .npz model with NumPy only
+
+    Mimics the parts of a Keras model the detector uses (`predict`,
+    `input_shape`, `name`, `layers`), so `PlantDiseaseDetector` can serve it
+    without importing TensorFlow.
+    """
+
+    def __init__(self, model_path, weights_dtype=None, mmap=False):
+        """
+        Args:
+            model_path: Path to the .npz written by `export_keras_model`
+            weights_dtype: 'float32' (default) or 'float16' to keep weights in
+                memory at that precision. float32 upcasts a float16 file once,
+                here; float16 halves the weight memory but each layer is
+                upcast to float32 for its matmul on every prediction.
+            mmap: Memory-map the weights read-only instead of copying them
+                into the heap (shared across processes; casting to another
+                weights_dtype still makes a private copy)
+        """
+        if mmap:
+            arrays = _mmap_npz(model_path)
+            spec = json.loads(np.asarray(arrays.pop('__spec__')).tobytes().decode('utf-8'))
+        else:
+            with np.load(model_path) as data:
+                spec = json.loads(data['__spec__'].tobytes().decode('utf-8'))
+                arrays = {key: data[key] for key in data.files if key != '__spec__'}
+
+        dtype = np.dtype(weights_dtype or np.float32)
+        self.model_path = model_path
+        self.spec = spec
+        self.name = spec.get('name', os.path.basename(model_path))
+        self.input_shape = (None,) + tuple(spec['input_shape'])
+        self.layers = [SimpleNamespace(name=layer['name']) for layer in spec['layers']]
+
+        self._ops = []
+        for index, layer in enumerate(spec['layers']):
+            weights = [arrays[f'w{index}_{j}'].astype(dtype, copy=False) for j in range(layer['weights'])]
+            config = layer['config']
+            if layer['type'] == 'BatchNormalization':
+                config = dict(config, axis=_normalization_axis(config.get('axis')))
+            self._ops.append((layer['type'], config, self._fold(layer, weights)))
+
+    @staticmethod
+    def _fold(layer, weights):
+        # Precompute BatchNormalization as a per-channel multiply-add
+        if layer['type'] != 'BatchNormalization':
+            return weights
+        config = layer['config']
+        weights = [w.astype(np.float32) for w in weights]
+        gamma = weights.pop(0) if config.get('scale', True) else None
+        beta = weights.pop(0) if config.get('center', True) else None
+        mean, variance = weights
+        multiplier = 1.0 / np.sqrt(variance + config.get('epsilon', 1e-3))
+        if gamma is not None:
+            multiplier = multiplier * gamma
+        offset = -mean * multiplier
+        if beta is not None:
+            offset = offset + beta
+        return [multiplier.astype(np.float32), offset.astype(np.float32)]
+
+    def predict(self, batch, verbose=0):
+        """
+        Run the layer graph on a preprocessed batch
+
+        Args:
+            batch: float32 array of shape (N, H, W, C)
+            verbose: Ignored; accepted for keras.Model.predict compatibility
+
+        Returns:
+            np.array: Model output of shape (N, num_classes)
+        """
+        x = np.array(batch, dtype=np.float32)
+        for kind, config, weights in self._ops:
+            x = self._apply(kind, config, weights, x)
+        return x
+
+    __call__ = predict
+
+    @staticmethod
+    def _apply(kind, config, weights, x):
+        weights = [w if w.dtype == np.float32 else w.astype(np.float32) for w in weights]
+        if kind == 'Conv2D':
+            bias = weights[1] if config['use_bias'] else None
+            x = conv2d(x, weights[0], bias, tuple(config['strides']), config['padding'])
+            return ACTIVATIONS[config['activation']](x)
+        if kind == 'Dense':
+            x = x @ weights[0]
+            if config['use_bias']:
+                x += weights[1]
+            return ACTIVATIONS[config['activation']](x)
+        if kind == 'MaxPooling2D':
+            return pool2d(x, tuple(config['pool_size']), config['strides'], config['padding'], np.max)
+        if kind == 'AveragePooling2D':
+            return pool2d(x, tuple(config['pool_size']), config['strides'], config['padding'], np.mean)
+        if kind in ('GlobalAveragePooling2D', 'GlobalMaxPooling2D'):
+            reduce = np.mean if kind == 'GlobalAveragePooling2D' else np.max
+            return reduce(x, axis=(1, 2), keepdims=bool(config.get('keepdims')))
+        if kind == 'BatchNormalization':
+            # Broadcast the per-feature multiply-add along the normalized axis
+            shape = [1] * x.ndim
+            shape[config['axis']] = -1
+            return x * weights[0].reshape(shape) + weights[1].reshape(shape)
+        if kind == 'Rescaling':
+            return x * np.float32(config['scale']) + np.float32(config['offset'])
+        if kind == 'Flatten':
+            return x.reshape(len(x), -1)
+        if kind == 'Activation':
+            return ACTIVATIONS[config['activation']](x)
+        if kind == 'ReLU':
+            max_value = config.get('max_value')
+            slope = config.get('negative_slope') or 0.0
+            threshold = config.get('threshold') or 0.0
+            x = np.where(x >= threshold, x, slope * (x - threshold))
+            return np.minimum(x, max_value) if max_value is not None else x
+        if kind == 'Softmax':
+            return _softmax(x, axis=config.get('axis', -1))
+        # InputLayer, Dropout, SpatialDropout2D are identities at inference time
+        return x
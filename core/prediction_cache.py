@@ -0,0 +1,445 @@
+# prediction_cache.py
+"""
+Prediction cache for Plant Disease Prediction
+Caches result dicts keyed by a hash of the image bytes plus the identity of
+the loaded model, with an in-process LRU tier and an optional persistent tier,
+plus a perceptual-hash index that catches near-duplicate burst photos
+"""
+
+import copy
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def content_key(data, model_identity):
+    """
+    Build a cache key for an image under a given model
+
+    Args:
+        data: Raw image bytes
+        model_identity: String identifying the loaded model + class map
+
+    Returns:
+        str: Cache key
+    """
+    return f"{model_identity}:{hashlib.sha256(data).hexdigest()}"
+
+
+class _Flight:
+    """An in-progress computation that concurrent identical requests wait on"""
+
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class PredictionCache:
+    """
+    Two-tier prediction cache with single-flight deduplication
+
+    The first tier is an in-process LRU bounded by `max_entries` and
+    `ttl_seconds`. The optional second tier (`store`) is any object with
+    `get(key)` / `set(key, value)` methods, e.g. `DatabasePredictionStore`.
+    Identical keys requested at the same time share one computation.
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=3600, store=None):
+        """
+        Args:
+            max_entries: Maximum number of results held in memory
+            ttl_seconds: Lifetime of an in-memory entry (None or 0 = no expiry)
+            store: Optional persistent tier
+        """
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = ttl_seconds or None
+        self.store = store
+
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """
+        Look a key up in memory, then in the persistent tier
+
+        Args:
+            key: Cache key
+
+        Returns:
+            dict or None: A copy of the cached result
+        """
+        value = self._lookup(key)
+        if value is None:
+            with self._lock:
+                self.misses += 1
+        return value
+
+    def _lookup(self, key):
+        with self._lock:
+            value = self._get_memory(key)
+            if value is not None:
+                self.hits += 1
+                return copy.deepcopy(value)
+
+        value = self._get_store(key)
+        if value is not None:
+            with self._lock:
+                self.persistent_hits += 1
+                self._set_memory(key, value)
+            return copy.deepcopy(value)
+        return None
+
+    def set(self, key, value):
+        """
+        Store a result in both tiers
+
+        Args:
+            key: Cache key
+            value: JSON-serializable result dict
+        """
+        with self._lock:
+            self._set_memory(key, copy.deepcopy(value))
+        self._set_store(key, value)
+
+    def get_or_compute(self, key, compute):
+        """
+        Return the cached result for `key`, computing it at most once
+
+        Concurrent callers with the same key wait for the first caller's
+        computation instead of running their own. Results containing an
+        `error` key are handed to the waiters but never cached.
+
+        Args:
+            key: Cache key
+            compute: Zero-argument callable producing the result dict
+
+        Returns:
+            dict: The (copied) result
+        """
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+
+        with self._lock:
+            # Re-check memory: another thread may have finished meanwhile
+            value = self._get_memory(key)
+            if value is not None:
+                self.hits += 1
+                return copy.deepcopy(value)
+
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._inflight[key] = flight
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return copy.deepcopy(flight.result)
+
+        try:
+            result = compute()
+            flight.result = result
+            if isinstance(result, dict) and 'error' not in result:
+                self.set(key, result)
+            return copy.deepcopy(result)
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+
+    def reset_after_fork(self):
+        """
+        Give a forked child fresh locks and no in-flight computations; the
+        parent's may be held mid-fork and its waiters do not exist here
+        """
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+    def clear(self):
+        """Drop every in-memory entry (the persistent tier is left alone)"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Hit/miss/eviction counters
+
+        Returns:
+            dict: Counters and current size
+        """
+        with self._lock:
+            lookups = self.hits + self.persistent_hits + self.misses + self.coalesced
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "persistent": self.store is not None,
+                "hits": self.hits,
+                "persistent_hits": self.persistent_hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": ((lookups - self.misses) / lookups) if lookups else 0.0,
+            }
+
+    # Memory tier helpers; callers hold self._lock
+
+    def _get_memory(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and expires_at < time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _set_memory(self, key, value):
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else None
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    # Persistent tier helpers; failures never break a prediction
+
+    def _get_store(self, key):
+        if self.store is None:
+            return None
+        try:
+            return self.store.get(key)
+        except Exception as e:
+            logger.warning("Prediction cache store lookup failed: %s", e)
+            return None
+
+    def _set_store(self, key, value):
+        if self.store is None:
+            return
+        try:
+            self.store.set(key, value)
+        except Exception as e:
+            logger.warning("Prediction cache store write failed: %s", e)
+
+
+class DatabasePredictionStore:
+    """
+    Persistent cache tier backed by the project's database
+
+    Uses the `CachedPrediction` model so cached results survive restarts.
+    """
+
+    def __init__(self, ttl_seconds=None):
+        """
+        Args:
+            ttl_seconds: Ignore rows older than this (None = keep forever)
+        """
+        self.ttl_seconds = ttl_seconds or None
+
+    def get(self, key):
+        from django.utils import timezone
+        from .models import CachedPrediction
+
+        queryset = CachedPrediction.objects.filter(key=key)
+        if self.ttl_seconds:
+            cutoff = timezone.now() - timedelta(seconds=self.ttl_seconds)
+            queryset = queryset.filter(created_at__gte=cutoff)
+        return queryset.values_list('result', flat=True).first()
+
+    def set(self, key, value):
+        from .models import CachedPrediction
+
+        CachedPrediction.objects.update_or_create(key=key, defaults={'result': value})
+
+
+def dhash(image, hash_size=8):
+    """
+    Difference hash of an image
+
+    The image is reduced to a (hash_size + 1) x hash_size grayscale
+    thumbnail and each bit records whether a pixel is brighter than its
+    right-hand neighbour. Re-encoding, EXIF changes and small exposure
+    shifts leave most bits unchanged.
+
+    Args:
+        image: PIL image
+        hash_size: Bits per row/column (8 gives the 64-bit hash NearDuplicateIndex expects)
+
+    Returns:
+        int: The hash as an unsigned integer
+    """
+    from PIL import Image
+
+    # JPEG draft mode lets libjpeg decode at 1/2..1/8 scale, which is all a thumbnail needs
+    if image.format == 'JPEG':
+        image.draft('L', (hash_size * 8, hash_size * 8))
+    thumb = image.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = np.asarray(thumb, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def _popcount64(values):
+    """Vectorized popcount of a uint64 array"""
+    bitwise_count = getattr(np, 'bitwise_count', None)
+    if bitwise_count is not None:
+        return bitwise_count(values)
+    return np.unpackbits(values.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+class NearDuplicateIndex:
+    """
+    In-memory perceptual-hash index with Hamming-distance lookup
+
+    Holds up to `max_entries` 64-bit hashes in a NumPy ring buffer; a lookup
+    XORs the query against every stored hash at once and returns the result
+    of the closest entry within `max_distance` bits. Entries belong to one
+    model identity; switching models empties the index.
+    """
+
+    def __init__(self, max_distance=6, max_entries=4096, ttl_seconds=3600):
+        """
+        Args:
+            max_distance: Largest Hamming distance (out of 64 bits) treated as a duplicate
+            max_entries: Number of hashes kept; the oldest is overwritten first
+            ttl_seconds: Lifetime of an entry (None or 0 = no expiry)
+        """
+        self.max_distance = int(max_distance)
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = ttl_seconds or None
+
+        self._hashes = np.zeros(self.max_entries, dtype=np.uint64)
+        self._expires = np.zeros(self.max_entries, dtype=np.float64)
+        self._results = [None] * self.max_entries
+        self._size = 0
+        self._next = 0
+        self._identity = None
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._hit_distance_total = 0
+
+    def lookup(self, image_hash, model_identity):
+        """
+        Find the closest stored hash within `max_distance`
+
+        Args:
+            image_hash: 64-bit perceptual hash
+            model_identity: Identity of the model the result must come from
+
+        Returns:
+            tuple: (result dict copy, distance) or (None, None)
+        """
+        with self._lock:
+            self._check_identity(model_identity)
+            if self._size == 0:
+                self.misses += 1
+                return None, None
+
+            distances = _popcount64(self._hashes[:self._size] ^ np.uint64(image_hash))
+            if self.ttl_seconds:
+                expired = self._expires[:self._size] < time.monotonic()
+                distances = np.where(expired, 65, distances)
+            best = int(np.argmin(distances))
+            distance = int(distances[best])
+            if distance > self.max_distance:
+                self.misses += 1
+                return None, None
+
+            self.hits += 1
+            self._hit_distance_total += distance
+            return copy.deepcopy(self._results[best]), distance
+
+    def add(self, image_hash, model_identity, result):
+        """
+        Store the result for a hash
+
+        Args:
+            image_hash: 64-bit perceptual hash
+            model_identity: Identity of the model that produced `result`
+            result: Prediction result dict
+        """
+        if not isinstance(result, dict) or 'error' in result:
+            return
+        with self._lock:
+            self._check_identity(model_identity)
+            slot = self._next
+            if self._size == self.max_entries:
+                self.evictions += 1
+            else:
+                self._size += 1
+            self._hashes[slot] = np.uint64(image_hash)
+            self._expires[slot] = time.monotonic() + self.ttl_seconds if self.ttl_seconds else np.inf
+            self._results[slot] = copy.deepcopy(result)
+            self._next = (slot + 1) % self.max_entries
+
+    def reset_after_fork(self):
+        """Give a forked child its own lock (the parent's may be held mid-fork)"""
+        self._lock = threading.Lock()
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._size = 0
+            self._next = 0
+            self._results = [None] * self.max_entries
+
+    def stats(self):
+        """
+        Hit/miss counters and the mean distance of hits
+
+        Returns:
+            dict: Counters and current size
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": self._size,
+                "max_entries": self.max_entries,
+                "max_distance": self.max_distance,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "mean_hit_distance": (self._hit_distance_total / self.hits) if self.hits else 0.0,
+            }
+
+    def _check_identity(self, model_identity):
+        # Callers hold self._lock
+        if model_identity != self._identity:
+            self._identity = model_identity
+            self._size = 0
+            self._next = 0
+            self._results = [None] * self.max_entries
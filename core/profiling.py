@@ -0,0 +1,282 @@
+# profiling.py
+"""
+On-demand profiling of live prediction requests
+An admin arms a session (POST /api/profile/ or `python manage.py
+profile_predictions`); the next N prediction requests in that process are
+run under cProfile, optionally with a TensorFlow profiler trace of the
+forward pass. Each session writes one .prof file per request, the traces
+and a summary.txt of the hottest functions and ops to PROFILING_DIR.
+Unarmed, a profiled view costs one global read.
+"""
+
+import cProfile
+import functools
+import glob
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+
+# ProfilingSession while armed, else None
+_session = None
+_session_lock = threading.Lock()
+_last_directory = None
+
+
+class ProfilingSession:
+    """
+    Profiles the next `requests` calls that go through `run`
+    """
+
+    def __init__(self, output_dir, requests, tensorflow=False):
+        """
+        Args:
+            output_dir: Parent directory; the session writes to a new
+                timestamped sub-directory
+            requests: Number of requests to profile
+            tensorflow: Also record a TensorFlow profiler trace (Keras
+                models only; one request at a time)
+        """
+        self.id = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        self.directory = os.path.join(output_dir, self.id)
+        self.requests = int(requests)
+        self.tensorflow = bool(tensorflow)
+        self.remaining = self.requests
+        self.started = 0
+        self.finished = 0
+        self._lock = threading.Lock()
+        self._trace_lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def run(self, fn, *args, **kwargs):
+        """
+        Call `fn` under the profiler if the session still has requests left
+        """
+        with self._lock:
+            if self.remaining <= 0:
+                index = None
+            else:
+                self.remaining -= 1
+                self.started += 1
+                index = self.started
+                if self.remaining == 0:
+                    _disarm(self)
+        if index is None:
+            return fn(*args, **kwargs)
+
+        # The TensorFlow profiler is process-wide: one trace at a time
+        trace = self.tensorflow and 'tensorflow' in sys.modules and self._trace_lock.acquire(blocking=False)
+        if trace:
+            trace = self._start_trace(index)
+        profile = cProfile.Profile()
+        started = time.perf_counter()
+        profile.enable()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profile.disable()
+            elapsed_ms = (time.perf_counter() - started) * 1000.0
+            if trace:
+                self._stop_trace()
+            profile.dump_stats(os.path.join(self.directory, f'request-{index:03d}.prof'))
+            self._finish(index, elapsed_ms)
+
+    def _start_trace(self, index):
+        import tensorflow as tf
+        try:
+            tf.profiler.experimental.start(os.path.join(self.directory, 'tensorflow', f'request-{index:03d}'))
+            return True
+        except Exception as e:
+            print(f"TensorFlow profiler not started: {e}")
+            self._trace_lock.release()
+            return False
+
+    def _stop_trace(self):
+        import tensorflow as tf
+        try:
+            tf.profiler.experimental.stop()
+        except Exception as e:
+            print(f"TensorFlow profiler not stopped cleanly: {e}")
+        finally:
+            self._trace_lock.release()
+
+    def _finish(self, index, elapsed_ms):
+        with self._lock:
+            self.finished += 1
+            with open(os.path.join(self.directory, 'requests.jsonl'), 'a') as f:
+                f.write(json.dumps({'request': index, 'wall_ms': round(elapsed_ms, 2)}) + '\n')
+            done = self.remaining == 0 and self.finished == self.started
+        if done:
+            write_summary(self.directory)
+
+    def status(self):
+        """
+        Returns:
+            dict: Session id, directory and progress
+        """
+        with self._lock:
+            return {
+                'id': self.id,
+                'directory': self.directory,
+                'requests': self.requests,
+                'remaining': self.remaining,
+                'finished': self.finished,
+                'tensorflow': self.tensorflow,
+                'pid': os.getpid(),
+            }
+
+
+def arm(output_dir, requests, tensorflow=False):
+    """
+    Profile the next `requests` prediction requests in this process,
+    replacing any session still armed
+
+    Returns:
+        ProfilingSession: The new session
+    """
+    global _session, _last_directory
+    session = ProfilingSession(output_dir, requests, tensorflow)
+    with _session_lock:
+        _session = session
+        _last_directory = session.directory
+    return session
+
+
+def _disarm(session):
+    global _session
+    with _session_lock:
+        if _session is session:
+            _session = None
+
+
+def disarm():
+    """
+    Stop profiling; requests already being profiled still finish and the
+    summary covers what was captured
+
+    Returns:
+        dict or None: Status of the stopped session
+    """
+    global _session
+    with _session_lock:
+        session, _session = _session, None
+    if session is None:
+        return None
+    with session._lock:
+        session.remaining = 0
+        done = session.finished == session.started
+    if done and session.started:
+        write_summary(session.directory)
+    return session.status()
+
+
+def status():
+    """
+    Returns:
+        dict: The armed session (or None) and the last session's directory
+    """
+    session = _session
+    return {
+        'armed': session.status() if session is not None else None,
+        'last_directory': _last_directory,
+        'pid': os.getpid(),
+    }
+
+
+def profile_request(fn):
+    """
+    Decorator for the functions that serve one prediction: a direct call
+    unless a session is armed
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        session = _session
+        if session is None:
+            return fn(*args, **kwargs)
+        return session.run(fn, *args, **kwargs)
+    return wrapper
+
+
+def write_summary(directory, top=25):
+    """
+    Write summary.txt: the functions with the most cumulative and own time
+    over all profiled requests, and the slowest TensorFlow ops if traced
+
+    Args:
+        directory: Session directory
+        top: Rows per table
+
+    Returns:
+        str: The summary text
+    """
+    profiles = sorted(glob.glob(os.path.join(directory, '*.prof')))
+    out = io.StringIO()
+    out.write(f"Profiled requests: {len(profiles)} ({directory})\n")
+    wall = []
+    try:
+        with open(os.path.join(directory, 'requests.jsonl')) as f:
+            wall = [json.loads(line)['wall_ms'] for line in f if line.strip()]
+    except OSError:
+        pass
+    if wall:
+        out.write(f"Wall time per request: min {min(wall):.1f} ms, max {max(wall):.1f} ms, "
+                  f"mean {sum(wall) / len(wall):.1f} ms\n")
+    if profiles:
+        stats = pstats.Stats(*profiles, stream=out)
+        stats.strip_dirs()
+        out.write("\n== Hottest functions by cumulative time ==\n")
+        stats.sort_stats('cumulative').print_stats(top)
+        out.write("\n== Hottest functions by own time ==\n")
+        stats.sort_stats('tottime').print_stats(top)
+
+    ops = tensorflow_op_summary(directory, top)
+    if ops:
+        out.write("\n== Slowest TensorFlow ops (self time over all traced requests) ==\n")
+        out.write(f"{'self ms':>10}{'calls':>8}  {'type':<28}operation\n")
+        for op in ops:
+            out.write(f"{op['self_ms']:>10.2f}{op['occurrences']:>8}  {op['type']:<28}{op['operation']}\n")
+
+    text = out.getvalue()
+    with open(os.path.join(directory, 'summary.txt'), 'w') as f:
+        f.write(text)
+    return text
+
+
+def tensorflow_op_summary(directory, top=25):
+    """
+    Aggregate the op statistics of the TensorFlow traces in a session
+    (the same table as TensorBoard's Profile tab)
+
+    Returns:
+        list: Dicts with type, operation, occurrences and self_ms, slowest
+        first; empty without traces or if this TensorFlow cannot read them
+    """
+    paths = glob.glob(os.path.join(directory, 'tensorflow', '**', '*.xplane.pb'), recursive=True)
+    if not paths:
+        return []
+    try:
+        from tensorflow.python.profiler.internal import _pywrap_profiler_plugin
+    except ImportError:
+        return []
+    totals = {}
+    for path in paths:
+        try:
+            data, ok = _pywrap_profiler_plugin.xspace_to_tools_data([path], 'framework_op_stats', {})
+            table = json.loads(data)[0] if ok else None
+        except Exception:
+            table = None
+        if not table:
+            continue
+        columns = [c['id'] for c in table['cols']]
+        for row in table['rows']:
+            values = dict(zip(columns, (cell.get('v') for cell in row['c'])))
+            if values.get('type') == 'IDLE':
+                continue
+            key = (values.get('type'), values.get('operation'))
+            entry = totals.setdefault(key, {'type': key[0], 'operation': key[1], 'occurrences': 0, 'self_ms': 0.0})
+            entry['occurrences'] += int(values.get('occurrences') or 0)
+            entry['self_ms'] += float(values.get('total_self_time') or 0.0) / 1000.0
+    return sorted(totals.values(), key=lambda op: op['self_ms'], reverse=True)[:top]
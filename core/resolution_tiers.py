@@ -0,0 +1,133 @@
+# resolution_tiers.py
+"""
+Resolution speed tiers for Plant Disease Prediction
+A model can have variants at lower input resolutions, saved next to it as
+<model>_<size>px.keras (`python manage.py export_resolution_variants`). The
+registry serves them as '<name>@<size>', and a request picks one through a
+speed tier ('fast', 'balanced', 'accurate') instead of a size. Cost grows
+with the square of the resolution, so 160 px is roughly half of 224 px.
+"""
+
+import glob
+import os
+import re
+
+from .model_registry import UnknownModel
+
+TIERS = ('fast', 'balanced', 'accurate')
+DEFAULT_TIER_SIZES = 'fast:128,balanced:160,accurate:0'
+
+
+class UnknownTier(UnknownModel):
+    """Raised for a tier name that PREDICT_RESOLUTION_TIERS does not define"""
+
+
+def variant_path(model_path, size):
+    """
+    Path of a resolution variant
+
+    Args:
+        model_path: Path to the .keras/.h5 model
+        size: Input edge length in pixels
+
+    Returns:
+        str: e.g. models/plant_disease_model_efficientnetb0_160px.keras
+    """
+    return f"{os.path.splitext(model_path)[0]}_{int(size)}px.keras"
+
+
+def find_variants(model_path):
+    """
+    Resolution variants saved next to a model
+
+    Returns:
+        dict: {size: path}
+    """
+    pattern = re.compile(re.escape(os.path.splitext(model_path)[0]) + r'_(\d+)px\.keras$')
+    variants = {}
+    for path in glob.glob(f"{glob.escape(os.path.splitext(model_path)[0])}_*px.keras"):
+        match = pattern.match(path)
+        if match:
+            variants[int(match.group(1))] = path
+    return variants
+
+
+def parse_tiers(spec):
+    """
+    Parse PREDICT_RESOLUTION_TIERS ('fast:128,balanced:160,accurate:0')
+
+    Returns:
+        dict: {tier: size}, where 0 means the model's native resolution
+    """
+    tiers = {}
+    for item in str(spec or '').split(','):
+        if ':' in item:
+            tier, size = item.split(':', 1)
+            tiers[tier.strip()] = int(size)
+    return tiers
+
+
+def select_tier(registry, name, tier, tier_sizes):
+    """
+    Registry name serving `name` at `tier`
+
+    Uses the variant of the tier's size, else the nearest larger one, else
+    the model itself; never a variant smaller than asked for.
+
+    Args:
+        registry: core.model_registry.ModelRegistry
+        name: Base registry name (e.g. 'efficientnetb0')
+        tier: Tier name
+        tier_sizes: {tier: size} from parse_tiers()
+
+    Returns:
+        str: e.g. 'efficientnetb0@160', or `name`
+
+    Raises:
+        UnknownTier: If `tier` is not in `tier_sizes`
+    """
+    if tier not in tier_sizes:
+        raise UnknownTier(f"Unknown tier '{tier}'. Available: {', '.join(tier_sizes)}")
+    size = tier_sizes[tier]
+    if not size:
+        return name
+    prefix = f"{name}@"
+    sizes = sorted(int(n[len(prefix):]) for n in registry.names() if n.startswith(prefix))
+    larger = [s for s in sizes if s >= size]
+    return f"{prefix}{larger[0]}" if larger else name
+
+
+def build_resolution_variant(keras_model, size):
+    """
+    Same weights, smaller input: rebuild a model from its config with every
+    InputLayer resized. Works for fully convolutional models ending in
+    global pooling (EfficientNet); models that flatten a fixed-size feature
+    map into a Dense layer need a variant trained at that size instead.
+
+    Args:
+        keras_model: Trained channels-last Keras model
+        size: New input edge length in pixels
+
+    Returns:
+        keras.Model: The variant
+
+    Raises:
+        ValueError: If the weights do not fit the smaller input
+    """
+    def resize_inputs(config):
+        for layer in config.get('layers', []):
+            if layer['class_name'] == 'InputLayer':
+                shape = list(layer['config']['batch_shape'])
+                layer['config']['batch_shape'] = [shape[0], size, size] + shape[3:]
+            elif isinstance(layer.get('config'), dict) and 'layers' in layer['config']:
+                resize_inputs(layer['config'])
+
+    config = keras_model.get_config()
+    resize_inputs(config)
+    variant = keras_model.__class__.from_config(config)
+    try:
+        variant.set_weights(keras_model.get_weights())
+    except ValueError as e:
+        raise ValueError(f"{keras_model.name} depends on its input size (e.g. Flatten -> Dense); "
+                         f"train a {size}px variant instead ({e})")
+    return variant
@@ -0,0 +1,108 @@
+# resources.py
+"""
+Process resource helpers shared by the benchmark and reporting commands
+"""
+
+import os
+import sys
+
+
+def rss_mb(pid=None):
+    """
+    Current resident set size of a process in MB
+
+    Args:
+        pid: Process id (defaults to the current process)
+
+    Returns:
+        float or None: RSS in MB, or None if it cannot be read
+    """
+    pid = pid or os.getpid()
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    if pid == os.getpid():
+        return peak_rss_mb()
+    return None
+
+
+def pss_mb(pid=None):
+    """
+    Proportional set size of a process in MB (Linux only): shared pages are
+    split evenly between the processes mapping them, so summing PSS over a
+    group of forked workers gives their real combined footprint
+
+    Args:
+        pid: Process id (defaults to the current process)
+
+    Returns:
+        float or None: PSS in MB, or None if it cannot be read
+    """
+    pid = pid or os.getpid()
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                if line.startswith('Pss:'):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return None
+
+
+def child_pids(pid):
+    """
+    Direct children of a process (Linux only)
+
+    Args:
+        pid: Parent process id
+
+    Returns:
+        list: Child pids, empty if they cannot be read
+    """
+    children = []
+    try:
+        for task in os.listdir(f'/proc/{pid}/task'):
+            with open(f'/proc/{pid}/task/{task}/children') as f:
+                children.extend(int(c) for c in f.read().split())
+    except OSError:
+        pass
+    return sorted(children)
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of the current process in MB
+
+    Returns:
+        float or None: Peak RSS in MB, or None on platforms without `resource`
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KB on Linux and bytes on macOS
+    return peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0
+
+
+def process_age_seconds():
+    """
+    Seconds since the current process started (Linux only)
+
+    Returns:
+        float or None: Process age, or None where /proc is unavailable
+    """
+    try:
+        with open('/proc/self/stat') as f:
+            # The command name may contain spaces; fields resume after ')'
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        start_ticks = int(fields[19])
+        return uptime - start_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
@@ -0,0 +1,65 @@
+# serving_graph.py
+"""
+Serving graphs with preprocessing folded in
+Wraps a trained Keras model with in-graph resizing and rescaling so it takes
+raw uint8 (H, W, 3) images of any size; TensorFlow then runs the cast,
+resize and scale as part of the forward pass instead of NumPy doing it on
+several full-size float copies
+"""
+
+import os
+
+
+def serving_path(model_path):
+    """
+    Path of the serving variant of a Keras model
+
+    Args:
+        model_path: Path to the .keras/.h5 model
+
+    Returns:
+        str: e.g. models/plant_disease_model_cnn_simple_serving.keras
+    """
+    return f"{os.path.splitext(model_path)[0]}_serving.keras"
+
+
+def build_serving_model(keras_model, plan):
+    """
+    Wrap a model so it accepts uint8 images of any size
+
+    Args:
+        keras_model: Trained Keras model expecting preprocessed float input
+        plan: The model's `PreprocessPlan` (target size + normalization)
+
+    Returns:
+        keras.Model: Model with uint8 input -> Resizing -> Rescaling -> model
+    """
+    from tensorflow import keras
+
+    if plan.channels_first:
+        raise ValueError("Serving graphs are only built for channels-last models")
+
+    width, height = plan.target_size
+    inputs = keras.Input((None, None, plan.channels), dtype='uint8', name='image')
+    x = keras.layers.Resizing(height, width, name='serving_resize')(inputs)
+    if plan.normalization == 'rescale':
+        x = keras.layers.Rescaling(1.0 / 255.0, name='serving_rescale')(x)
+    outputs = keras_model(x)
+    return keras.Model(inputs, outputs, name=f"{keras_model.name}_serving")
+
+
+def graph_input_size(model):
+    """
+    Target size of a serving graph, read from its Resizing layer
+
+    Args:
+        model: Loaded Keras model
+
+    Returns:
+        tuple or None: (width, height), or None if the model has no Resizing layer
+    """
+    for layer in getattr(model, 'layers', [])[:4]:
+        if layer.__class__.__name__ == 'Resizing':
+            config = layer.get_config()
+            return int(config['width']), int(config['height'])
+    return None
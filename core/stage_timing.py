@@ -0,0 +1,220 @@
+# stage_timing.py
+"""
+Per-stage latency timers for Plant Disease Prediction
+Each stage of a prediction (upload, read, decode, resize, normalize,
+inference, postprocess, serialize) is timed with two perf_counter() calls
+and recorded twice: into a process-wide histogram that /metrics exposes in
+Prometheus format, and into the current request's timings, which
+ServerTimingMiddleware returns as a Server-Timing header. A stage costs
+about a microsecond, so the timers stay on in production.
+"""
+
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds, from 100 µs (a resize) to 10 s (a cold model)
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+enabled = True
+
+
+class Histogram:
+    """
+    Cumulative-bucket latency histogram, one series per label value
+    """
+
+    def __init__(self, name, help_text, label, buckets=DEFAULT_BUCKETS):
+        """
+        Args:
+            name: Metric name
+            help_text: # HELP line
+            label: Label distinguishing the series (e.g. 'stage')
+            buckets: Bucket upper bounds in seconds
+        """
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, seconds):
+        """
+        Record one measurement
+
+        Args:
+            value: Label value
+            seconds: Duration
+        """
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(value)
+            if series is None:
+                # Per-bucket counts (+Inf last), sum
+                series = self._series[value] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += seconds
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: {label value: {'count', 'sum', 'buckets': [(le, cumulative count)]}}
+        """
+        with self._lock:
+            series = {value: (list(counts), total) for value, (counts, total) in self._series.items()}
+        result = {}
+        for value, (counts, total) in sorted(series.items()):
+            cumulative, running = [], 0
+            for le, count in zip(self.buckets + (float('inf'),), counts):
+                running += count
+                cumulative.append((le, running))
+            result[value] = {'count': running, 'sum': total, 'buckets': cumulative}
+        return result
+
+    def render(self):
+        """
+        Returns:
+            str: Prometheus text exposition of this histogram
+        """
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for value, series in self.snapshot().items():
+            label = f'{self.label}="{_escape(value)}"'
+            for le, count in series['buckets']:
+                bound = '+Inf' if le == float('inf') else repr(le)
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {count}')
+            lines.append(f"{self.name}_sum{{{label}}} {series['sum']!r}")
+            lines.append(f"{self.name}_count{{{label}}} {series['count']}")
+        return '\n'.join(lines)
+
+    def reset(self):
+        """Drop every series (tests, or a forked worker starting fresh)"""
+        self._lock = threading.Lock()
+        self._series = {}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+STAGE_SECONDS = Histogram('plant_prediction_stage_seconds', 'Time spent in each prediction stage', 'stage')
+REQUEST_SECONDS = Histogram('plant_request_seconds', 'Time to serve a request, by view', 'view')
+
+
+class RequestTimings:
+    """
+    Stage durations of one request, summed per stage (a batch decodes many
+    images), in the order the stages first ran
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def server_timing(self, total_seconds=None):
+        """
+        Returns:
+            str: Server-Timing header value, durations in ms
+        """
+        with self._lock:
+            stages = list(self.stages.items())
+        if total_seconds is not None:
+            stages.append(('total', total_seconds))
+        return ', '.join(f"{name};dur={seconds * 1000.0:.2f}" for name, seconds in stages)
+
+
+_current = contextvars.ContextVar('request_timings', default=None)
+
+
+def record(name, seconds):
+    """
+    Record a stage measured elsewhere
+
+    Args:
+        name: Stage name
+        seconds: Duration
+    """
+    STAGE_SECONDS.observe(name, seconds)
+    timings = _current.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+@contextmanager
+def stage(name):
+    """
+    Time a block as one stage of the current prediction
+
+    Args:
+        name: Stage name
+    """
+    if not enabled:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started)
+
+
+@contextmanager
+def request_timings():
+    """
+    Collect the stages run by this request (and by threads started with
+    `bind`) until the block exits
+
+    Yields:
+        RequestTimings: The request's timings
+    """
+    timings = RequestTimings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+def bind(fn):
+    """
+    Wrap `fn` so stages it runs on a worker thread count toward the calling
+    request (thread pools do not inherit context variables)
+
+    Args:
+        fn: Callable to run on another thread
+
+    Returns:
+        callable: `fn` running with the caller's request timings
+    """
+    timings = _current.get()
+    if timings is None:
+        return fn
+
+    def bound(*args, **kwargs):
+        token = _current.set(timings)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return bound
+
+
+def render_metrics():
+    """
+    Returns:
+        str: Every histogram in Prometheus text format (version 0.0.4)
+    """
+    return '\n'.join(h.render() for h in (STAGE_SECONDS, REQUEST_SECONDS)) + '\n'
+
+
+def reset_after_fork():
+    """Start a forked worker's histograms from zero with fresh locks"""
+    STAGE_SECONDS.reset()
+    REQUEST_SECONDS.reset()
@@ -0,0 +1,85 @@
+# startup.py
+"""
+Startup-time report for Plant Disease Prediction
+Records wall time and RSS for each startup phase (Django setup, TensorFlow
+import, model load, warmup) so the cost of a deploy is visible
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+from .resources import process_age_seconds, rss_mb
+
+
+class StartupReport:
+    """
+    Ordered list of startup phases with wall time and RSS after each one
+    """
+
+    def __init__(self):
+        self._phases = []
+        self._lock = threading.Lock()
+
+    def mark(self, name, started=None):
+        """
+        Record a phase that ends now
+
+        Args:
+            name: Phase name
+            started: perf_counter() value when the phase began; None records
+                a point-in-time mark (wall time = process age so far)
+        """
+        if started is None:
+            wall_ms = (process_age_seconds() or 0.0) * 1000.0
+        else:
+            wall_ms = (time.perf_counter() - started) * 1000.0
+        rss = rss_mb()
+        with self._lock:
+            previous = self._phases[-1]['rss_mb'] if self._phases else None
+            self._phases.append({
+                'phase': name,
+                'wall_ms': round(wall_ms, 1),
+                'rss_mb': round(rss, 1) if rss is not None else None,
+                'rss_delta_mb': round(rss - previous, 1) if rss is not None and previous is not None else None,
+            })
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Time a block as one phase
+
+        Args:
+            name: Phase name
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.mark(name, started)
+
+    def as_list(self):
+        """
+        Returns:
+            list: Copies of the recorded phases, in order
+        """
+        with self._lock:
+            return [dict(p) for p in self._phases]
+
+    def format(self):
+        """
+        Returns:
+            str: The phases as a fixed-width table
+        """
+        phases = self.as_list()
+        width = max([28] + [len(p['phase']) + 2 for p in phases])
+        lines = [f"{'phase':<{width}}{'wall ms':>10}{'RSS MB':>9}{'delta MB':>10}"]
+        for p in phases:
+            rss = f"{p['rss_mb']:.1f}" if p['rss_mb'] is not None else '-'
+            delta = f"{p['rss_delta_mb']:+.1f}" if p['rss_delta_mb'] is not None else '-'
+            lines.append(f"{p['phase']:<{width}}{p['wall_ms']:>10.1f}{rss:>9}{delta:>10}")
+        return '\n'.join(lines)
+
+
+# Process-wide report filled in by CoreConfig.ready and the detector
+startup_report = StartupReport()
@@ -1,3 +1,1218 @@
-from django.test import TestCase
+import asyncio
+import importlib.util
+import io
+import json
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+import uuid
+import zipfile
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from django.http import HttpRequest
+from django.http.multipartparser import MultiPartParser
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.apps import apps as django_apps
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from core.apps import CoreConfig
+from core.async_inference import BoundedExecutor, ExecutorBusy
+from core.batch_jobs import JobRejected, claim_next_job, create_job, job_results, run_job
+from core.cascade import CascadeDetector, escalation_mask, label_permutation
+from core.management.commands.benchmark_inference import compare_with_baseline
+from core.management.commands.predict_dir import iter_images, last_written
+from core.inference_server import InferenceClient, InferenceServer, send_message
+from core.ml_model import BatchScheduler, PlantDiseaseDetector, PreprocessPlan, get_detector, install_detector
+from core.model_registry import ModelRegistry
+from core.prediction_cache import NearDuplicateIndex, PredictionCache
+from core import profiling
+from core.numpy_engine import NumpyModel, export_keras_model
+from core.resolution_tiers import UnknownTier, parse_tiers, select_tier
+from core.serving_graph import build_serving_model, serving_path
+from core.stage_timing import Histogram, bind, request_timings, stage
+from core.startup import StartupReport
+from core.tflite_backend import TFLiteModel, convert_model, write_metadata
+from core.thread_tuning import resolve_thread_config, save_thread_config
+from core.upload_handlers import ImageUploadHandler, image_header
+from core.views import _requested_model
+
+HAS_TENSORFLOW = importlib.util.find_spec('tensorflow') is not None
+
+
+def _assert_same_top1(actual, expected, tolerance):
+    # Rows whose two best classes are closer than the tolerance may legitimately swap
+    ranked = np.sort(expected, axis=1)
+    decided = ranked[:, -1] - ranked[:, -2] > 2 * tolerance
+    np.testing.assert_array_equal(actual.argmax(axis=1)[decided], expected.argmax(axis=1)[decided])
+
+
+def _build_keras_model(keras):
+    # Covers every layer type the NumPy engine claims to support
+    return keras.Sequential([
+        keras.Input((23, 19, 3)),
+        keras.layers.Rescaling(1.0 / 255),
+        keras.layers.Conv2D(6, 3, activation='relu'),
+        keras.layers.Conv2D(8, (3, 2), strides=2, padding='same'),
+        keras.layers.BatchNormalization(),
+        keras.layers.Activation('relu'),
+        keras.layers.MaxPooling2D(padding='same'),
+        keras.layers.AveragePooling2D(pool_size=2, strides=1, padding='same'),
+        keras.layers.Conv2D(4, 1, activation='tanh', use_bias=False),
+        keras.layers.Flatten(),
+        keras.layers.Dropout(0.5),
+        keras.layers.Dense(12, activation='relu'),
+        keras.layers.Dense(5, activation='softmax'),
+    ], name='cnn_simple_test')
+
+
+class StartupTests(SimpleTestCase):
+
+    def test_preload_only_when_serving(self):
+        cases = [
+            (['manage.py', 'migrate'], {}, 'auto', False),
+            (['manage.py', 'runserver'], {}, 'auto', False),  # The autoreloader's parent
+            (['manage.py', 'runserver'], {'RUN_MAIN': 'true'}, 'auto', True),
+            (['/usr/bin/gunicorn', 'PlantLeafDiseasePrediction.wsgi'], {}, 'auto', True),
+            (['manage.py', 'migrate'], {}, 'True', True),
+            (['/usr/bin/gunicorn', 'PlantLeafDiseasePrediction.wsgi'], {}, 'False', False),
+        ]
+        for argv, environ, mode, expected in cases:
+            with self.subTest(argv=argv, mode=mode), mock.patch.object(sys, 'argv', argv), \
+                    mock.patch.dict(os.environ), override_settings(PRELOAD_MODEL=mode):
+                os.environ.pop('RUN_MAIN', None)
+                os.environ.update(environ)
+                self.assertIs(CoreConfig._should_preload(), expected)
+
+    def test_management_commands_do_not_import_tensorflow(self):
+        script = (
+            "import os, sys\n"
+            "os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'PlantLeafDiseasePrediction.settings')\n"
+            "sys.argv = ['manage.py', 'check']\n"
+            "import django\n"
+            "django.setup()\n"
+            "from core.startup import startup_report\n"
+            "assert 'tensorflow' not in sys.modules\n"
+            "assert [p['phase'] for p in startup_report.as_list()] == ['django_setup']\n"
+        )
+        environ = dict(os.environ, PRELOAD_MODEL='auto')
+        completed = subprocess.run([sys.executable, '-c', script], cwd=settings.BASE_DIR, env=environ,
+                                   capture_output=True, text=True)
+        self.assertEqual(completed.returncode, 0, completed.stderr)
+
+    def test_report_records_phases_in_order(self):
+        report = StartupReport()
+        report.mark('django_setup')
+        with report.phase('model_load'):
+            threading.Event().wait(0.02)
+
+        phases = report.as_list()
+        self.assertEqual([p['phase'] for p in phases], ['django_setup', 'model_load'])
+        self.assertGreaterEqual(phases[1]['wall_ms'], 20)
+        if phases[1]['rss_mb'] is not None:
+            self.assertAlmostEqual(phases[1]['rss_delta_mb'], phases[1]['rss_mb'] - phases[0]['rss_mb'], delta=0.11)
+        table = report.format().splitlines()
+        self.assertEqual(len(table), 3)
+        self.assertTrue(table[2].startswith('model_load'))
+
+
+class BatchSchedulerTests(SimpleTestCase):
+
+    def test_concurrent_callers_share_bounded_forward_passes(self):
+        calls = []
+
+        def run_batch(batch):
+            calls.append(len(batch))
+            # Each row's score is its own input value, so mixed-up rows show
+            return batch.reshape(len(batch), -1)[:, :1] * 2.0
+
+        scheduler = BatchScheduler(run_batch, max_batch_size=4, max_wait_ms=500)
+        self.addCleanup(scheduler.stop)
+        barrier = threading.Barrier(10)
+        results = {}
+
+        def caller(value):
+            barrier.wait()
+            results[value] = scheduler.submit(np.full((2, 2, 1), value, dtype=np.float32))
+
+        threads = [threading.Thread(target=caller, args=(v,)) for v in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual({v: float(r[0]) for v, r in results.items()}, {v: 2.0 * v for v in range(10)})
+        self.assertEqual(sum(calls), 10)
+        self.assertLessEqual(max(calls), 4)
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(scheduler.stats()['batches'], 3)
+
+
+def _png_bytes(value, size=(12, 10), mode='RGB'):
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new(mode, size, (value,) * len(mode)).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class _MeanModel:
+    # Keras-like stand-in scoring each image by its mean input value (per channel)
+    def __init__(self, per_channel=False):
+        self.per_channel = per_channel
+        self.batch_sizes = []
+        self.error = None
+
+    def predict(self, batch, verbose=0):
+        if self.error is not None:
+            raise self.error
+        self.batch_sizes.append(len(batch))
+        if self.per_channel:
+            return batch.mean(axis=(1, 2))
+        return batch.reshape(len(batch), -1).mean(axis=1, keepdims=True)
+
+
+def _png_rgb(color, size=(12, 10)):
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def _jpeg_bytes(size=(320, 240)):
+    from PIL import Image
+    x, y = np.meshgrid(np.linspace(0, 255, size[0]), np.linspace(0, 255, size[1]))
+    pixels = np.stack([x, y / 2, np.full_like(x, 200)], axis=-1).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
+
+
+class PreprocessPlanTests(SimpleTestCase):
+
+    def test_jpeg_draft_decodes_at_reduced_scale(self):
+        from PIL import Image
+        data = _jpeg_bytes(size=(800, 600))
+        plan = PreprocessPlan(target_size=(90, 60))
+
+        drafted_image = Image.open(io.BytesIO(data))
+        drafted = plan.load_pixels(drafted_image, draft=True)
+        full_image = Image.open(io.BytesIO(data))
+        full = plan.load_pixels(full_image, draft=False)
+
+        # libjpeg picked the smallest DCT scale still covering the target (1/8 here)
+        self.assertEqual(drafted_image.size, (100, 75))
+        self.assertEqual(full_image.size, (800, 600))
+        self.assertEqual(drafted.shape, (60, 90, 3))
+        self.assertEqual(drafted.dtype, np.uint8)
+        self.assertLess(np.abs(drafted.astype(int) - full.astype(int)).mean(), 3)
+
+    def test_draft_leaves_other_formats_alone(self):
+        from PIL import Image
+        plan = PreprocessPlan(target_size=(6, 5))
+        image = Image.open(io.BytesIO(_png_bytes(90, size=(60, 50))))
+        batch = plan.apply(image, draft=True)
+        self.assertEqual(batch.shape, (1, 5, 6, 3))
+        np.testing.assert_allclose(batch, 90 / 255.0, rtol=1e-6)
+
+
+class PredictBatchTests(SimpleTestCase):
+
+    def test_results_keep_input_order_across_chunks(self):
+        detector = PlantDiseaseDetector()
+        detector.model = _MeanModel()
+        detector.preprocess_plan = PreprocessPlan(target_size=(6, 5))
+        detector.decode_workers = 3
+        values = [10, 200, 30, 120, 250]
+        sources = [_png_bytes(v) for v in values]
+        sources.insert(2, b'not an image')
+
+        results = detector.predict_batch(sources, max_batch_size=2)
+
+        self.assertEqual(detector.model.batch_sizes, [2, 2, 1])
+        self.assertEqual(results[2]['error'], 'Failed to process image')
+        confidences = [r['confidence'] for i, r in enumerate(results) if i != 2]
+        np.testing.assert_allclose(confidences, [v / 255.0 for v in values], rtol=1e-6)
+        self.assertTrue(all(r['image_path'] is source for r, source in zip(results, sources)))
+
+
+class NearDuplicateTests(SimpleTestCase):
+
+    def _detector(self, near_duplicates):
+        detector = PlantDiseaseDetector()
+        detector.model = _MeanModel(per_channel=True)
+        detector.model_digest = 'test'
+        detector.preprocess_plan = PreprocessPlan(target_size=(40, 30))
+        if near_duplicates:
+            detector.enable_near_duplicates(NearDuplicateIndex())
+        return detector
+
+    def test_index_does_not_change_scores(self):
+        from PIL import Image
+        data = _jpeg_bytes()
+        plain, indexed = self._detector(False), self._detector(True)
+        for source in (lambda: data, lambda: Image.open(io.BytesIO(data))):
+            expected = plain.predict(source())['all_predictions']['confidence_scores']
+            scores = indexed.predict(source())['all_predictions']['confidence_scores']
+            np.testing.assert_allclose(scores, expected, rtol=1e-6)
+            indexed.near_duplicates.clear()
+        # Colour survives: the model did not see a grayscale thumbnail
+        self.assertGreater(np.ptp(expected), 0.1)
+
+    def test_predict_batch_consults_and_fills_the_index(self):
+        detector = self._detector(True)
+        first = detector.predict_batch([_jpeg_bytes()])
+        second = detector.predict_batch([_jpeg_bytes(size=(321, 240))])
+
+        self.assertEqual(detector.model.batch_sizes, [1])
+        self.assertEqual(second[0]['all_predictions'], first[0]['all_predictions'])
+        self.assertEqual(detector.near_duplicates.stats()['hits'], 1)
+
+
+@unittest.skipUnless(HAS_TENSORFLOW, 'TensorFlow is needed to build the test model')
+class InferenceDaemonTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        from tensorflow import keras
+
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        model_path = os.path.join(cls.tmpdir.name, 'model.npz')
+        export_keras_model(_build_keras_model(keras), model_path)
+        cls.detector = PlantDiseaseDetector()
+        cls.detector.load_model(model_path)
+
+        socket_path = os.path.join(cls.tmpdir.name, 'inference.sock')
+        environ = dict(os.environ, INFERENCE_SOCKET='', PREDICT_BATCHING='False', PRELOAD_MODEL='False')
+        cls.daemon = subprocess.Popen(
+            [sys.executable, 'manage.py', 'run_inference_server', '--socket', socket_path, '--model-path', model_path],
+            cwd=settings.BASE_DIR, env=environ, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        )
+        cls.remote = InferenceClient(socket_path, slots=2, timeout=30)
+        for _ in range(300):
+            if os.path.exists(socket_path) and cls.remote.connect():
+                break
+            if cls.daemon.poll() is not None:
+                raise RuntimeError(cls.daemon.stderr.read().decode())
+            threading.Event().wait(0.1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.daemon.terminate()
+        cls.daemon.wait(30)
+        cls.daemon.stderr.close()
+        cls.tmpdir.cleanup()
+        super().tearDownClass()
+
+    def test_round_trip_matches_in_process_results(self):
+        sources = [_png_bytes(v, size=(40, 30)) for v in (10, 60, 110, 160, 210)]
+        sources.append(_jpeg_bytes(size=(64, 48)))
+        expected = [self.detector.predict(source) for source in sources]
+
+        with mock.patch('core.inference_server.send_message', wraps=send_message) as sent:
+            single = self.remote.predict(sources[-1])
+            batch = self.remote.predict_batch(sources)
+
+        np.testing.assert_allclose(single['all_predictions']['confidence_scores'],
+                                   expected[-1]['all_predictions']['confidence_scores'], atol=1e-6)
+        for result, reference in zip(batch, expected):
+            self.assertEqual(result['all_predictions']['class_index'], reference['all_predictions']['class_index'])
+            np.testing.assert_allclose(result['all_predictions']['confidence_scores'],
+                                       reference['all_predictions']['confidence_scores'], atol=1e-6)
+        self.assertEqual(self.remote.image_size, self.detector.image_size)
+        self.assertEqual(self.remote.model_identity, self.detector.model_identity)
+        # Pixels crossed the shared-memory ring, two images per segment; the
+        # socket only carried the segment numbers
+        messages = [call.args[1] for call in sent.call_args_list]
+        self.assertEqual([(m['op'], m['count']) for m in messages], [('predict', 1)] + [('predict', 2)] * 3)
+        segments = [m['segment'] for m in messages]
+        self.assertTrue(all(a != b for a, b in zip(segments, segments[1:])), segments)
+
+    def test_errors_propagate(self):
+        connection = self.remote._connection()
+        self.assertEqual(connection.request({'op': 'predict', 'segment': 5, 'count': 1}),
+                         {'ok': False, 'error': 'Segment or count out of range'})
+        self.assertEqual(connection.request({'op': 'bogus'}), {'ok': False, 'error': "Unknown op 'bogus'"})
+        self.assertFalse(self.remote.load_model(os.path.join(self.tmpdir.name, 'missing.keras')))
+        # Still serving the unchanged model afterwards
+        self.assertEqual(self.remote.model_identity, self.detector.model_identity)
+        self.assertNotIn('error', self.remote.predict(_png_bytes(90)))
+
+
+class PredictionCacheTests(SimpleTestCase):
+
+    def test_concurrent_identical_requests_compute_once(self):
+        cache = PredictionCache()
+        release = threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            release.wait(5)
+            return {'predicted_class': 'healthy', 'confidence': 0.9}
+
+        results = [None] * 8
+        def call(i):
+            results[i] = cache.get_or_compute('key', compute)
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(len(results))]
+        for thread in threads:
+            thread.start()
+        while cache.stats()['misses'] + cache.stats()['coalesced'] < len(results):
+            threading.Event().wait(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(r == {'predicted_class': 'healthy', 'confidence': 0.9} for r in results))
+        self.assertEqual(cache.stats()['coalesced'], len(results) - 1)
+
+    def test_error_results_are_not_cached(self):
+        cache = PredictionCache()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return {'error': 'Failed to process image'}
+
+        self.assertEqual(cache.get_or_compute('key', compute), {'error': 'Failed to process image'})
+        cache.get_or_compute('key', compute)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(cache.stats()['entries'], 0)
+
+    def test_lru_eviction_and_ttl_expiry_are_counted(self):
+        cache = PredictionCache(max_entries=2, ttl_seconds=60)
+        with mock.patch('core.prediction_cache.time.monotonic', return_value=1000.0):
+            cache.set('a', {'confidence': 1})
+            cache.set('b', {'confidence': 2})
+            cache.get('a')  # 'b' is now least recently used
+            cache.set('c', {'confidence': 3})
+            self.assertIsNone(cache.get('b'))
+            self.assertEqual(cache.get('a'), {'confidence': 1})
+        with mock.patch('core.prediction_cache.time.monotonic', return_value=1061.0):
+            self.assertIsNone(cache.get('c'))
+
+        stats = cache.stats()
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual(stats['expirations'], 1)
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (2, 2, 1))
+
+
+@unittest.skipUnless(HAS_TENSORFLOW, 'TensorFlow is needed to build the reference model')
+class NumpyEngineParityTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        from tensorflow import keras
+
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.model = _build_keras_model(keras)
+        # Give BatchNormalization non-trivial statistics
+        bn = cls.model.layers[3]
+        rng = np.random.default_rng(0)
+        bn.set_weights([rng.uniform(0.5, 1.5, 8), rng.normal(size=8), rng.normal(size=8), rng.uniform(0.5, 2.0, 8)])
+        cls.batch = rng.uniform(0, 255, size=(4, 23, 19, 3)).astype('float32')
+        cls.expected = np.asarray(cls.model(cls.batch, training=False))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmpdir.cleanup()
+        super().tearDownClass()
+
+    def _export(self, name, float16=False):
+        path = os.path.join(self.tmpdir.name, name)
+        export_keras_model(self.model, path, float16=float16)
+        return path
+
+    def test_float32_matches_keras(self):
+        engine = NumpyModel(self._export('model.npz'))
+        actual = engine.predict(self.batch)
+        self.assertEqual(actual.shape, self.expected.shape)
+        np.testing.assert_allclose(actual, self.expected, atol=1e-5)
+
+    def test_single_image_batch(self):
+        engine = NumpyModel(self._export('single.npz'))
+        np.testing.assert_allclose(engine.predict(self.batch[:1]), self.expected[:1], atol=1e-5)
+
+    def test_mmap_weights(self):
+        engine = NumpyModel(self._export('mapped.npz'), mmap=True)
+        self.assertTrue(any(isinstance(w, np.memmap) for _, _, weights in engine._ops for w in weights))
+        np.testing.assert_allclose(engine.predict(self.batch), self.expected, atol=1e-5)
+
+    def test_float16_weights(self):
+        engine = NumpyModel(self._export('half.npz', float16=True), weights_dtype='float16')
+        actual = engine.predict(self.batch)
+        np.testing.assert_allclose(actual, self.expected, atol=5e-3)
+        _assert_same_top1(actual, self.expected, 5e-3)
+
+    def test_float16_file_is_upcast_once_at_load(self):
+        engine = NumpyModel(self._export('half_default.npz', float16=True), mmap=True)
+        weights = [w for _, _, layer_weights in engine._ops for w in layer_weights]
+        self.assertTrue(weights and all(w.dtype == np.float32 for w in weights))
+        np.testing.assert_allclose(engine.predict(self.batch), self.expected, atol=5e-3)
+
+    def test_batch_normalization_axis(self):
+        from tensorflow import keras
+
+        model = keras.Sequential([
+            keras.Input((6, 5, 3)),
+            keras.layers.BatchNormalization(axis=1),
+            keras.layers.Flatten(),
+            keras.layers.Dense(4),
+        ])
+        rng = np.random.default_rng(2)
+        model.layers[0].set_weights([rng.uniform(0.5, 1.5, 6), rng.normal(size=6),
+                                     rng.normal(size=6), rng.uniform(0.5, 2.0, 6)])
+        path = os.path.join(self.tmpdir.name, 'bn_axis.npz')
+        export_keras_model(model, path)
+        batch = rng.normal(size=(2, 6, 5, 3)).astype('float32')
+        np.testing.assert_allclose(NumpyModel(path).predict(batch), np.asarray(model(batch, training=False)),
+                                   atol=1e-5)
+
+    def test_unsupported_layer_is_rejected(self):
+        from tensorflow import keras
+
+        model = keras.Sequential([keras.Input((8, 8, 3)), keras.layers.DepthwiseConv2D(3)])
+        with self.assertRaises(ValueError):
+            export_keras_model(model, os.path.join(self.tmpdir.name, 'bad.npz'))
+
+    def test_detector_serves_npz_without_tensorflow(self):
+        path = self._export('served.npz')
+        script = (
+            "import sys\n"
+            "from core.ml_model import PlantDiseaseDetector\n"
+            "detector = PlantDiseaseDetector()\n"
+            f"assert detector.load_model({path!r})\n"
+            "from PIL import Image\n"
+            "result = detector.predict(Image.new('RGB', (40, 30), 'green'))\n"
+            "assert 'error' not in result, result\n"
+            "assert 'tensorflow' not in sys.modules\n"
+        )
+        completed = subprocess.run(
+            [sys.executable, '-c', script], cwd=settings.BASE_DIR, capture_output=True, text=True
+        )
+        self.assertEqual(completed.returncode, 0, completed.stderr)
+
+
+@unittest.skipUnless(HAS_TENSORFLOW, 'TensorFlow is needed to build the test model')
+class FastInferenceTests(SimpleTestCase):
+
+    def test_bucket_padding_matches_model_predict(self):
+        from tensorflow import keras
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'model.keras')
+            _build_keras_model(keras).save(path)
+            detector = PlantDiseaseDetector()
+            self.assertTrue(detector.load_model(path))
+        detector.enable_fast_inference(buckets=(1, 4))
+        self.assertEqual(sorted(detector._compiled), [1, 4])
+
+        batch = np.random.default_rng(0).uniform(0, 255, size=(6, 23, 19, 3)).astype('float32')
+        expected = np.asarray(detector.model.predict(batch, verbose=0))
+        # 1 hits a bucket exactly, 3 is padded to 4, 6 spans a full bucket plus a padded one
+        for n in (1, 3, 6):
+            actual = detector._run_model(batch[:n])
+            self.assertEqual(actual.shape, (n, 5))
+            np.testing.assert_allclose(actual, expected[:n], atol=1e-5)
+
+
+@unittest.skipUnless(HAS_TENSORFLOW, 'TensorFlow is needed to build the test model')
+class ServingGraphTests(SimpleTestCase):
+
+    def test_unresized_uint8_input_matches_float_path(self):
+        from PIL import Image
+        from tensorflow import keras
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'model.keras')
+            _build_keras_model(keras).save(path)
+            float_detector = PlantDiseaseDetector()
+            self.assertTrue(float_detector.load_model(path))
+            serving = build_serving_model(float_detector.model, float_detector.preprocess_plan)
+            serving.save(serving_path(path))
+            graph_detector = PlantDiseaseDetector()
+            self.assertTrue(graph_detector.load_model(serving_path(path)))
+        self.assertEqual(graph_detector.preprocess_plan.normalization, 'graph')
+        self.assertEqual(graph_detector.image_size, (19, 23))
+
+        # A smooth image 5x the model input, so host and in-graph resizing agree
+        x, y = np.meshgrid(np.linspace(0, 255, 95), np.linspace(0, 255, 115))
+        image = Image.fromarray(np.stack([x, y, 255 - y], axis=-1).astype(np.uint8))
+        buffer = io.BytesIO()
+        image.save(buffer, 'PNG')
+        data = buffer.getvalue()
+
+        processed = graph_detector.preprocess_image(data, resize=graph_detector._resize_single_images)
+        self.assertEqual((processed.shape, processed.dtype), ((1, 115, 95, 3), np.uint8))
+        expected = np.array([float_detector.predict(data)['all_predictions']['confidence_scores']])
+        for fast in (False, True):
+            if fast:
+                graph_detector.enable_fast_inference(buckets=(1,))
+            actual = np.array([graph_detector.predict(data)['all_predictions']['confidence_scores']])
+            np.testing.assert_allclose(actual, expected, atol=0.02)
+            _assert_same_top1(actual, expected, 0.02)
+
+
+@unittest.skipUnless(HAS_TENSORFLOW, 'TensorFlow is needed to convert the test model')
+class TFLiteParityTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        from tensorflow import keras
+
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.model = _build_keras_model(keras)
+        rng = np.random.default_rng(1)
+        cls.calibration = [rng.uniform(0, 255, size=(1, 23, 19, 3)).astype('float32') for _ in range(32)]
+        cls.batch = rng.uniform(0, 255, size=(6, 23, 19, 3)).astype('float32')
+        cls.expected = np.asarray(cls.model(cls.batch, training=False))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmpdir.cleanup()
+        super().tearDownClass()
+
+    def _convert(self, quantization):
+        path = os.path.join(self.tmpdir.name, f'model_{quantization}.tflite')
+        with open(path, 'wb') as f:
+            f.write(convert_model(self.model, quantization, self.calibration))
+        write_metadata(path, self.model, quantization, 'model.keras')
+        return path
+
+    def test_float16_matches_keras(self):
+        engine = TFLiteModel(self._convert('float16'))
+        actual = engine.predict(self.batch)
+        np.testing.assert_allclose(actual, self.expected, atol=5e-3)
+        _assert_same_top1(actual, self.expected, 5e-3)
+
+    def test_int8_stays_close_to_keras(self):
+        engine = TFLiteModel(self._convert('int8'))
+        # Batch sizes other than the converted one resize the interpreter
+        actual = np.concatenate([engine.predict(self.batch[:1]), engine.predict(self.batch[1:])])
+        self.assertEqual(actual.shape, self.expected.shape)
+        self.assertLess(np.abs(actual - self.expected).mean(), 0.02)
+        np.testing.assert_allclose(actual.sum(axis=1), 1.0, atol=0.05)
+
+    def test_detector_serves_tflite(self):
+        detector = PlantDiseaseDetector()
+        self.assertTrue(detector.load_model(self._convert('float16')))
+        self.assertEqual(detector.image_size, (19, 23))
+        scores = detector.predict_preprocessed(self.batch[:2] / 255.0)
+        self.assertEqual([len(r['all_predictions']['confidence_scores']) for r in scores], [5, 5])
+
+
+@unittest.skipUnless(HAS_TENSORFLOW, 'TensorFlow is needed to build the test model')
+class ModelRegistryTests(SimpleTestCase):
+
+    def test_swap_keeps_in_flight_version_and_evicts_idle_models(self):
+        from tensorflow import keras
+
+        # The registry's default model becomes the process-wide detector
+        self.addCleanup(install_detector, get_detector())
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'model.npz')
+            export_keras_model(_build_keras_model(keras), path)
+            registry = ModelRegistry(memory_budget_mb=1e-6)
+            registry.register('a', path)
+            registry.register('b', path)
+
+            with registry.use('a') as held:
+                replacement = registry.load('a', path).result()
+                self.assertEqual((held.version, replacement.version), (1, 2))
+                self.assertIsNot(held.detector, replacement.detector)
+                self.assertTrue(held.retired)
+            with registry.use('a') as entry:
+                self.assertIs(entry, replacement)
+
+            # 'a' is the default and stays; 'b' goes as soon as it is idle
+            with registry.use('b'):
+                self.assertEqual({e['name'] for e in registry.stats()['resident']}, {'a', 'b'})
+            self.assertEqual({e['name'] for e in registry.stats()['resident']}, {'a'})
+            self.assertEqual(registry.evictions, 1)
+
+
+class CascadeTests(SimpleTestCase):
+
+    def test_shipped_class_maps_reconcile(self):
+        def class_map(name):
+            with open(os.path.join(settings.BASE_DIR, 'models', name)) as f:
+                return json.load(f)
+
+        cnn, efficientnet = class_map('class_indices_cnn_simple.json'), class_map('class_indices_efficientnetb0.json')
+        order = label_permutation(cnn, efficientnet)
+        # Reordered CNN scores line up with EfficientNet's names
+        for index, name in efficientnet.items():
+            self.assertEqual(cnn[str(order[int(index)])].replace('_', '').lower()[-8:],
+                             name.replace('_', '').lower()[-8:])
+        self.assertEqual(cnn[str(order[11])], 'Tomato_Spider_mites_Two_spotted_spider_mite')
+
+    def test_escalation_mask(self):
+        scores = np.array([[0.9, 0.05, 0.05], [0.6, 0.4, 0.0], [0.5, 0.3, 0.2]])
+        np.testing.assert_array_equal(escalation_mask(scores, 0.55, 0.0), [False, False, True])
+        np.testing.assert_array_equal(escalation_mask(scores, 0.0, 0.25), [False, True, True])
+
+
+    def _cascade(self):
+        primary, secondary = PlantDiseaseDetector(), PlantDiseaseDetector()
+        for detector in (primary, secondary):
+            detector.model = _MeanModel(per_channel=True)
+            detector.preprocess_plan = PreprocessPlan(target_size=(6, 5))
+        # Same classes, named and ordered differently
+        primary.class_indices = {'0': 'Tomato_healthy', '1': 'Potato___Early_blight', '2': 'Pepper__bell___Bacterial_spot'}
+        secondary.class_indices = {'0': 'Pepper__bell___Bacterial_spot', '1': 'Tomato__healthy', '2': 'Potato___Early_blight'}
+        registry = ModelRegistry()
+        registry.register_detector('small', primary)
+        registry.register_detector('large', secondary)
+        return CascadeDetector(registry, 'small', 'large', confidence_threshold=0.8), secondary
+
+    def test_predict_batch_escalates_unsure_rows(self):
+        cascade, secondary = self._cascade()
+        # Scores are the channel means: confident, unsure, unreadable
+        sources = [_png_rgb((230, 10, 10)), _png_rgb((120, 100, 10)), b'not an image']
+        confident, unsure, broken = cascade.predict_batch(sources)
+
+        self.assertEqual((confident['disease'], confident['cascade']['stage'], confident['cascade']['escalated']),
+                         ('Tomato__healthy', 'small', False))
+        # Reported in the secondary's class order
+        self.assertEqual(confident['all_predictions']['class_index'], 1)
+        self.assertAlmostEqual(confident['cascade']['primary_confidence'], 230 / 255, places=5)
+        self.assertEqual((unsure['disease'], unsure['cascade']['stage'], unsure['cascade']['escalated']),
+                         ('Pepper__bell___Bacterial_spot', 'large', True))
+        self.assertAlmostEqual(unsure['cascade']['primary_margin'], 20 / 255, places=5)
+        self.assertEqual(secondary.model.batch_sizes, [1])
+        self.assertIn('error', broken)
+        self.assertTrue(all(r['image_path'] is source for r, source in zip((confident, unsure, broken), sources)))
+        self.assertEqual({k: cascade.stats()[k] for k in ('predictions', 'escalated', 'escalation_rate')},
+                         {'predictions': 2, 'escalated': 1, 'escalation_rate': 0.5})
+
+        # A failing secondary leaves the primary's answer in place
+        secondary.model.error = RuntimeError('out of memory')
+        fallback = cascade.predict(sources[1])
+        self.assertEqual((fallback['disease'], fallback['cascade']['stage']), ('Tomato__healthy', 'small'))
+        self.assertIn('escalation_error', fallback['cascade'])
+
+    @override_settings(PREDICT_CASCADE=True, PREDICT_CASCADE_PRIMARY='missing')
+    def test_unavailable_cascade_falls_back_to_the_default_model(self):
+        registry = ModelRegistry()
+        with self.assertLogs('core.apps', 'WARNING') as logs:
+            django_apps.get_app_config('core').register_models(registry)
+        self.assertIn('no model files for missing', logs.output[0])
+        self.assertNotIn('cascade', registry.names())
+
+        request = RequestFactory().post('/', {})
+        with mock.patch('core.views.get_registry', return_value=registry):
+            self.assertIsNone(_requested_model(request))
+            registry.register_detector('cascade', _StubDetector())
+            self.assertEqual(_requested_model(request), 'cascade')
+
+
+class ResolutionTierTests(SimpleTestCase):
+
+    def test_select_tier(self):
+        registry = ModelRegistry()
+        for name in ('efficientnetb0', 'efficientnetb0@160', 'efficientnetb0@192', 'cnn_simple'):
+            registry.register(name, f'{name}.keras')
+        tiers = parse_tiers('fast:128, balanced:160,accurate:0')
+        # Exact size, else the nearest larger variant, else the model itself
+        self.assertEqual(select_tier(registry, 'efficientnetb0', 'balanced', tiers), 'efficientnetb0@160')
+        self.assertEqual(select_tier(registry, 'efficientnetb0', 'fast', tiers), 'efficientnetb0@160')
+        self.assertEqual(select_tier(registry, 'efficientnetb0', 'accurate', tiers), 'efficientnetb0')
+        self.assertEqual(select_tier(registry, 'cnn_simple', 'fast', tiers), 'cnn_simple')
+        with self.assertRaises(UnknownTier):
+            select_tier(registry, 'efficientnetb0', 'turbo', tiers)
+
+
+class BenchmarkBaselineTests(SimpleTestCase):
+
+    def test_flags_only_regressions_beyond_tolerance(self):
+        baseline = {'cold_load_s': 2.0, 'first_prediction_ms': 100.0, 'peak_rss_mb': 500.0,
+                    'batch_sizes': {'1': {'p50_ms': 10.0, 'p95_ms': 12.0, 'p99_ms': 15.0, 'images_per_sec': 100.0}}}
+        results = {'cold_load_s': 1.0, 'first_prediction_ms': 105.0, 'peak_rss_mb': 500.0,
+                   'batch_sizes': {'1': {'p50_ms': 13.0, 'p95_ms': 12.0, 'p99_ms': 15.0, 'images_per_sec': 80.0}}}
+        regressions = {metric for metric, *_ in compare_with_baseline(results, baseline, tolerance=0.1)}
+        self.assertEqual(regressions, {'batch_1.p50_ms', 'batch_1.images_per_sec'})
+
+
+class StageTimingTests(SimpleTestCase):
+
+    def test_histogram_exposition(self):
+        histogram = Histogram('test_seconds', 'Test', 'stage', buckets=(0.01, 0.1))
+        for seconds in (0.005, 0.05, 0.5):
+            histogram.observe('decode', seconds)
+        text = histogram.render()
+        self.assertIn('test_seconds_bucket{stage="decode",le="0.01"} 1', text)
+        self.assertIn('test_seconds_bucket{stage="decode",le="0.1"} 2', text)
+        self.assertIn('test_seconds_bucket{stage="decode",le="+Inf"} 3', text)
+        self.assertIn('test_seconds_count{stage="decode"} 3', text)
+
+    def test_request_timings_follow_bound_threads(self):
+        def work():
+            with stage('decode'):
+                pass
+
+        with request_timings() as timings:
+            thread = threading.Thread(target=bind(work))
+            thread.start()
+            thread.join()
+        self.assertEqual(list(timings.stages), ['decode'])
+        self.assertRegex(timings.server_timing(0.002), r'^decode;dur=\d+\.\d\d, total;dur=2\.00$')
+
+
+class ProfilingTests(SimpleTestCase):
+
+    def test_profiles_next_n_requests_then_disarms(self):
+        @profiling.profile_request
+        def view(x):
+            return sum(range(x))
+
+        with tempfile.TemporaryDirectory() as directory:
+            session = profiling.arm(directory, requests=2)
+            self.addCleanup(profiling.disarm)
+            self.assertEqual([view(1000) for _ in range(3)], [sum(range(1000))] * 3)
+            self.assertIsNone(profiling.status()['armed'])
+            files = sorted(os.listdir(session.directory))
+            self.assertEqual(files, ['request-001.prof', 'request-002.prof', 'requests.jsonl', 'summary.txt'])
+            with open(os.path.join(session.directory, 'summary.txt')) as f:
+                self.assertIn('Profiled requests: 2', f.read())
+
+
+def _load_script(name):
+    # scripts/ is not a package; its modules import each other by file name
+    scripts_dir = os.path.join(settings.BASE_DIR, 'scripts')
+    with mock.patch.object(sys, 'path', [scripts_dir] + sys.path):
+        spec = importlib.util.spec_from_file_location(name, os.path.join(scripts_dir, f'{name}.py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    return module
+
+
+class LoadTestHarnessTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.load_test = _load_script('load_test')
+
+    def test_config_and_mix_parsing(self):
+        self.assertEqual(self.load_test._parse_config('w2t2:WEB_CONCURRENCY=2, GUNICORN_THREADS=2'),
+                         ('w2t2', {'WEB_CONCURRENCY': '2', 'GUNICORN_THREADS': '2'}))
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for name in ('a.png', 'b.png', 'notes.txt'):
+                with open(os.path.join(tmpdir, name), 'wb') as f:
+                    f.write(_png_bytes(100, size=(80, 40)))
+            images, weights = self.load_test.load_images(tmpdir, 0, 'native:3,20:1')
+
+        self.assertEqual([(name, variant) for name, _, variant in images],
+                         [('a.png', 'native'), ('b.png', 'native'), ('a.png', '20'), ('b.png', '20')])
+        self.assertEqual(weights, [1.5, 1.5, 0.5, 0.5])
+        from PIL import Image
+        self.assertEqual(Image.open(io.BytesIO(images[2][1])).size, (20, 10))
+
+    def test_closed_loop_against_a_local_server(self):
+        replies = iter([b'{"success": true}', b'{"success": false}'])
+
+        async def handle(reader, writer):
+            head = await reader.readuntil(b'\r\n\r\n')
+            length = int(next(line.split(b':')[1] for line in head.split(b'\r\n')
+                              if line.lower().startswith(b'content-length')))
+            await reader.readexactly(length)
+            body = next(replies, b'{"success": true}')
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n\r\n' + body)
+            await writer.drain()
+            writer.close()
+
+        async def scenario():
+            server = await asyncio.start_server(handle, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            async with server:
+                return await self.load_test.run_load('127.0.0.1', port, '/api/predict/', [('a.png', b'x' * 10, 'native')],
+                                                     [1.0], concurrency=2, rate=None, duration=0.2, timeout=5, seed=0)
+
+        result = asyncio.run(scenario())
+        summary = self.load_test.summarize('local', result['records'], result['elapsed'], [])
+
+        self.assertGreater(summary['requests'], 2)
+        self.assertEqual(summary['outcomes'].get('app_error'), 1)
+        self.assertEqual((summary['ok'], summary['errors'], summary['timeouts']),
+                         (summary['requests'] - 1, 1, 0))
+        latencies = summary['latency_ms']
+        self.assertTrue(0 < latencies['p50'] <= latencies['p95'] <= latencies['p100'])
+        self.assertEqual(self.load_test._percentile([4, 1, 3, 2], 50), 3)
+
+
+class PredictDirTests(SimpleTestCase):
+
+    def test_walk_order_and_resume_point(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for path in ('b/2.jpg', 'b/1.JPG', 'a/x.png', 'z.jpg', 'notes.txt'):
+                os.makedirs(os.path.join(directory, os.path.dirname(path)), exist_ok=True)
+                open(os.path.join(directory, path), 'w').close()
+            self.assertEqual(list(iter_images(directory)),
+                             ['z.jpg', os.path.join('a', 'x.png'), os.path.join('b', '1.JPG'), os.path.join('b', '2.jpg')])
+
+            output = os.path.join(directory, 'out.jsonl')
+            with open(output, 'w') as f:
+                f.write('{"path": "a/x.png"}\n{"path": "b/1.JPG"}\n{"path": "b/2')
+            # The torn row from an interrupted run is dropped
+            self.assertEqual(last_written(output, 'jsonl'), ('b/1.JPG', 2))
+            with open(output) as f:
+                self.assertTrue(f.read().endswith('1.JPG"}\n'))
+
+
+class _StubDetector:
+    # Scores an image by its first pixel; enough to check ordering
+    model = model_path = 'stub'
+    decode_workers = 2
+
+    def preprocess_image(self, data):
+        from PIL import Image
+        try:
+            return np.full((1, 1, 1, 1), Image.open(io.BytesIO(data)).getpixel((0, 0)), dtype=np.float32)
+        except Exception:
+            return None
+
+    def predict_preprocessed(self, batch):
+        return [{'disease': f'class_{int(v)}', 'confidence': 0.5} for v in batch.reshape(-1)]
+
+
+class BatchJobTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        overrides = override_settings(PREDICT_JOBS_DIR=directory.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    @staticmethod
+    def _png(value):
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.new('L', (4, 4), value).save(buffer, 'PNG')
+        return buffer.getvalue()
+
+    def test_job_is_scored_in_batches_in_upload_order(self):
+        files = [SimpleUploadedFile(f'{v}.png', self._png(v)) for v in (7, 3, 9)]
+        files.insert(2, SimpleUploadedFile('broken.jpg', b'not an image'))
+        job = create_job(files)
+        self.assertEqual((job.status, job.total), ('queued', 4))
+
+        claimed = claim_next_job('test:1')
+        self.assertEqual(claimed.pk, job.pk)
+        self.assertIsNone(claim_next_job('test:2'))
+
+        registry = ModelRegistry()
+        registry.register_detector('stub', _StubDetector())
+        claimed.model = 'stub'
+        with mock.patch('core.batch_jobs.get_registry', return_value=registry):
+            self.assertEqual(run_job(claimed, batch_size=2), 'done')
+        self.assertEqual((claimed.processed, claimed.errors), (4, 1))
+        self.assertFalse(os.path.exists(claimed.archive))
+        results = job_results(claimed)
+        self.assertEqual([r['filename'] for r in results], ['7.png', '3.png', 'broken.jpg', '9.png'])
+        self.assertEqual([r.get('predicted_class') for r in results], ['class_7', 'class_3', None, 'class_9'])
+
+    def test_archive_without_images_is_rejected(self):
+        buffer = tempfile.SpooledTemporaryFile()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            archive.writestr('notes.txt', 'no leaves here')
+        buffer.seek(0)
+        with self.assertRaises(JobRejected):
+            create_job([SimpleUploadedFile('leaves.zip', buffer.read())])
+        self.assertEqual(os.listdir(settings.PREDICT_JOBS_DIR), [])
+
+
+class JobApiTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        overrides = override_settings(PREDICT_JOBS_DIR=directory.name, PREDICT_CASCADE=False)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    @staticmethod
+    def _images():
+        return {'image': [SimpleUploadedFile(f'{v}.png', _png_bytes(v, mode='L')) for v in (7, 3)]}
+
+    def test_queue_poll_and_cancel(self):
+        response = self.client.post(reverse('core:jobs'), self._images())
+        self.assertEqual(response.status_code, 202)
+        payload = response.json()
+        self.assertEqual((payload['job']['status'], payload['job']['total']), ('queued', 2))
+        # Under WSGI there is no event stream to offer
+        self.assertNotIn('events_url', payload)
+        job_id = payload['job']['id']
+        self.assertEqual(self.client.get(f'/api/jobs/{job_id}/events/').status_code, 404)
+
+        status = self.client.get(payload['status_url'])
+        self.assertEqual((status.status_code, status.json()['results'], status.json()['next']), (200, [], 0))
+
+        cancelled = self.client.delete(payload['status_url'])
+        self.assertEqual(cancelled.json()['job']['status'], 'cancelled')
+        self.assertEqual(self.client.get(f'/api/jobs/{uuid.uuid4()}/').status_code, 404)
+
+    async def test_events_stream_under_asgi(self):
+        response = await self.async_client.post(reverse('core:jobs'), self._images())
+        self.assertEqual(response.status_code, 202)
+        payload = response.json()
+        job = await sync_to_async(claim_next_job)('test:1')
+        registry = ModelRegistry()
+        registry.register_detector('stub', _StubDetector())
+        job.model = 'stub'
+        with mock.patch('core.batch_jobs.get_registry', return_value=registry):
+            await sync_to_async(run_job)(job, batch_size=1)
+
+        response = await self.async_client.get(payload['events_url'])
+        events = [chunk.decode() async for chunk in response.streaming_content]
+        self.assertEqual([e.split('event: ')[1].split('\n')[0] for e in events], ['results', 'progress'])
+        self.assertTrue(events[0].startswith('id: 2\n'))
+        self.assertIn('"status": "done"', events[1])
+
+        # Reconnecting after the last result only repeats the progress
+        response = await self.async_client.get(payload['events_url'], headers={'Last-Event-ID': '2'})
+        events = [chunk.decode() async for chunk in response.streaming_content]
+        self.assertEqual(len(events), 1)
+        self.assertIn('event: progress', events[0])
+
+
+class _CountingUploadHandler(FileUploadHandler):
+    # Stands in for the memory / temp-file handlers: counts what reaches them
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+
+    def file_complete(self, file_size):
+        return SimpleUploadedFile(self.file_name, b'', self.content_type)
+
+
+class ImageUploadHandlerTests(SimpleTestCase):
+
+    @staticmethod
+    def _parse(*files):
+        body = encode_multipart(BOUNDARY, {'image': list(files)})
+        meta = {'CONTENT_TYPE': MULTIPART_CONTENT, 'CONTENT_LENGTH': str(len(body))}
+        request = HttpRequest()
+        counting = _CountingUploadHandler(request)
+        _, parsed = MultiPartParser(meta, io.BytesIO(body), [ImageUploadHandler(request), counting]).parse()
+        return parsed.getlist('image'), getattr(request, 'upload_rejections', []), counting.received
+
+    @staticmethod
+    def _image(image_format, size=(40, 30)):
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.new('RGB', size, (20, 160, 40)).save(buffer, image_format)
+        return buffer.getvalue()
+
+    def test_header_dimensions(self):
+        for image_format in ('JPEG', 'PNG', 'WEBP', 'BMP', 'GIF'):
+            self.assertEqual(image_header(self._image(image_format, (321, 123))), (image_format, (321, 123)))
+
+    def test_valid_image_passes_through_unchanged(self):
+        jpeg = self._image('JPEG')
+        files, rejected, received = self._parse(SimpleUploadedFile('leaf.jpg', jpeg))
+        self.assertEqual((len(files), rejected, received), (1, [], len(jpeg)))
+
+    def test_rejected_files_never_reach_the_buffering_handlers(self):
+        padding = b'\0' * (3 * 1024 * 1024)
+        not_an_image = SimpleUploadedFile('leaf.jpg', b'%PDF-1.7 ' + padding)
+        # A PNG header declaring 40000 x 40000 pixels
+        bomb = SimpleUploadedFile('bomb.png', b'\x89PNG\r\n\x1a\n\0\0\0\rIHDR' + struct.pack('>II', 40000, 40000) + padding)
+        jpeg = self._image('JPEG')
+        files, rejected, received = self._parse(not_an_image, bomb, SimpleUploadedFile('leaf.jpg', jpeg))
+
+        # Only the real image was buffered: 6 MB never left the parser
+        self.assertEqual(received, len(jpeg))
+        self.assertEqual(len(files), 1)
+        self.assertEqual([(r['position'], r['filename']) for r in rejected], [(0, 'leaf.jpg'), (1, 'bomb.png')])
+        self.assertIn('Unsupported file type', rejected[0]['error'])
+        self.assertIn('40000x40000', rejected[1]['error'])
+
+    def test_jpeg_header_behind_large_metadata_segments(self):
+        jpeg = self._image('JPEG', (321, 123))
+        # 6 x 60 KB of APP1/APP2 segments (EXIF, XMP, a split ICC profile) before the frame header
+        metadata = b''.join(bytes([0xFF, 0xE1 + i % 2]) + struct.pack('>H', 60000) + bytes(59998) for i in range(6))
+        large = jpeg[:2] + metadata + jpeg[2:]
+        sof = large.index(b'\xff\xc0')
+        bomb = large[:sof + 5] + struct.pack('>HH', 30000, 30000) + large[sof + 9:]
+        self.assertGreater(sof, 256 * 1024)
+
+        files, rejected, received = self._parse(SimpleUploadedFile('bomb.jpg', bomb),
+                                                SimpleUploadedFile('leaf.jpg', large))
+        self.assertEqual((len(files), received), (1, len(large)))
+        self.assertEqual([r['filename'] for r in rejected], ['bomb.jpg'])
+        self.assertIn('30000x30000', rejected[0]['error'])
+
+    @override_settings(PREDICT_UPLOAD_MAX_HEADER_MB=1)
+    def test_jpeg_header_must_appear_within_the_header_limit(self):
+        jpeg = self._image('JPEG')
+        # 2 MB of APP1 segments: skipped as they stream past, but all held back
+        metadata = b''.join(b'\xff\xe1' + struct.pack('>H', 65535) + bytes(65533) for _ in range(32))
+        padded = SimpleUploadedFile('padded.jpg', jpeg[:2] + metadata + jpeg[2:])
+        files, rejected, received = self._parse(padded, SimpleUploadedFile('leaf.jpg', jpeg))
+        self.assertEqual((len(files), received), (1, len(jpeg)))
+        self.assertEqual([r['filename'] for r in rejected], ['padded.jpg'])
+        self.assertIn('No JPEG frame header within the first 1 MB', rejected[0]['error'])
+
+    @override_settings(PREDICT_UPLOAD_MAX_MB=1)
+    def test_oversized_file_is_dropped_at_the_limit(self):
+        png = self._image('PNG')
+        files, rejected, received = self._parse(SimpleUploadedFile('huge.png', png + b'\0' * (4 * 1024 * 1024)))
+        self.assertEqual(files, [])
+        self.assertIn('larger than 1 MB', rejected[0]['error'])
+        # At most one chunk past the limit was passed on, out of 4 MB
+        self.assertLessEqual(received, 1024 * 1024 + 64 * 1024)
+
+
+class BoundedExecutorTests(SimpleTestCase):
+
+    def test_rejects_beyond_max_pending(self):
+        executor = BoundedExecutor(max_workers=1, max_pending=2)
+        release = threading.Event()
+
+        async def scenario():
+            first = asyncio.ensure_future(executor.run(release.wait))
+            second = asyncio.ensure_future(executor.run(lambda: 'queued'))
+            await asyncio.sleep(0)
+            with self.assertRaises(ExecutorBusy):
+                await executor.run(lambda: 'rejected')
+            release.set()
+            return await first, await second
+
+        self.assertEqual(asyncio.run(scenario()), (True, 'queued'))
+        self.assertEqual(executor.stats()['rejected'], 1)
+        self.assertEqual(executor.stats()['pending'], 0)
+
+    def test_jobs_close_their_database_connections(self):
+        executor = BoundedExecutor(max_workers=1)
+        calls = []
+
+        def job():
+            calls.append('job')
+            raise ValueError('decode failed')
+
+        with mock.patch('core.async_inference.close_old_connections',
+                        side_effect=lambda: calls.append(threading.current_thread().name)):
+            with self.assertRaises(ValueError):
+                asyncio.run(executor.run(job))
+
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(calls[1], 'job')
+        self.assertTrue(calls[0] == calls[2] and calls[0].startswith('predict'))
+
+
+class PredictViewTests(SimpleTestCase):
+
+    def setUp(self):
+        detector = PlantDiseaseDetector()
+        detector.model = _MeanModel()
+        detector.preprocess_plan = PreprocessPlan(target_size=(6, 5))
+        detector.class_indices = {'0': 'Tomato_healthy'}
+        self.registry = ModelRegistry()
+        self.registry.register_detector('stub', detector)
+        patcher = mock.patch('core.views.get_registry', return_value=self.registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def _form(*values):
+        return {'model': 'stub', 'image': [SimpleUploadedFile(f'{v}.png', _png_bytes(v)) for v in values]}
+
+    async def test_async_predict(self):
+        response = await self.async_client.post(reverse('core:predict_async'), self._form(51))
+        payload = response.json()
+        self.assertEqual((response.status_code, payload['success'], payload['predicted_class']),
+                         (200, True, 'Tomato_healthy'))
+        self.assertAlmostEqual(payload['confidence'], 20.0, places=3)
+
+    async def test_async_predict_is_rejected_when_the_executor_is_full(self):
+        executor = BoundedExecutor(max_workers=1, max_pending=1)
+        release = threading.Event()
+        running = asyncio.ensure_future(executor.run(release.wait))
+        await asyncio.sleep(0)
+        try:
+            with mock.patch('core.views.get_executor', return_value=executor):
+                response = await self.async_client.post(reverse('core:predict_async'), self._form(51))
+        finally:
+            release.set()
+            await running
+        self.assertEqual((response.status_code, response['Retry-After']), (503, '1'))
+        self.assertFalse(response.json()['success'])
+
+    def test_upload_is_decoded_in_memory(self):
+        with tempfile.TemporaryDirectory() as media, tempfile.TemporaryDirectory() as spool:
+            with override_settings(MEDIA_ROOT=media, FILE_UPLOAD_TEMP_DIR=spool):
+                response = self.client.post(reverse('core:index'), self._form(51))
+                self.assertTrue(response.json()['success'])
+                self.assertEqual((os.listdir(media), os.listdir(spool)), ([], []))
+
+    def test_batch_results_keep_upload_order_with_per_file_errors(self):
+        form = self._form(51, 102)
+        form['image'][1:1] = [
+            SimpleUploadedFile('notes.png', b'%PDF-1.7 not an image'),  # Dropped by the upload handler
+            SimpleUploadedFile('truncated.png', _png_bytes(30)[:40]),  # Valid header, fails to decode
+        ]
+        response = self.client.post(reverse('core:predict_batch'), form)
+        payload = response.json()
+        self.assertEqual((payload['success'], payload['count'], payload['model']), (True, 4, 'stub'))
+        results = payload['results']
+        self.assertEqual([r['filename'] for r in results], ['51.png', 'notes.png', 'truncated.png', '102.png'])
+        self.assertEqual([r['success'] for r in results], [True, False, False, True])
+        self.assertIn('Unsupported file type', results[1]['error'])
+        self.assertEqual(results[2]['error'], 'Failed to process image')
+        np.testing.assert_allclose([results[0]['confidence'], results[3]['confidence']], [20.0, 40.0], rtol=1e-5)
+
+    def test_server_timing_header_and_metrics(self):
+        response = self.client.post(reverse('core:index'), self._form(51))
+        self.assertTrue(response.json()['success'])
+        self.assertRegex(response['Server-Timing'],
+                         r'^upload;dur=[\d.]+, .*decode;dur=[\d.]+, .*inference;dur=[\d.]+, .*total;dur=[\d.]+$')
+
+        metrics = self.client.get(reverse('core:metrics'))
+        self.assertEqual(metrics['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        text = metrics.content.decode()
+        self.assertIn('# TYPE plant_prediction_stage_seconds histogram', text)
+        self.assertRegex(text, r'plant_prediction_stage_seconds_bucket\{stage="inference",le="\+Inf"\} [1-9]')
+        self.assertRegex(text, r'plant_request_seconds_count\{view="core:index"\} [1-9]')
+
+    async def test_server_timing_covers_stages_run_on_the_executor(self):
+        response = await self.async_client.post(reverse('core:predict_async'), self._form(51))
+        # Decode and inference ran on an executor thread but count toward this request
+        stages = [part.split(';')[0] for part in response['Server-Timing'].split(', ')]
+        self.assertEqual((stages[0], stages[-1]), ('upload', 'total'))
+        self.assertTrue({'decode', 'inference', 'serialize'} <= set(stages))
+        metrics = await self.async_client.get(reverse('core:metrics'))
+        self.assertRegex(metrics.content.decode(), r'plant_request_seconds_count\{view="core:predict_async"\} [1-9]')
+
+
+class ThreadConfigTests(SimpleTestCase):
+
+    def test_settings_override_tuned_config_for_this_machine_only(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'threads.json')
+            save_thread_config(path, {'intra_op_threads': 4, 'inter_op_threads': 2, 'decode_workers': 3})
+            config = resolve_thread_config(path, {'intra_op_threads': 1, 'decode_workers': None})
+            self.assertEqual(config, {'intra_op_threads': 1, 'inter_op_threads': 2, 'decode_workers': 3})
+
+            with open(path) as f:
+                data = json.load(f)
+            data['machine']['cpus'] += 1
+            with open(path, 'w') as f:
+                json.dump(data, f)
+            self.assertEqual(resolve_thread_config(path, {'inter_op_threads': None}), {})
@@ -0,0 +1,233 @@
+# tflite_backend.py
+"""
+TensorFlow Lite inference backend for Plant Disease Prediction
+Converts Keras models to (optionally quantized) .tflite files and runs them
+through the TFLite interpreter behind the same interface the detector uses
+for Keras models
+"""
+
+import json
+import os
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+
+QUANTIZATION_MODES = ('float32', 'float16', 'int8')
+
+
+def _interpreter_class():
+    """Prefer the standalone LiteRT/tflite runtimes, fall back to TensorFlow's"""
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    try:
+        from tflite_runtime.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    import tensorflow as tf
+    return tf.lite.Interpreter
+
+
+def tflite_path(model_path, quantization):
+    """
+    Path of the exported TFLite variant of a Keras model
+
+    Args:
+        model_path: Path to the .keras/.h5 model
+        quantization: One of QUANTIZATION_MODES
+
+    Returns:
+        str: e.g. models/plant_disease_model_cnn_simple_float16.tflite
+    """
+    stem = os.path.splitext(model_path)[0]
+    return f"{stem}_{quantization}.tflite"
+
+
+def convert_model(keras_model, quantization='float16', calibration_batches=None):
+    """
+    Convert a Keras model to a TFLite flatbuffer
+
+    Args:
+        keras_model: Loaded Keras model
+        quantization: 'float32' (no quantization), 'float16' or 'int8'
+        calibration_batches: For int8, iterable of preprocessed (1, H, W, C)
+            float32 arrays used to calibrate activation ranges
+
+    Returns:
+        bytes: The serialized .tflite model
+    """
+    import tensorflow as tf
+
+    if quantization not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown quantization '{quantization}', expected one of {QUANTIZATION_MODES}")
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(keras_model)
+    if quantization == 'float16':
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization == 'int8':
+        if calibration_batches is None:
+            raise ValueError("int8 quantization needs calibration images")
+        batches = list(calibration_batches)
+
+        def representative_dataset():
+            for batch in batches:
+                yield [np.asarray(batch, dtype=np.float32)]
+
+        # Integer weights and activations; float input/output keep the
+        # detector's preprocessing unchanged
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+    return converter.convert()
+
+
+def write_metadata(path, keras_model, quantization, source_path):
+    """
+    Write the sidecar JSON the backend uses to pick preprocessing
+
+    Args:
+        path: Path of the .tflite file
+        keras_model: The source Keras model
+        quantization: Quantization mode used
+        source_path: Path of the source Keras model
+    """
+    metadata = {
+        'name': getattr(keras_model, 'name', ''),
+        'layer_names': [layer.name for layer in keras_model.layers[:6]],
+        'quantization': quantization,
+        'source_model': os.path.basename(source_path),
+    }
+    with open(path + '.json', 'w') as f:
+        json.dump(metadata, f, indent=2)
+
+
+class TFLiteModel:
+    """
+    TFLite interpreter wrapped to look like the parts of a Keras model the
+    detector uses (`predict`, `input_shape`, `name`, `layers`)
+
+    The interpreter is not thread-safe, so each thread gets its own
+    instance; all of them share the memory-mapped model file.
+    """
+
+    def __init__(self, model_path, num_threads=None):
+        """
+        Args:
+            model_path: Path to the .tflite file
+            num_threads: Interpreter thread count (None = runtime default)
+        """
+        self.model_path = model_path
+        self.num_threads = num_threads
+        self._interpreter_cls = _interpreter_class()
+        self._local = threading.local()
+
+        metadata = {}
+        if os.path.exists(model_path + '.json'):
+            with open(model_path + '.json') as f:
+                metadata = json.load(f)
+        self.metadata = metadata
+        self.name = metadata.get('name', os.path.basename(model_path))
+        self.layers = [SimpleNamespace(name=n) for n in metadata.get('layer_names', [])]
+
+        interpreter = self._interpreter()
+        details = interpreter.get_input_details()[0]
+        self.input_shape = (None,) + tuple(int(d) for d in details['shape'][1:])
+
+    def _interpreter(self):
+        interpreter = getattr(self._local, 'interpreter', None)
+        if interpreter is None:
+            interpreter = self._interpreter_cls(model_path=self.model_path, num_threads=self.num_threads)
+            interpreter.allocate_tensors()
+            self._local.interpreter = interpreter
+            self._local.batch_size = int(interpreter.get_input_details()[0]['shape'][0])
+        return interpreter
+
+    def reset_after_fork(self):
+        """
+        Drop interpreters inherited from the parent process; their thread
+        pools did not survive the fork. The mmapped model file stays shared.
+        """
+        self._local = threading.local()
+
+    def predict(self, batch, verbose=0):
+        """
+        Run the interpreter on a preprocessed batch
+
+        Args:
+            batch: float32 array of shape (N, H, W, C)
+            verbose: Ignored; accepted for keras.Model.predict compatibility
+
+        Returns:
+            np.array: Class scores of shape (N, num_classes)
+        """
+        interpreter = self._interpreter()
+        input_details = interpreter.get_input_details()[0]
+        output_details = interpreter.get_output_details()[0]
+
+        batch = np.asarray(batch)
+        if self._local.batch_size != len(batch):
+            interpreter.resize_tensor_input(input_details['index'], (len(batch),) + batch.shape[1:])
+            interpreter.allocate_tensors()
+            self._local.batch_size = len(batch)
+            input_details = interpreter.get_input_details()[0]
+            output_details = interpreter.get_output_details()[0]
+
+        # Fully-integer models take quantized input
+        if input_details['dtype'] in (np.int8, np.uint8):
+            scale, zero_point = input_details['quantization']
+            info = np.iinfo(input_details['dtype'])
+            batch = np.clip(np.round(batch / scale + zero_point), info.min, info.max)
+        interpreter.set_tensor(input_details['index'], batch.astype(input_details['dtype']))
+        interpreter.invoke()
+
+        output = interpreter.get_tensor(output_details['index'])
+        if output_details['dtype'] in (np.int8, np.uint8):
+            scale, zero_point = output_details['quantization']
+            output = (output.astype(np.float32) - zero_point) * scale
+        return np.array(output, dtype=np.float32)
+
+
+def measure_variant(model_path, batches, repeats=3):
+    """
+    Load one model variant and time it; meant to run in a fresh process so
+    the RSS numbers are not polluted by other variants
+
+    Args:
+        model_path: .keras/.h5/.tflite file
+        batches: List of preprocessed (1, H, W, C) float32 arrays
+        repeats: Timed runs per batch (the first, untimed run warms up)
+
+    Returns:
+        dict: rss_mb_before/after_load/after_predict, latency_ms list, top1 list
+    """
+    import time
+    from .resources import rss_mb
+
+    rss_before = rss_mb()
+    if model_path.endswith('.tflite'):
+        model = TFLiteModel(model_path)
+    else:
+        from tensorflow import keras
+        model = keras.models.load_model(model_path)
+    rss_loaded = rss_mb()
+
+    latencies, top1 = [], []
+    for batch in batches:
+        scores = model.predict(batch, verbose=0)
+        top1.append(int(np.argmax(scores[0])))
+        for _ in range(repeats):
+            started = time.perf_counter()
+            model.predict(batch, verbose=0)
+            latencies.append((time.perf_counter() - started) * 1000.0)
+
+    return {
+        'rss_mb_before': rss_before,
+        'rss_mb_after_load': rss_loaded,
+        'rss_mb_after_predict': rss_mb(),
+        'latency_ms': latencies,
+        'top1': top1,
+    }
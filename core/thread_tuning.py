@@ -0,0 +1,224 @@
+# thread_tuning.py
+"""
+CPU thread topology for inference
+How many threads TensorFlow uses inside one op (intra-op) and across
+independent ops (inter-op), whether oneDNN kernels are on, how many BLAS
+threads the NumPy engine gets and how many threads decode images. The
+`tune_threads` command measures these on the current machine and writes
+the winner to PREDICT_THREAD_CONFIG; the detector applies it at load time.
+"""
+
+import json
+import os
+import platform
+import sys
+import time
+from contextlib import contextmanager
+
+# Keys of a thread config; missing or None means "runtime default"
+THREAD_CONFIG_KEYS = ('intra_op_threads', 'inter_op_threads', 'onednn', 'decode_workers')
+
+
+def available_cpus():
+    """CPUs this process may run on (honours affinity / cpusets)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def machine_fingerprint():
+    """
+    What a tuned config is only valid for
+
+    Returns:
+        dict: Architecture, CPU count and CPU model name
+    """
+    model_name = ''
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if line.startswith('model name'):
+                    model_name = line.split(':', 1)[1].strip()
+                    break
+    except OSError:
+        pass
+    return {'machine': platform.machine(), 'cpus': available_cpus(), 'cpu_model': model_name}
+
+
+def load_thread_config(path):
+    """
+    Read a config written by `tune_threads`
+
+    Args:
+        path: JSON file
+
+    Returns:
+        dict: The THREAD_CONFIG_KEYS it sets; empty if the file is missing,
+        unreadable or was tuned on a different machine
+    """
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring thread config {path}: {e}")
+        return {}
+    if data.get('machine') != machine_fingerprint():
+        print(f"Ignoring thread config {path}: tuned on {data.get('machine')}, "
+              f"this machine is {machine_fingerprint()}; re-run `manage.py tune_threads`")
+        return {}
+    return {key: data[key] for key in THREAD_CONFIG_KEYS if data.get(key) is not None}
+
+
+def save_thread_config(path, config, **extra):
+    """
+    Write a tuned config, stamped with this machine's fingerprint
+
+    Args:
+        path: JSON file
+        config: dict with THREAD_CONFIG_KEYS
+        **extra: Additional fields to record (model, measurements, ...)
+    """
+    data = {key: config.get(key) for key in THREAD_CONFIG_KEYS}
+    data['machine'] = machine_fingerprint()
+    data['tuned_at'] = time.strftime('%Y-%m-%dT%H:%M:%S%z')
+    data.update(extra)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+
+
+def resolve_thread_config(path, overrides):
+    """
+    Tuned config with explicit settings layered on top
+
+    Args:
+        path: Tuned config file (may not exist)
+        overrides: dict of THREAD_CONFIG_KEYS from settings; None values
+            leave the tuned (or default) value alone
+
+    Returns:
+        dict: The effective config
+    """
+    config = load_thread_config(path)
+    config.update({key: value for key, value in overrides.items() if value is not None})
+    return config
+
+
+def set_onednn(enabled):
+    """
+    Turn TensorFlow's oneDNN kernels on or off. TensorFlow reads this once
+    at import, so it only has an effect before the first import; an
+    explicit TF_ENABLE_ONEDNN_OPTS in the environment wins.
+    """
+    if enabled is None:
+        return
+    if 'tensorflow' in sys.modules:
+        if os.environ.get('TF_ENABLE_ONEDNN_OPTS') != ('1' if enabled else '0'):
+            print('TensorFlow already imported; oneDNN setting takes effect on the next start')
+        return
+    os.environ.setdefault('TF_ENABLE_ONEDNN_OPTS', '1' if enabled else '0')
+
+
+def configure_tensorflow_threads(intra_op_threads=None, inter_op_threads=None):
+    """
+    Size TensorFlow's thread pools. Must run before TensorFlow executes its
+    first op; later calls are ignored with a message (the pools already exist).
+    """
+    import tensorflow as tf
+
+    for setter, getter, value in (
+        (tf.config.threading.set_intra_op_parallelism_threads,
+         tf.config.threading.get_intra_op_parallelism_threads, intra_op_threads),
+        (tf.config.threading.set_inter_op_parallelism_threads,
+         tf.config.threading.get_inter_op_parallelism_threads, inter_op_threads),
+    ):
+        if not value or getter() == value:
+            continue
+        try:
+            setter(int(value))
+        except RuntimeError:
+            print(f"TensorFlow runtime already initialized; keeping {getter() or 'default'} "
+                  f"threads instead of {value}")
+
+
+def limit_blas_threads(threads):
+    """
+    Cap the BLAS pool NumPy matmuls run on. Needs the optional
+    `threadpoolctl` package; without it, set OMP_NUM_THREADS before start.
+
+    Returns:
+        bool: True if the limit was applied
+    """
+    if not threads:
+        return False
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        return False
+    threadpool_limits(limits=int(threads), user_api='blas')
+    return True
+
+
+@contextmanager
+def spawn_environment(config):
+    """
+    Environment for a spawned measurement process: oneDNN and the OpenMP /
+    BLAS thread count are read when the child imports TensorFlow and NumPy,
+    which happens before any code of ours runs there
+    """
+    values = {}
+    if config.get('onednn') is not None:
+        values['TF_ENABLE_ONEDNN_OPTS'] = '1' if config['onednn'] else '0'
+    if config.get('intra_op_threads'):
+        values['OMP_NUM_THREADS'] = str(config['intra_op_threads'])
+    saved = {key: os.environ.get(key) for key in values}
+    os.environ.update(values)
+    try:
+        yield
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+def measure_thread_config(model_path, config, images, batch_sizes, repeats=5):
+    """
+    Load a model with one thread config and time predict_batch() at each
+    batch size; meant to run in a fresh (spawned) process, because thread
+    pools cannot be resized once TensorFlow has started
+
+    Args:
+        model_path: .keras/.h5/.tflite/.npz file
+        config: dict with THREAD_CONFIG_KEYS
+        images: List of encoded image bytes, cycled to fill each batch
+        batch_sizes: Images per predict_batch() call
+        repeats: Timed calls per batch size (after one untimed warmup)
+
+    Returns:
+        dict: {batch_size: list of per-call latencies in ms}
+    """
+    from .ml_model import PlantDiseaseDetector
+
+    detector = PlantDiseaseDetector()
+    detector.thread_config = dict(config)
+    if config.get('decode_workers'):
+        detector.decode_workers = int(config['decode_workers'])
+    if not detector.load_model(model_path):
+        raise RuntimeError(f'Could not load {model_path}')
+
+    latencies = {}
+    for batch_size in batch_sizes:
+        batch = [images[i % len(images)] for i in range(batch_size)]
+        detector.predict_batch(batch, max_batch_size=batch_size)
+        timings = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            detector.predict_batch(batch, max_batch_size=batch_size)
+            timings.append((time.perf_counter() - started) * 1000.0)
+        latencies[batch_size] = timings
+    return latencies
@@ -0,0 +1,275 @@
+# upload_handlers.py
+"""
+Early rejection of uploads that cannot be useful images
+ImageUploadHandler runs first in FILE_UPLOAD_HANDLERS and holds back the
+start of every `image` upload until the image header is readable (the
+first chunk, 64 KB, nearly always suffices; JPEG metadata segments such as
+large EXIF or ICC blocks are skipped by their length fields as they stream
+past). Files whose magic bytes are not an accepted format, whose header
+declares more than PREDICT_UPLOAD_MAX_PIXELS pixels, whose header is not
+found within PREDICT_UPLOAD_MAX_HEADER_MB, or that grow past
+PREDICT_UPLOAD_MAX_MB are skipped: the rest of their body is read off the socket and discarded,
+never written to memory or a temp file, and never decoded. Accepted files
+go on to Django's memory / temporary-file handlers unchanged.
+"""
+
+import io
+import struct
+
+from django.conf import settings
+from django.core.files.uploadedfile import InMemoryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+
+# Archive entries are read in steps of this size until their header is found
+SNIFF_BYTES = 64 * 1024
+# Enough to tell every supported format apart
+MAGIC_BYTES = 16
+
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+_JPEG_STANDALONE_MARKERS = {0x01, 0xD8} | set(range(0xD0, 0xD8))
+
+
+class RejectedUpload(ValueError):
+    """The upload is not an image we accept"""
+
+
+def image_header(head):
+    """
+    Identify an image from its first bytes without decoding it
+
+    Args:
+        head: Leading bytes of the file
+
+    Returns:
+        tuple: (format, size) where format is a PIL format name (None if
+        not recognized) and size is (width, height), or None when the
+        dimensions lie beyond `head`
+
+    Raises:
+        RejectedUpload: If a recognized header is corrupt
+    """
+    if head[:3] == b'\xff\xd8\xff':
+        return 'JPEG', _jpeg_size(head)
+    if head[:8] == b'\x89PNG\r\n\x1a\n':
+        if len(head) < 24:
+            return 'PNG', None
+        if head[12:16] != b'IHDR':
+            raise RejectedUpload('Corrupt PNG header')
+        return 'PNG', struct.unpack('>II', head[16:24])
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'WEBP', _webp_size(head)
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'GIF', struct.unpack('<HH', head[6:10]) if len(head) >= 10 else None
+    if head[:2] == b'BM':
+        return 'BMP', _bmp_size(head)
+    return None, None
+
+
+def _jpeg_size(head):
+    return _jpeg_scan(head, 2)[0]
+
+
+def _jpeg_scan(head, position):
+    """
+    Walk JPEG marker segments from `position` up to the first start-of-frame
+
+    Returns:
+        tuple: ((width, height) or None, offset of the first marker not yet
+        read, which lies beyond `head` while a segment is being skipped)
+    """
+    while True:
+        if position + 4 > len(head):
+            return None, position
+        if head[position] != 0xFF:
+            raise RejectedUpload('Corrupt JPEG header')
+        marker = head[position + 1]
+        if marker == 0xFF:
+            position += 1  # Fill byte
+            continue
+        if marker in _JPEG_STANDALONE_MARKERS:
+            position += 2
+            continue
+        if marker in _JPEG_SOF_MARKERS:
+            if position + 9 > len(head):
+                return None, position
+            height, width = struct.unpack('>HH', head[position + 5:position + 9])
+            return (width, height), position
+        if marker == 0xD9:
+            raise RejectedUpload('Corrupt JPEG header')
+        position += 2 + struct.unpack('>H', head[position + 2:position + 4])[0]
+
+
+def _webp_size(head):
+    if len(head) < 30:
+        return None
+    chunk = head[12:16]
+    if chunk == b'VP8 ':
+        if head[23:26] != b'\x9d\x01\x2a':
+            raise RejectedUpload('Corrupt WebP header')
+        width, height = struct.unpack('<HH', head[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b'VP8L':
+        if head[20] != 0x2F:
+            raise RejectedUpload('Corrupt WebP header')
+        bits = struct.unpack('<I', head[21:25])[0]
+        return 1 + (bits & 0x3FFF), 1 + ((bits >> 14) & 0x3FFF)
+    if chunk == b'VP8X':
+        return 1 + int.from_bytes(head[24:27], 'little'), 1 + int.from_bytes(head[27:30], 'little')
+    raise RejectedUpload('Corrupt WebP header')
+
+
+def _bmp_size(head):
+    if len(head) < 26:
+        return None
+    header_size = struct.unpack('<I', head[14:18])[0]
+    if header_size == 12:
+        return struct.unpack('<HH', head[18:22])
+    width, height = struct.unpack('<ii', head[18:26])
+    return width, abs(height)  # Negative height: rows stored top-down
+
+
+class HeaderSniffer:
+    """
+    Decides from the first bytes of a file, fed in as they arrive, whether
+    an upload is worth receiving
+
+    Only JPEG headers can lie far into a file, behind metadata segments;
+    those are skipped by their length fields as they stream past, so the
+    sniffer keeps a few bytes around the next marker rather than the file.
+    Callers hold the bytes fed so far until a decision, so a file whose
+    header is not found within `max_header_bytes` is rejected.
+    """
+
+    def __init__(self, formats=None, max_pixels=None, max_header_bytes=None):
+        """
+        Args:
+            formats: Accepted PIL format names (default: PREDICT_UPLOAD_FORMATS)
+            max_pixels: Largest width * height (default: PREDICT_UPLOAD_MAX_PIXELS)
+            max_header_bytes: Most bytes fed before the header must be found
+                (default: PREDICT_UPLOAD_MAX_HEADER_MB)
+        """
+        self.formats = formats if formats is not None else settings.PREDICT_UPLOAD_FORMATS
+        self.max_pixels = max_pixels if max_pixels is not None else settings.PREDICT_UPLOAD_MAX_PIXELS
+        if max_header_bytes is None:
+            max_header_bytes = int(settings.PREDICT_UPLOAD_MAX_HEADER_MB * 1024 * 1024)
+        self.max_header_bytes = max_header_bytes
+        self.fed = 0
+        self.head = b''
+        self.position = None  # Next JPEG marker, relative to self.head
+
+    def feed(self, data):
+        """
+        Add the next bytes of the file
+
+        Returns:
+            bool: True if acceptable, False if more bytes are needed to tell
+
+        Raises:
+            RejectedUpload: With the reason, if the file should be dropped
+        """
+        self.head += data
+        self.fed += len(data)
+        if self.position is None:
+            if self.head[:3] == b'\xff\xd8\xff':
+                image_format, size = 'JPEG', None  # Walked incrementally below
+            else:
+                image_format, size = image_header(self.head)
+            if image_format is None:
+                if len(self.head) < MAGIC_BYTES:
+                    return False
+                raise RejectedUpload(f"Unsupported file type; upload a {', '.join(self.formats)} image")
+            if image_format not in self.formats:
+                raise RejectedUpload(
+                    f"{image_format} images are not accepted; upload a {', '.join(self.formats)} image")
+            if image_format != 'JPEG':
+                # Every other format states its size within the first 30 bytes
+                return size is not None and self._check_size(size)
+            self.position = 2
+
+        size, self.position = _jpeg_scan(self.head, self.position)
+        if size is None:
+            # Forget everything before the next marker (or inside the
+            # segment being skipped)
+            consumed = min(self.position, len(self.head))
+            self.head = self.head[consumed:]
+            self.position -= consumed
+            if self.max_header_bytes and self.fed > self.max_header_bytes:
+                raise RejectedUpload(f'No JPEG frame header within the first '
+                                     f'{self.max_header_bytes / (1024 * 1024):g} MB')
+            return False
+        return self._check_size(size)
+
+    def _check_size(self, size):
+        width, height = size
+        if width <= 0 or height <= 0:
+            raise RejectedUpload(f'Invalid image dimensions {width}x{height}')
+        if self.max_pixels and width * height > self.max_pixels:
+            raise RejectedUpload(f'{width}x{height} image exceeds the limit of {self.max_pixels / 1e6:g} megapixels')
+        return True
+
+
+class ImageUploadHandler(FileUploadHandler):
+    """
+    Checks `image` uploads as they stream in (see module docstring); the
+    reasons for skipped files are left in `request.upload_rejections`
+    """
+
+    fields = ('image',)
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.positions = {}
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+        self.checking = field_name in self.fields
+        # Index of this file among the request's files of the same field
+        self.position = self.positions.get(field_name, 0)
+        self.positions[field_name] = self.position + 1
+        self.head = []
+        self.sniffer = HeaderSniffer()
+        self.received = 0
+        self.max_bytes = settings.PREDICT_UPLOAD_MAX_MB * 1024 * 1024
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.checking:
+            return raw_data
+        self.received += len(raw_data)
+        if self.max_bytes and self.received > self.max_bytes:
+            self._reject(f'File larger than {settings.PREDICT_UPLOAD_MAX_MB:g} MB')
+        if self.head is None:
+            return raw_data  # Header already accepted
+
+        self.head.append(raw_data)
+        try:
+            accepted = self.sniffer.feed(raw_data)
+        except RejectedUpload as e:
+            self._reject(str(e))
+        if not accepted:
+            return None  # Held back until the header is readable (see HeaderSniffer)
+        head = b''.join(self.head)
+        self.head = None
+        return head
+
+    def file_complete(self, file_size):
+        if not self.checking or self.head is None:
+            return None
+        # The file ended before its header was readable (a few bytes long):
+        # hand it over as is and let decoding report the problem
+        data = b''.join(self.head)
+        self.head = None
+        return InMemoryUploadedFile(io.BytesIO(data), self.field_name, self.file_name, self.content_type,
+                                    len(data), self.charset, self.content_type_extra)
+
+    def _reject(self, message):
+        self.head = None
+        if self.request is not None:
+            if not hasattr(self.request, 'upload_rejections'):
+                self.request.upload_rejections = []
+            self.request.upload_rejections.append({
+                'field': self.field_name,
+                'position': self.position,
+                'filename': self.file_name,
+                'error': message,
+            })
+        raise SkipFile(message)
@@ -6,5 +6,13 @@ app_name = 'core'
 urlpatterns = [
     path('', views.index, name='index'),
     path('health/', views.health, name='health'),
+    path('api/predict/', views.predict_async_view, name='predict_async'),
+    path('api/predict-batch/', views.predict_batch_view, name='predict_batch'),
+    path('api/jobs/', views.jobs_view, name='jobs'),
+    path('api/jobs/<uuid:job_id>/', views.job_detail_view, name='job_detail'),
+    path('api/jobs/<uuid:job_id>/events/', views.job_events_view, name='job_events'),
+    path('api/stats/', views.inference_stats, name='inference_stats'),
+    path('metrics', views.metrics, name='metrics'),
+    path('api/profile/', views.profiling_view, name='profiling'),
     path('api/initialize-model/', views.initialize_model_view, name='initialize_model'),
 ]
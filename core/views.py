@@ -1,13 +1,28 @@
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.urls import reverse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 from django.core.files.storage import default_storage
+from django.core.handlers.asgi import ASGIRequest
 from django.conf import settings
+from asgiref.sync import sync_to_async
 import os
+import hmac
+import asyncio
 import json
+import uuid
 import logging
-from .ml_model import get_detector, initialize_model
+from .ml_model import ensure_model_loaded, get_detector, initialize_model
+from .model_registry import UnknownModel, get_registry
+from .resolution_tiers import UnknownTier, parse_tiers, select_tier
+from . import profiling
+from .profiling import profile_request
+from .startup import startup_report
+from .stage_timing import render_metrics, stage
+from .async_inference import ExecutorBusy, get_executor
+from .batch_jobs import JobRejected, cancel_job, create_job, describe_job, job_results
+from .models import PredictionJob
 
 logger = logging.getLogger(__name__)
 
@@ -26,6 +41,146 @@ def health(request):
         return JsonResponse({"status": "starting", "model_loaded": False}, status=503)
 
 
+@require_http_methods(["GET"])
+def inference_stats(request):
+    """Report inference scheduler statistics for throughput/latency tuning."""
+    detector = get_detector()
+    batching = detector.batcher.stats() if detector.batcher is not None else None
+    cache = detector.cache.stats() if detector.cache is not None else None
+    near_duplicates = detector.near_duplicates.stats() if detector.near_duplicates is not None else None
+    return JsonResponse({
+        "model_loaded": detector.model is not None,
+        "model_identity": detector.model_identity,
+        "batching": batching,
+        "cache": cache,
+        "near_duplicates": near_duplicates,
+        "threads": dict(detector.thread_config, decode_workers=detector.decode_workers),
+        "models": get_registry().stats(),
+        "cascade": _cascade_stats(),
+        "startup": startup_report.as_list(),
+        "daemon": detector.remote_stats() if detector.is_remote else None,
+        "async_executor": get_executor().stats(),
+    })
+
+
+@require_http_methods(["GET"])
+def metrics(request):
+    """
+    Per-stage and per-view latency histograms in Prometheus text format.
+    Each Gunicorn worker keeps its own; scrape through the load balancer
+    repeatedly or use a single worker for exact numbers.
+    """
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def _cascade_stats():
+    cascade = get_registry().resident('cascade')
+    return cascade.detector.stats() if cascade is not None else None
+
+
+@profile_request
+def _predict_upload(request):
+    """
+    Run the uploaded `image` through the model and build the JSON payload
+    shared by the sync and async prediction views (blocking: decode + inference)
+    """
+    # Parsing the multipart body spools the upload to memory / a temp file
+    with stage('upload'):
+        files = request.FILES
+    if 'image' not in files:
+        rejected = _upload_rejections(request)
+        return {'success': False, 'error': rejected[0]['error'] if rejected else 'No file provided'}
+    
+    uploaded_file = files['image']
+    logger.info(f"Processing image: {uploaded_file.name}")
+    
+    # Debug-only: keep a copy of the upload under a unique name
+    if getattr(settings, 'PREDICT_RETAIN_UPLOADS', False):
+        saved_name = default_storage.save(
+            f"uploads/{uuid.uuid4().hex}_{os.path.basename(uploaded_file.name)}",
+            uploaded_file
+        )
+        logger.info(f"Upload retained at: {saved_name}")
+    
+    # Hold one model version (model + class map) for the whole request;
+    # the default one is loaded now if startup skipped it
+    with get_registry().use(_requested_model(request)) as entry:
+        detector = entry.detector
+        logger.info(f"Detector model loaded: {detector.model is not None}")
+        
+        if detector.model is None:
+            logger.error("ML model not loaded")
+            return {
+                'success': False,
+                'error': 'ML model not loaded. Please initialize the model first.'
+            }
+        
+        # Decode straight from the in-memory upload, no temp file
+        logger.info(f"Starting prediction with model {entry.name} v{entry.version}...")
+        prediction = detector.predict(uploaded_file)
+        logger.info(f"Prediction complete: {prediction}")
+    
+    if 'error' in prediction:
+        return {
+            'success': False,
+            'error': prediction['error']
+        }
+    
+    payload = {
+        'success': True,
+        'predicted_class': prediction['disease'],
+        'confidence': prediction['confidence'] * 100,  # Convert to percentage
+        'message': f"Detected: {prediction['disease']} (Confidence: {prediction['confidence']:.2%})",
+        'model': entry.name,
+        'model_version': entry.version,
+    }
+    if 'cascade' in prediction:
+        payload['cascade'] = prediction['cascade']
+    return payload
+
+
+def _upload_rejections(request):
+    # Files core.upload_handlers dropped while the body streamed in
+    return getattr(request, 'upload_rejections', [])
+
+
+def _json_response(payload, **kwargs):
+    with stage('serialize'):
+        return JsonResponse(payload, **kwargs)
+
+
+def _requested_model(request):
+    """
+    Registry name from the `model` form field or query parameter; without
+    one, the cascade with PREDICT_CASCADE=True when it is registered, else
+    None (the default model).
+    A `tier` field (fast, balanced, accurate) picks that model's resolution
+    variant (see core.resolution_tiers).
+    """
+    requested = request.POST.get('model') or request.GET.get('model')
+    if not requested and getattr(settings, 'PREDICT_CASCADE', False) and 'cascade' in get_registry().names():
+        requested = 'cascade'
+    tier = request.POST.get('tier') or request.GET.get('tier')
+    if not tier:
+        return requested or None
+    registry = get_registry()
+    if not requested:
+        ensure_model_loaded()
+        requested = registry.default_name
+        if requested is None:
+            return None
+    return select_tier(registry, requested, tier, parse_tiers(settings.PREDICT_RESOLUTION_TIERS))
+
+
+def _unknown_model(e):
+    if isinstance(e, UnknownTier):
+        return {'success': False, 'error': str(e)}
+    return {
+        'success': False,
+        'error': f"Unknown model '{e.args[0]}'. Available: {', '.join(get_registry().names())}"
+    }
+
+
 @require_http_methods(["GET", "POST"])
 def index(request):
     """
@@ -34,71 +189,251 @@ def index(request):
     """
     if request.method == 'POST':
         # Handle file upload
-        if 'image' in request.FILES:
-            try:
-                uploaded_file = request.FILES['image']
-                logger.info(f"Processing image: {uploaded_file.name}")
-                
-                # Save uploaded file temporarily
-                temp_path = os.path.join(settings.MEDIA_ROOT, uploaded_file.name)
-                os.makedirs(settings.MEDIA_ROOT, exist_ok=True)
-                
-                with open(temp_path, 'wb+') as destination:
-                    for chunk in uploaded_file.chunks():
-                        destination.write(chunk)
-                
-                logger.info(f"Image saved to: {temp_path}")
-                
-                # Get prediction from ML model
-                detector = get_detector()
-                logger.info(f"Detector model loaded: {detector.model is not None}")
-                
-                if detector.model is None:
-                    logger.error("ML model not loaded")
-                    return JsonResponse({
-                        'success': False,
-                        'error': 'ML model not loaded. Please initialize the model first.'
-                    })
-                
-                logger.info("Starting prediction...")
-                prediction = detector.predict(temp_path)
-                logger.info(f"Prediction complete: {prediction}")
-                
-                # Clean up temp file
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
-                
-                if 'error' in prediction:
-                    return JsonResponse({
-                        'success': False,
-                        'error': prediction['error']
-                    })
-                
-                return JsonResponse({
-                    'success': True,
-                    'predicted_class': prediction['disease'],
-                    'confidence': prediction['confidence'] * 100,  # Convert to percentage
-                    'message': f"Detected: {prediction['disease']} (Confidence: {prediction['confidence']:.2%})"
-                })
-            
-            except Exception as e:
-                logger.error(f"Error processing image: {str(e)}", exc_info=True)
+        try:
+            return _json_response(_predict_upload(request))
+        except UnknownModel as e:
+            return JsonResponse(_unknown_model(e))
+        except Exception as e:
+            logger.error(f"Error processing image: {str(e)}", exc_info=True)
+            return JsonResponse({
+                'success': False,
+                'error': f'Error processing image: {str(e)}'
+            })
+    
+    return render(request, 'index.html')
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+async def predict_async_view(request):
+    """
+    Predict one leaf image without tying up the server while it runs.
+    Meant for the ASGI entry point (`uvicorn PlantLeafDiseasePrediction.asgi:application`):
+    the event loop receives the upload, decode + inference run on the bounded
+    executor (see core.async_inference), and other connections keep being
+    accepted meanwhile. Returns the same JSON as a POST to the index page, or
+    HTTP 503 when PREDICT_ASYNC_MAX_PENDING predictions are already queued.
+    """
+    try:
+        return _json_response(await get_executor().run(_predict_upload, request))
+    except ExecutorBusy as e:
+        logger.warning(f"Rejecting prediction: {str(e)}")
+        response = JsonResponse({'success': False, 'error': 'Server busy, please retry shortly'}, status=503)
+        response['Retry-After'] = '1'
+        return response
+    except UnknownModel as e:
+        return JsonResponse(_unknown_model(e))
+    except Exception as e:
+        logger.error(f"Error processing image: {str(e)}", exc_info=True)
+        return JsonResponse({
+            'success': False,
+            'error': f'Error processing image: {str(e)}'
+        })
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@profile_request
+def predict_batch_view(request):
+    """
+    Predict many leaf images in one request.
+    Expects a multipart body with one or more `image` files and returns
+    per-file results in upload order.
+    """
+    with stage('upload'):
+        uploaded_files = request.FILES.getlist('image')
+    # Dropped by the upload handler; reported in their place in the results
+    rejected = {r['position']: r for r in _upload_rejections(request) if r['field'] == 'image'}
+    if not uploaded_files:
+        error = next(iter(rejected.values()))['error'] if rejected else 'No file provided'
+        return JsonResponse({'success': False, 'error': error})
+
+    try:
+        with get_registry().use(_requested_model(request)) as entry:
+            detector = entry.detector
+            if detector.model is None:
+                logger.error("ML model not loaded")
                 return JsonResponse({
                     'success': False,
-                    'error': f'Error processing image: {str(e)}'
+                    'error': 'ML model not loaded. Please initialize the model first.'
                 })
+            logger.info(f"Processing batch of {len(uploaded_files)} images with model {entry.name} v{entry.version}")
+            predictions = detector.predict_batch(uploaded_files)
+    except UnknownModel as e:
+        return JsonResponse(_unknown_model(e))
+    except Exception as e:
+        logger.error(f"Error processing batch: {str(e)}", exc_info=True)
+        return JsonResponse({
+            'success': False,
+            'error': f'Error processing images: {str(e)}'
+        })
+
+    results = []
+    accepted = iter(zip(uploaded_files, predictions))
+    for position in range(len(uploaded_files) + len(rejected)):
+        if position in rejected:
+            results.append({
+                'filename': rejected[position]['filename'],
+                'success': False,
+                'error': rejected[position]['error']
+            })
+            continue
+        uploaded_file, prediction = next(accepted)
+        if 'error' in prediction:
+            results.append({
+                'filename': uploaded_file.name,
+                'success': False,
+                'error': prediction['error']
+            })
         else:
-            return JsonResponse({'success': False, 'error': 'No file provided'})
-    
-    return render(request, 'index.html')
+            results.append({
+                'filename': uploaded_file.name,
+                'success': True,
+                'predicted_class': prediction['disease'],
+                'confidence': prediction['confidence'] * 100,  # Convert to percentage
+            })
+
+    return _json_response({
+        'success': True,
+        'count': len(results),
+        'results': results,
+        'model': entry.name,
+        'model_version': entry.version,
+    })
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def jobs_view(request):
+    """
+    Queue a batch prediction job and return its id at once (HTTP 202).
+    Expects a multipart body with an `archive` ZIP of images or several
+    `image` files (those the upload handler rejected are left out and
+    listed), plus the usual optional `model` / `tier`. The
+    `run_job_worker` process scores it; poll the returned status_url for
+    progress and results (see core.batch_jobs), or under the ASGI entry
+    point stream events_url.
+    """
+    with stage('upload'):
+        uploaded_files = request.FILES.getlist('archive') or request.FILES.getlist('image')
+    rejected = _upload_rejections(request)
+    try:
+        if not uploaded_files and rejected:
+            raise JobRejected(rejected[0]['error'])
+        model = _requested_model(request)
+        if model is not None and model not in get_registry().names():
+            raise UnknownModel(model)
+        job = create_job(uploaded_files, model or '')
+    except UnknownModel as e:
+        return JsonResponse(_unknown_model(e), status=400)
+    except JobRejected as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    except Exception as e:
+        logger.error(f"Error queueing job: {str(e)}", exc_info=True)
+        return JsonResponse({'success': False, 'error': f'Error queueing job: {str(e)}'}, status=500)
+
+    logger.info(f"Queued job {job.id} with {job.total} images")
+    payload = {
+        'success': True,
+        'job': describe_job(job),
+        'status_url': request.build_absolute_uri(reverse('core:job_detail', args=[job.id])),
+        'rejected': [{'filename': r['filename'], 'error': r['error']} for r in rejected],
+    }
+    if _streams_events(request):
+        payload['events_url'] = request.build_absolute_uri(reverse('core:job_events', args=[job.id]))
+    return _json_response(payload, status=202)
+
+
+def _streams_events(request):
+    # Under WSGI Django drains an async stream before sending it, holding
+    # a worker for the whole job, so events are only offered under ASGI
+    return isinstance(request, ASGIRequest)
+
+
+@csrf_exempt
+@require_http_methods(["GET", "DELETE"])
+def job_detail_view(request, job_id):
+    """
+    GET: job progress and up to `limit` results from index `after` on
+    (page with the returned `next`). DELETE: cancel the job; results
+    written so far are kept.
+    """
+    if request.method == 'DELETE':
+        job = cancel_job(job_id)
+    else:
+        job = PredictionJob.objects.filter(pk=job_id).first()
+    if job is None:
+        return JsonResponse({'success': False, 'error': 'Unknown job'}, status=404)
+    try:
+        after = max(0, int(request.GET.get('after', 0)))
+        limit = min(max(1, int(request.GET.get('limit', 500))), 1000)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'after and limit must be integers'}, status=400)
+
+    results = job_results(job, after, limit) if request.method == 'GET' else []
+    return _json_response({
+        'success': True,
+        'job': describe_job(job),
+        'results': results,
+        'next': results[-1]['index'] + 1 if results else after,
+    })
+
+
+@require_http_methods(["GET"])
+async def job_events_view(request, job_id):
+    """
+    Server-sent events for one job: `results` events carry each newly
+    committed batch, `progress` events the job status whenever it changes;
+    the stream ends once the job is finished and every result was sent.
+    Each `results` event's id is the next result index, so a reconnecting
+    client resumes via Last-Event-ID (or `after`). Only served under the
+    ASGI entry point, where a waiting stream holds no thread; under the
+    WSGI server it returns 404 and clients poll /api/jobs/<id>/.
+    """
+    if not _streams_events(request):
+        return JsonResponse({
+            'success': False,
+            'error': 'Event streams need the ASGI server; poll the job status URL instead'
+        }, status=404)
+    if not await PredictionJob.objects.filter(pk=job_id).aexists():
+        return JsonResponse({'success': False, 'error': 'Unknown job'}, status=404)
+    try:
+        after = max(0, int(request.headers.get('Last-Event-ID') or request.GET.get('after', 0)))
+    except ValueError:
+        after = 0
+    response = StreamingHttpResponse(_job_events(job_id, after), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+async def _job_events(job_id, after, limit=500, interval=1.0):
+    last = None
+    while True:
+        job = await PredictionJob.objects.aget(pk=job_id)
+        results = await sync_to_async(job_results)(job, after, limit)
+        if results:
+            after = results[-1]['index'] + 1
+            yield f"id: {after}\nevent: results\ndata: {json.dumps(results)}\n\n"
+        progress = describe_job(job)
+        if progress != last:
+            last = progress
+            yield f"event: progress\ndata: {json.dumps(progress)}\n\n"
+        if job.status in PredictionJob.FINISHED and len(results) < limit:
+            return
+        if len(results) < limit:
+            await asyncio.sleep(interval)
 
 
 @csrf_exempt
 @require_http_methods(["POST"])
 def initialize_model_view(request):
     """
-    Initialize the ML model with provided paths
-    Expects JSON data with model_path and class_indices_path
+    Load a model into the registry and swap it in atomically
+    Expects JSON data with model_path and optionally class_indices_path,
+    name (registry entry to replace; defaults to the default model) and
+    wait (false returns 202 right away while the model loads in the
+    background). Requests keep using the previous version until the swap.
     """
     try:
         data = json.loads(request.body)
@@ -111,31 +446,52 @@ def initialize_model_view(request):
                 'message': 'model_path is required'
             })
         
-        detector = get_detector()
-        
-        # Load model
-        if os.path.exists(model_path):
-            detector.load_model(model_path)
-        else:
+        if not os.path.exists(model_path):
             return JsonResponse({
                 'status': 'error',
                 'message': f'Model file not found: {model_path}'
             })
+        if class_indices_path and not os.path.exists(class_indices_path):
+            class_indices_path = None
         
-        # Load class indices if provided
-        if class_indices_path and os.path.exists(class_indices_path):
-            detector.load_class_indices(class_indices_path)
-        
-        if detector.model is not None:
+        detector = get_detector()
+        if detector.is_remote:
+            # The inference daemon owns the model and swaps it itself
+            detector.load_model(model_path)
+            if class_indices_path:
+                detector.load_class_indices(class_indices_path)
+            if detector.model is not None:
+                return JsonResponse({
+                    'status': 'success',
+                    'message': 'Model initialized successfully'
+                })
             return JsonResponse({
-                'status': 'success',
-                'message': 'Model initialized successfully'
+                'status': 'error',
+                'message': 'Failed to load model'
             })
-        else:
+        
+        registry = get_registry()
+        name = data.get('name') or registry.default_name or 'default'
+        future = registry.load(name, model_path, class_indices_path)
+        if not data.get('wait', True):
+            return JsonResponse({
+                'status': 'loading',
+                'message': f'Loading {model_path} as {name} in the background',
+                'name': name
+            }, status=202)
+        
+        try:
+            entry = future.result()
+        except Exception as e:
             return JsonResponse({
                 'status': 'error',
-                'message': 'Failed to load model'
+                'message': f'Failed to load model: {str(e)}'
             })
+        return JsonResponse({
+            'status': 'success',
+            'message': 'Model initialized successfully',
+            'model': entry.describe()
+        })
     
     except json.JSONDecodeError:
         return JsonResponse({
@@ -147,3 +503,42 @@ def initialize_model_view(request):
             'status': 'error',
             'message': f'Error: {str(e)}'
         })
+
+
+def _profiling_allowed(request):
+    # Staff (admin session) or `Authorization: Bearer <PROFILING_TOKEN>`
+    if getattr(request, 'user', None) is not None and request.user.is_staff:
+        return True
+    token = getattr(settings, 'PROFILING_TOKEN', '')
+    header = request.headers.get('Authorization', '')
+    return bool(token) and hmac.compare_digest(header, f'Bearer {token}')
+
+
+@csrf_exempt
+@require_http_methods(["GET", "POST", "DELETE"])
+def profiling_view(request):
+    """
+    Admin-only switch for profiling live predictions in this process
+    POST {"requests": N, "tensorflow": false} profiles the next N
+    prediction requests (see core.profiling), GET reports progress and
+    DELETE stops early. Artifacts go to PROFILING_DIR.
+    """
+    if not _profiling_allowed(request):
+        return JsonResponse({'status': 'error', 'message': 'Forbidden'}, status=403)
+
+    if request.method == 'GET':
+        return JsonResponse(profiling.status())
+    if request.method == 'DELETE':
+        return JsonResponse({'status': 'stopped', 'session': profiling.disarm()})
+
+    try:
+        data = json.loads(request.body or b'{}')
+        requests = int(data.get('requests', 10))
+    except (json.JSONDecodeError, TypeError, ValueError):
+        return JsonResponse({'status': 'error', 'message': 'Expected JSON with an integer "requests"'})
+    limit = getattr(settings, 'PROFILING_MAX_REQUESTS', 100)
+    if not 1 <= requests <= limit:
+        return JsonResponse({'status': 'error', 'message': f'requests must be between 1 and {limit}'})
+    session = profiling.arm(settings.PROFILING_DIR, requests, tensorflow=bool(data.get('tensorflow', False)))
+    logger.info(f"Profiling the next {requests} prediction requests into {session.directory}")
+    return JsonResponse({'status': 'armed', 'session': session.status()})
@@ -0,0 +1,86 @@
+# gunicorn.conf.py
+"""
+Gunicorn configuration for Plant Disease Prediction
+
+Preload mode (GUNICORN_PRELOAD=True, the default): the master imports Django
+and loads the model once, then forks the workers. Weights in a fork-safe
+layout (NumPy-engine .npz, memory-mapped; TFLite flatbuffers, memory-mapped
+by the interpreter) are shared by every worker, so adding workers does not
+add model copies. TensorFlow's runtime does not survive fork(), so Keras
+models are still loaded by each worker; export a .npz or .tflite variant and
+set INFERENCE_BACKEND to share it.
+
+Every worker rebuilds its own runtime state after the fork: batching thread,
+cache locks, TFLite interpreters and database connections.
+
+An explicit PRELOAD_MODEL wins: 'False' leaves the model to the first
+request in each worker, 'True' also loads Keras models in the master.
+
+Usage: gunicorn PlantLeafDiseasePrediction.wsgi:application -c gunicorn.conf.py
+Measure: python scripts/measure_worker_memory.py
+"""
+
+import gc
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', '1'))
+threads = int(os.environ.get('GUNICORN_THREADS', '1'))
+# Very extended timeout to allow initial TensorFlow loading in the workers
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '3600'))
+graceful_timeout = 120
+keepalive = 75
+accesslog = '-'
+errorlog = '-'
+loglevel = 'info'
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'True') == 'True'
+# The operator's setting, before the default below fills it in
+_preload_model = os.environ.get('PRELOAD_MODEL', 'auto')
+
+if preload_app:
+    # By default CoreConfig.ready must not load a Keras model into the
+    # master; the when_ready hook below preloads only the fork-safe formats
+    os.environ.setdefault('PRELOAD_MODEL', 'False')
+
+
+def when_ready(server):
+    """Master, after the app is imported and before any worker is forked"""
+    if not preload_app:
+        return
+    from django.apps import apps
+    from django.db import connections
+    from core.ml_model import NON_KERAS_FORMATS
+    from core.startup import startup_report
+
+    if _preload_model != 'False':
+        apps.get_app_config('core').preload_model(formats=NON_KERAS_FORMATS)
+        server.log.info("Startup phases:\n%s", startup_report.format())
+
+    # Never hand the master's database connections to the children
+    connections.close_all()
+    # Move everything allocated so far out of the collector's reach, so the
+    # cyclic GC in the workers never writes to (and un-shares) those pages
+    gc.collect()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    """Worker, right after fork(): fresh threads, locks and handles"""
+    if not preload_app:
+        return
+    from core import stage_timing
+    from core.model_registry import get_registry
+
+    get_registry().reset_after_fork()
+    stage_timing.reset_after_fork()
+
+
+def post_worker_init(worker):
+    """Worker, before it accepts requests: load whatever the master did not"""
+    if _preload_model == 'False':
+        return  # Loaded by the first request
+    from core.ml_model import ensure_model_loaded
+
+    detector = ensure_model_loaded()
+    worker.log.info(f"Worker {worker.pid} serving {detector.model_path}")
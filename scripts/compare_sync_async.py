@@ -0,0 +1,203 @@
+"""
+Compare concurrent-client throughput: sync Gunicorn vs the ASGI app under Uvicorn.
+
+Both servers get the same number of worker processes and the same clients:
+C concurrent connections, each repeatedly uploading a sample image from
+media/, optionally trickled at --upload-kbps to mimic slow mobile links.
+Both run the same view, so only the server model differs:
+
+    sync  gunicorn -c gunicorn.conf.py ... wsgi   -> POST /api/predict/ (Django runs it in the worker thread)
+    asgi  uvicorn ... asgi                        -> POST /api/predict/ (on the event loop + executor)
+
+While the load runs, a probe polls /health/ to show whether the server can
+still answer anything at all. A sync worker is pinned for the whole upload,
+so slow uploads starve it; the async view only holds an executor thread
+while decode + inference actually run.
+
+Usage:
+    python scripts/compare_sync_async.py --clients 1 8 32 --upload-kbps 1024 --image phone_photo.jpg
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import uuid
+
+from measure_worker_memory import BASE_DIR, sample_image, wait_healthy
+
+UPLOAD_CHUNK = 8192
+
+SERVERS = {
+    'sync': {
+        'command': [sys.executable, '-m', 'gunicorn', 'PlantLeafDiseasePrediction.wsgi:application',
+                    '-c', os.path.join(BASE_DIR, 'gunicorn.conf.py')],
+        'path': '/api/predict/',
+    },
+    'asgi': {
+        'command': [sys.executable, '-m', 'uvicorn', 'PlantLeafDiseasePrediction.asgi:application',
+                    '--host', '127.0.0.1', '--log-level', 'warning'],
+        'path': '/api/predict/',
+    },
+}
+
+
+def _multipart(name, data):
+    boundary = uuid.uuid4().hex
+    body = (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="{name}"\r\n'
+        f'Content-Type: application/octet-stream\r\n\r\n'
+    ).encode() + data + f'\r\n--{boundary}--\r\n'.encode()
+    return f'multipart/form-data; boundary={boundary}', body
+
+
+async def _http(port, method, path, body=b'', content_type=None, upload_bps=None):
+    """Minimal HTTP/1.1 exchange; returns (status, seconds)"""
+    started = time.perf_counter()
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        head = f'{method} {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n'
+        if body:
+            head += f'Content-Type: {content_type}\r\nContent-Length: {len(body)}\r\n'
+        writer.write((head + '\r\n').encode())
+        for start in range(0, len(body), UPLOAD_CHUNK):
+            writer.write(body[start:start + UPLOAD_CHUNK])
+            await writer.drain()
+            if upload_bps:
+                await asyncio.sleep(UPLOAD_CHUNK / upload_bps)
+        await writer.drain()
+        status_line = await reader.readline()
+        await reader.read()
+        status = int(status_line.split()[1]) if status_line else 0
+    finally:
+        writer.close()
+    return status, time.perf_counter() - started
+
+
+async def _load(port, path, clients, duration, upload_bps, name, data):
+    content_type, body = _multipart(name, data)
+    latencies, statuses = [], []
+    probe_latencies = []
+    deadline = time.perf_counter() + duration
+
+    async def client():
+        while time.perf_counter() < deadline:
+            try:
+                status, seconds = await _http(port, 'POST', path, body, content_type, upload_bps)
+            except OSError:
+                status, seconds = 0, 0.0
+            statuses.append(status)
+            if status == 200:
+                latencies.append(seconds)
+
+    async def probe():
+        while time.perf_counter() < deadline:
+            try:
+                _, seconds = await asyncio.wait_for(_http(port, 'GET', '/health/'), timeout=30)
+            except (OSError, asyncio.TimeoutError):
+                seconds = 30.0
+            probe_latencies.append(seconds)
+            await asyncio.sleep(0.2)
+
+    started = time.perf_counter()
+    await asyncio.gather(probe(), *(client() for _ in range(clients)))
+    elapsed = time.perf_counter() - started
+    return latencies, statuses, probe_latencies, elapsed
+
+
+def _percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+
+def run_server(kind, workers, port, client_counts, duration, upload_bps, startup_timeout, image):
+    """Start one server, run every client count against it, stop it"""
+    spec = SERVERS[kind]
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), PORT=str(port),
+               DEBUG=os.environ.get('DEBUG', 'True'))
+    command = list(spec['command'])
+    if kind == 'asgi':
+        command += ['--port', str(port), '--workers', str(workers)]
+    name, data = image
+    results = []
+    with open(os.devnull, 'w') as log:
+        process = subprocess.Popen(command, cwd=BASE_DIR, env=env, stdout=log, stderr=log)
+        try:
+            wait_healthy(f'http://127.0.0.1:{port}/health/', process, startup_timeout)
+            # One untimed request per worker so no run pays for warmup
+            asyncio.run(_load(port, spec['path'], workers, 1.0, None, name, data))
+            for clients in client_counts:
+                latencies, statuses, probes, elapsed = asyncio.run(
+                    _load(port, spec['path'], clients, duration, upload_bps, name, data)
+                )
+                ok = sum(1 for s in statuses if s == 200)
+                results.append({
+                    'server': kind,
+                    'workers': workers,
+                    'clients': clients,
+                    'requests_ok': ok,
+                    'rejected_503': sum(1 for s in statuses if s == 503),
+                    'errors': sum(1 for s in statuses if s not in (200, 503)),
+                    'throughput_rps': ok / elapsed,
+                    'latency_p50_ms': (_percentile(latencies, 50) or 0.0) * 1000.0,
+                    'latency_p95_ms': (_percentile(latencies, 95) or 0.0) * 1000.0,
+                    'health_p95_ms': (_percentile(probes, 95) or 0.0) * 1000.0,
+                })
+        finally:
+            process.send_signal(signal.SIGTERM)
+            try:
+                process.wait(timeout=60)
+            except subprocess.TimeoutExpired:
+                process.kill()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--servers', nargs='+', choices=sorted(SERVERS), default=['sync', 'asgi'])
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes for both servers')
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--duration', type=float, default=15.0, help='Seconds per client count')
+    parser.add_argument('--upload-kbps', type=float, default=0.0,
+                        help='Throttle each upload to this many KB/s (0 = as fast as possible)')
+    parser.add_argument('--image', help='Image to upload (default: first one in media/). Uploads larger '
+                                        'than the socket buffers are what pin a sync worker')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--startup-timeout', type=float, default=600.0)
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    args = parser.parse_args()
+
+    upload_bps = args.upload_kbps * 1024.0 if args.upload_kbps else None
+    if args.image:
+        with open(args.image, 'rb') as f:
+            image = (os.path.basename(args.image), f.read())
+    else:
+        image = sample_image()
+    results = []
+    for kind in args.servers:
+        results.extend(run_server(kind, args.workers, args.port, args.clients, args.duration,
+                                  upload_bps, args.startup_timeout, image))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"workers={args.workers} image={len(image[1]) / 1024:.0f} KB "
+          f"upload={'%g KB/s' % args.upload_kbps if upload_bps else 'unthrottled'} "
+          f"duration={args.duration:g}s per row")
+    print(f"{'server':<7}{'clients':>8}{'ok':>7}{'503':>6}{'err':>6}{'req/s':>9}"
+          f"{'p50 ms':>10}{'p95 ms':>10}{'health p95':>12}")
+    for r in results:
+        print(f"{r['server']:<7}{r['clients']:>8}{r['requests_ok']:>7}{r['rejected_503']:>6}{r['errors']:>6}"
+              f"{r['throughput_rps']:>9.1f}{r['latency_p50_ms']:>10.1f}{r['latency_p95_ms']:>10.1f}"
+              f"{r['health_p95_ms']:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
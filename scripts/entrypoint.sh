@@ -3,7 +3,9 @@ set -e
 
 # Render deployment entrypoint
 export TF_CPP_MIN_LOG_LEVEL=3
-export OMP_NUM_THREADS=1
+# BLAS/OpenMP pools; TensorFlow's own pools come from PREDICT_INTRA_OP_THREADS /
+# PREDICT_INTER_OP_THREADS or the `tune_threads` config (models/thread_config.json)
+export OMP_NUM_THREADS=${OMP_NUM_THREADS:-1}
 export TF_FORCE_GPU_ALLOW_GROWTH=true
 export PYTHONUNBUFFERED=1
 
@@ -21,16 +23,16 @@ python manage.py collectstatic --noinput
 echo "Pre-warming ML model (this may take 1-2 minutes)..."
 python manage.py warmup_model || echo "Model warm-up skipped or failed, will load on first request"
 
+# Batch job worker (/api/jobs/) next to the web server: it shares the SQLite
+# database and PREDICT_JOBS_DIR, and loads its own copy of the model
+if [ "${JOB_WORKER:-False}" = "True" ]; then
+    echo "Starting batch job worker..."
+    python manage.py run_job_worker &
+fi
+
 echo "Starting Gunicorn server..."
 
-# Start Gunicorn with very extended timeout to allow initial TensorFlow loading
-gunicorn PlantLeafDiseasePrediction.wsgi:application \
-  --bind 0.0.0.0:$PORT \
-  --workers=1 \
-  --threads=1 \
-  --timeout=3600 \
-  --graceful-timeout=120 \
-  --keep-alive=75 \
-  --access-logfile - \
-  --error-logfile - \
-  --log-level info
+# Workers, threads, timeouts and model preloading live in gunicorn.conf.py
+# (WEB_CONCURRENCY sets the worker count; the model is shared between them
+# when INFERENCE_BACKEND is numpy or tflite)
+gunicorn PlantLeafDiseasePrediction.wsgi:application --config gunicorn.conf.py
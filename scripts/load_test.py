@@ -0,0 +1,338 @@
+"""
+Load-test the prediction endpoint on a local Gunicorn, fully offline.
+
+Starts the app the way scripts/entrypoint.sh does (gunicorn.conf.py), replays
+a mix of images from media/ and reports throughput, latency percentiles,
+errors, timeouts and the server's RSS over time. Each --config runs in turn
+against a fresh server, so worker / thread / backend settings can be compared
+side by side:
+
+    python scripts/load_test.py --concurrency 4 --duration 30 \\
+        --config w1:WEB_CONCURRENCY=1 --config w2t2:WEB_CONCURRENCY=2,GUNICORN_THREADS=2 \\
+        --config numpy:INFERENCE_BACKEND=numpy,WEB_CONCURRENCY=2
+
+Closed loop (--concurrency C): C clients each send the next request as soon as
+the previous one returns. Open loop (--rate R): requests arrive as a Poisson
+process at R per second whether or not earlier ones finished, which shows
+queueing once R exceeds what the server can do. The default target is the
+index page POST (with its CSRF token); --path /api/predict-batch/ tests the API.
+
+--mix re-encodes every image at the given long edges with weights, e.g.
+"native:3,1600:1,4000:1" sends mostly the original files plus some phone-sized
+photos. The prediction caches are turned off unless --keep-cache. --url skips
+starting a server and tests a running one (no RSS then).
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import time
+import uuid
+
+from measure_worker_memory import BASE_DIR, IMAGE_EXTENSIONS, wait_healthy
+
+from core.resources import child_pids, pss_mb, rss_mb  # noqa: E402
+
+
+def load_images(directory, limit, mix):
+    """
+    Images to replay: (name, bytes, variant) triples and their weights
+
+    Args:
+        directory: Source images
+        limit: Most source images (0 = all)
+        mix: "variant:weight,..." where variant is 'native' or a long edge in px
+    """
+    files = sorted(name for name in os.listdir(directory) if name.lower().endswith(IMAGE_EXTENSIONS))
+    if limit:
+        files = files[:limit]
+    if not files:
+        raise SystemExit(f'No images found in {directory}')
+    images, weights = [], []
+    for item in mix.split(','):
+        variant, _, weight = item.strip().partition(':')
+        weight = float(weight or 1)
+        for name in files:
+            with open(os.path.join(directory, name), 'rb') as f:
+                data = f.read()
+            if variant != 'native':
+                data = _reencode(data, int(variant))
+            images.append((name, data, variant))
+            weights.append(weight / len(files))
+    return images, weights
+
+
+def _reencode(data, long_edge):
+    from PIL import Image
+    image = Image.open(io.BytesIO(data)).convert('RGB')
+    scale = long_edge / max(image.size)
+    image = image.resize((round(image.width * scale), round(image.height * scale)), Image.BICUBIC)
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=92)
+    return buffer.getvalue()
+
+
+async def _request(host, port, method, path, body=b'', headers=None, timeout=60.0):
+    """Minimal HTTP/1.1 exchange; returns (status, response headers, body)"""
+    async def exchange():
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            head = f'{method} {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n'
+            for key, value in (headers or {}).items():
+                head += f'{key}: {value}\r\n'
+            if body:
+                head += f'Content-Length: {len(body)}\r\n'
+            writer.write((head + '\r\n').encode() + body)
+            await writer.drain()
+            raw = await reader.read()
+        finally:
+            writer.close()
+        head, _, content = raw.partition(b'\r\n\r\n')
+        lines = head.decode('latin-1').split('\r\n')
+        status = int(lines[0].split()[1]) if lines and lines[0] else 0
+        response_headers = [tuple(part.strip() for part in line.split(':', 1)) for line in lines[1:] if ':' in line]
+        return status, response_headers, content
+    return await asyncio.wait_for(exchange(), timeout)
+
+
+async def csrf_headers(host, port, path):
+    """Cookie + X-CSRFToken for the index form POST; empty for the csrf-exempt API"""
+    if path.startswith('/api/'):
+        return {}
+    _, headers, _ = await _request(host, port, 'GET', path)
+    for key, value in headers:
+        if key.lower() == 'set-cookie' and value.startswith('csrftoken='):
+            token = value.split(';', 1)[0].split('=', 1)[1]
+            return {'Cookie': f'csrftoken={token}', 'X-CSRFToken': token, 'Referer': f'http://{host}:{port}/'}
+    raise SystemExit(f'No CSRF cookie from GET {path}')
+
+
+def _multipart(name, data):
+    boundary = uuid.uuid4().hex
+    body = (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="{name}"\r\n'
+        f'Content-Type: application/octet-stream\r\n\r\n'
+    ).encode() + data + f'\r\n--{boundary}--\r\n'.encode()
+    return f'multipart/form-data; boundary={boundary}', body
+
+
+async def run_load(host, port, path, images, weights, concurrency, rate, duration, timeout, seed):
+    """
+    Replay images for `duration` seconds
+
+    Returns:
+        dict: Per-request records and the elapsed time
+    """
+    base_headers = await csrf_headers(host, port, path)
+    bodies = [_multipart(name, data) for name, data, _ in images]
+    rng = random.Random(seed)
+    records = []
+    started = time.perf_counter()
+    deadline = started + duration
+
+    async def one():
+        index = rng.choices(range(len(images)), weights)[0]
+        content_type, body = bodies[index]
+        sent = time.perf_counter()
+        outcome = 'ok'
+        try:
+            status, _, content = await _request(host, port, 'POST', path, body,
+                                                dict(base_headers, **{'Content-Type': content_type}), timeout)
+            if status != 200:
+                outcome = f'http_{status}'
+            elif not json.loads(content or b'{}').get('success', False):
+                outcome = 'app_error'
+        except asyncio.TimeoutError:
+            outcome = 'timeout'
+        except (OSError, ValueError):
+            outcome = 'connection_error'
+        records.append({'sent': sent - started, 'latency': time.perf_counter() - sent,
+                        'outcome': outcome, 'variant': images[index][2]})
+
+    if rate:
+        # Open loop: Poisson arrivals, independent of how fast responses come back
+        tasks = []
+        next_at = started
+        while True:
+            next_at += rng.expovariate(rate)
+            if next_at >= deadline:
+                break
+            await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+            tasks.append(asyncio.ensure_future(one()))
+        await asyncio.gather(*tasks)
+    else:
+        async def client():
+            while time.perf_counter() < deadline:
+                await one()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+    return {'records': records, 'elapsed': time.perf_counter() - started}
+
+
+def _percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+
+def summarize(name, records, elapsed, rss_samples):
+    ok = [r['latency'] for r in records if r['outcome'] == 'ok']
+    outcomes = {}
+    for r in records:
+        outcomes[r['outcome']] = outcomes.get(r['outcome'], 0) + 1
+    return {
+        'config': name,
+        'requests': len(records),
+        'ok': len(ok),
+        'timeouts': outcomes.get('timeout', 0),
+        'errors': len(records) - len(ok) - outcomes.get('timeout', 0),
+        'outcomes': outcomes,
+        'throughput_rps': len(ok) / elapsed if elapsed else 0.0,
+        'latency_ms': {f'p{p}': (_percentile(ok, p) or 0.0) * 1000.0 for p in (50, 90, 95, 99, 100)},
+        'peak_rss_mb': max((s['rss_mb'] for s in rss_samples), default=None),
+        'rss_timeline': rss_samples,
+    }
+
+
+async def sample_rss(pid, stop, interval, started):
+    """RSS / PSS of the Gunicorn master plus its workers, every `interval` s"""
+    samples = []
+    while not stop.is_set():
+        pids = [pid] + child_pids(pid)
+        samples.append({
+            't': round(time.perf_counter() - started, 1),
+            'processes': len(pids),
+            'rss_mb': round(sum(rss_mb(p) or 0.0 for p in pids), 1),
+            'pss_mb': round(sum(pss_mb(p) or 0.0 for p in pids), 1),
+        })
+        try:
+            await asyncio.wait_for(stop.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+    return samples
+
+
+async def measure(process, args, images, weights):
+    host, port = args.host, args.port
+    # Warm every worker before timing (model load, first-call tracing)
+    await run_load(host, port, args.path, images, weights, max(2, args.concurrency), None, args.warmup,
+                   args.timeout, args.seed)
+    stop = asyncio.Event()
+    started = time.perf_counter()
+    sampler = asyncio.ensure_future(sample_rss(process.pid, stop, args.rss_interval, started)) if process else None
+    result = await run_load(host, port, args.path, images, weights, args.concurrency, args.rate, args.duration,
+                            args.timeout, args.seed)
+    stop.set()
+    samples = await sampler if sampler else []
+    return result, samples
+
+
+def run_config(name, overrides, args, images, weights):
+    """Start a server with `overrides` in its environment, load it, stop it"""
+    if args.url:
+        result, samples = asyncio.run(measure(None, args, images, weights))
+        return summarize(name, result['records'], result['elapsed'], samples)
+
+    env = dict(os.environ, PORT=str(args.port), DEBUG=os.environ.get('DEBUG', 'True'), TF_CPP_MIN_LOG_LEVEL='3')
+    if not args.keep_cache:
+        # A handful of images replayed thousands of times would all be cache hits
+        env.update(PREDICT_CACHE='False', PREDICT_NEAR_DUPLICATE='False')
+    env.update(overrides)
+    log = open(args.server_log, 'a') if args.server_log else open(os.devnull, 'w')
+    with log:
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', 'PlantLeafDiseasePrediction.wsgi:application',
+             '--config', os.path.join(BASE_DIR, 'gunicorn.conf.py')],
+            cwd=BASE_DIR, env=env, stdout=log, stderr=log,
+        )
+        try:
+            wait_healthy(f'http://{args.host}:{args.port}/health/', process, args.startup_timeout)
+            result, samples = asyncio.run(measure(process, args, images, weights))
+        finally:
+            process.send_signal(signal.SIGTERM)
+            try:
+                process.wait(timeout=60)
+            except subprocess.TimeoutExpired:
+                process.kill()
+    return summarize(name, result['records'], result['elapsed'], samples)
+
+
+def _parse_config(spec):
+    name, _, assignments = spec.partition(':')
+    overrides = {}
+    for item in assignments.split(','):
+        if item.strip():
+            key, _, value = item.partition('=')
+            overrides[key.strip()] = value.strip()
+    return name, overrides
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--config', action='append', dest='configs', default=[],
+                        help='NAME:KEY=VALUE,... environment for one server run (repeatable; '
+                             'default: one run with the current environment)')
+    parser.add_argument('--path', default='/', help='Endpoint to POST images to (default: the index page)')
+    parser.add_argument('--image-dir', default=os.path.join(BASE_DIR, 'media'))
+    parser.add_argument('--images', type=int, default=0, help='Most source images (0 = all)')
+    parser.add_argument('--mix', default='native', help='variant:weight list, variant = native or long edge px')
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument('--concurrency', type=int, default=4, help='Closed loop: concurrent clients')
+    load.add_argument('--rate', type=float, help='Open loop: Poisson arrivals per second')
+    parser.add_argument('--duration', type=float, default=30.0, help='Seconds of measured load per config')
+    parser.add_argument('--warmup', type=float, default=5.0, help='Seconds of untimed load first')
+    parser.add_argument('--timeout', type=float, default=60.0, help='Seconds before a request counts as timed out')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the image choice and arrivals')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8767)
+    parser.add_argument('--url', action='store_true',
+                        help='Test the server already running at --host/--port instead of starting one')
+    parser.add_argument('--keep-cache', action='store_true',
+                        help='Leave the prediction caches on (off by default: replayed images would all hit)')
+    parser.add_argument('--rss-interval', type=float, default=1.0)
+    parser.add_argument('--startup-timeout', type=float, default=600.0)
+    parser.add_argument('--server-log', help='Append the servers\' output to this file')
+    parser.add_argument('--output', help='Write the full results (with RSS timelines) to this JSON file')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    args = parser.parse_args()
+    if args.rate:
+        args.concurrency = 0
+
+    images, weights = load_images(args.image_dir, args.images, args.mix)
+    configs = [_parse_config(spec) for spec in args.configs] or [('current', {})]
+    results = [run_config(name, overrides, args, images, weights) for name, overrides in configs]
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    load_desc = f'open loop {args.rate:g} req/s' if args.rate else f'{args.concurrency} concurrent clients'
+    print(f"POST {args.path}, {len(images)} images (mix {args.mix}), {load_desc}, {args.duration:g}s per config")
+    print(f"{'config':<14}{'ok':>7}{'err':>6}{'t/o':>6}{'req/s':>8}{'p50':>8}{'p90':>8}{'p95':>8}{'p99':>8}"
+          f"{'max':>8}{'peak RSS':>10}")
+    for r in results:
+        ms = r['latency_ms']
+        peak = f"{r['peak_rss_mb']:.0f}" if r['peak_rss_mb'] is not None else '-'
+        print(f"{r['config']:<14}{r['ok']:>7}{r['errors']:>6}{r['timeouts']:>6}{r['throughput_rps']:>8.1f}"
+              f"{ms['p50']:>8.0f}{ms['p90']:>8.0f}{ms['p95']:>8.0f}{ms['p99']:>8.0f}{ms['p100']:>8.0f}{peak:>10}")
+    for r in results:
+        if r['rss_timeline']:
+            step = max(1, len(r['rss_timeline']) // 10)
+            timeline = ', '.join(f"{s['t']:g}s {s['rss_mb']:.0f}" for s in r['rss_timeline'][::step])
+            print(f"{r['config']} RSS MB over time: {timeline}")
+        errors = {k: v for k, v in r['outcomes'].items() if k != 'ok'}
+        if errors:
+            print(f"{r['config']} failures: {errors}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""
+Measure Gunicorn memory as workers are added.
+
+Starts Gunicorn with gunicorn.conf.py for 1..N workers, waits until the model
+is loaded, sends a few predictions so every worker has touched the weights,
+then reads RSS and PSS (Linux /proc/<pid>/smaps_rollup) for the master and
+each worker. RSS counts shared pages in full for every process; PSS splits
+them, so the total PSS column is what the server really costs. With the
+model shared copy-on-write, total PSS grows by a worker's private memory only.
+
+Usage:
+    python scripts/measure_worker_memory.py --max-workers 4
+    INFERENCE_BACKEND=numpy python scripts/measure_worker_memory.py --compare-preload
+"""
+
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from core.resources import child_pids, pss_mb, rss_mb  # noqa: E402
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def sample_image():
+    media_dir = os.path.join(BASE_DIR, 'media')
+    for name in sorted(os.listdir(media_dir)):
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            with open(os.path.join(media_dir, name), 'rb') as f:
+                return name, f.read()
+    raise SystemExit(f'No sample images found in {media_dir}')
+
+
+def _post_image(url, name, data):
+    boundary = uuid.uuid4().hex
+    body = (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="{name}"\r\n'
+        f'Content-Type: application/octet-stream\r\n\r\n'
+    ).encode() + data + f'\r\n--{boundary}--\r\n'.encode()
+    request = urllib.request.Request(url, data=body, method='POST', headers={
+        'Content-Type': f'multipart/form-data; boundary={boundary}',
+    })
+    with urllib.request.urlopen(request, timeout=120) as response:
+        return json.loads(response.read())
+
+
+def wait_healthy(url, process, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'Gunicorn exited with code {process.returncode}')
+        try:
+            with urllib.request.urlopen(url, timeout=5) as response:
+                if response.status == 200:
+                    return
+        except OSError:  # refused, reset or timed out while workers boot
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f'Server not healthy after {timeout}s')
+
+
+def measure(workers, port, preload, requests_per_worker, startup_timeout, log):
+    """
+    Run Gunicorn with `workers` workers and sample its memory
+
+    Returns:
+        dict: Master and per-worker RSS/PSS in MB plus totals
+    """
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), PORT=str(port),
+               GUNICORN_PRELOAD=str(preload), DEBUG=os.environ.get('DEBUG', 'True'))
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'PlantLeafDiseasePrediction.wsgi:application',
+         '-c', os.path.join(BASE_DIR, 'gunicorn.conf.py')],
+        cwd=BASE_DIR, env=env, stdout=log, stderr=log,
+    )
+    try:
+        base_url = f'http://127.0.0.1:{port}'
+        wait_healthy(f'{base_url}/health/', process, startup_timeout)
+        # Make sure every worker has been forked before sampling
+        while len(child_pids(process.pid)) < workers:
+            time.sleep(0.2)
+
+        name, data = sample_image()
+        with ThreadPoolExecutor(max_workers=workers * 2) as pool:
+            list(pool.map(lambda _: _post_image(f'{base_url}/api/predict-batch/', name, data),
+                          range(workers * requests_per_worker)))
+        time.sleep(1.0)
+
+        worker_pids = child_pids(process.pid)
+        per_worker = [{'pid': pid, 'rss_mb': rss_mb(pid), 'pss_mb': pss_mb(pid)} for pid in worker_pids]
+        master = {'pid': process.pid, 'rss_mb': rss_mb(process.pid), 'pss_mb': pss_mb(process.pid)}
+        processes = [master] + per_worker
+        return {
+            'workers': workers,
+            'preload': preload,
+            'master': master,
+            'per_worker': per_worker,
+            'total_rss_mb': sum(p['rss_mb'] or 0.0 for p in processes),
+            'total_pss_mb': sum(p['pss_mb'] or 0.0 for p in processes),
+        }
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=60)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--max-workers', type=int, default=4)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--requests-per-worker', type=int, default=4)
+    parser.add_argument('--startup-timeout', type=float, default=600.0)
+    parser.add_argument('--compare-preload', action='store_true',
+                        help='Also measure GUNICORN_PRELOAD=False (every worker loads its own model)')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    args = parser.parse_args()
+
+    modes = [True, False] if args.compare_preload else [True]
+    results = []
+    with open(os.devnull, 'w') as log:
+        for preload in modes:
+            for workers in range(1, args.max_workers + 1):
+                results.append(measure(workers, args.port, preload, args.requests_per_worker,
+                                       args.startup_timeout, log))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"backend={os.environ.get('INFERENCE_BACKEND', 'keras')}")
+    print(f"{'preload':<9}{'workers':>8}{'master RSS':>12}{'master PSS':>12}"
+          f"{'worker RSS':>12}{'worker PSS':>12}{'total RSS':>11}{'total PSS':>11}")
+    for r in results:
+        worker_rss = sum(w['rss_mb'] or 0.0 for w in r['per_worker']) / max(1, len(r['per_worker']))
+        worker_pss = sum(w['pss_mb'] or 0.0 for w in r['per_worker']) / max(1, len(r['per_worker']))
+        print(f"{str(r['preload']):<9}{r['workers']:>8}{r['master']['rss_mb'] or 0.0:>12.1f}"
+              f"{r['master']['pss_mb'] or 0.0:>12.1f}{worker_rss:>12.1f}{worker_pss:>12.1f}"
+              f"{r['total_rss_mb']:>11.1f}{r['total_pss_mb']:>11.1f}")
+    print('worker RSS/PSS are per-worker means; total = master + all workers')
+
+
+if __name__ == '__main__':
+    main()